@@ -3,7 +3,21 @@ from ._req_resp import Request, Response
 from ._api import SpanAPI
 from ._schema_info import LoadOptions, DumpOptions
 from ._route import SpanRoute
-from ._openapi import DocInfo, DocRespInfo, ParamInfo, ParamTypes
+from ._logging import ErrorLogPolicy, SlowRequestPolicy
+from ._profiling import ProfilingPolicy
+from ._memory import MemoryTracingPolicy, MemoryStats, AllocationSite
+from ._loop_lag import LoopLagPolicy, LoopLagStats, Priority
+from ._prefork import PreforkServer, WorkerStats
+from ._resources import ResourcePool, ResourceStats
+from ._admission import ConcurrencyLimit, AdmissionStats
+from ._errors import ServiceUnavailableError, RequestTimeoutError
+from ._plan import MethodStats
+from ._batch import SubRequest, SubResponse
+from ._micro_batch import MicroBatchCall, MicroBatchStats
+from ._timing import LatencyHistogram
+from ._load import LoadGenerator, LoadRequest, LoadReport, RouteLoad
+from ._asgi import Lifespan
+from ._doc_info import DocInfo, DocRespInfo, ParamInfo, ParamTypes
 
 import spantools.errors_api as errors_api
 from spantools import (
@@ -23,6 +37,34 @@ from spantools import MimeType, MimeTypeTolerant
     __version__,
     SpanAPI,
     SpanRoute,
+    ErrorLogPolicy,
+    SlowRequestPolicy,
+    ProfilingPolicy,
+    MemoryTracingPolicy,
+    MemoryStats,
+    AllocationSite,
+    LoopLagPolicy,
+    LoopLagStats,
+    Priority,
+    PreforkServer,
+    WorkerStats,
+    ResourcePool,
+    ResourceStats,
+    ConcurrencyLimit,
+    AdmissionStats,
+    ServiceUnavailableError,
+    RequestTimeoutError,
+    MethodStats,
+    SubRequest,
+    SubResponse,
+    MicroBatchCall,
+    MicroBatchStats,
+    LatencyHistogram,
+    LoadGenerator,
+    LoadRequest,
+    LoadReport,
+    RouteLoad,
+    Lifespan,
     LoadOptions,
     DumpOptions,
     Error,
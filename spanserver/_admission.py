@@ -0,0 +1,133 @@
+import asyncio
+import collections
+from dataclasses import dataclass
+from typing import Deque, Optional
+
+from ._errors import ServiceUnavailableError
+
+
+@dataclass(frozen=True)
+class ConcurrencyLimit:
+    """Admission settings for a route method or a whole :class:`SpanAPI`."""
+
+    max_in_flight: int
+    """Requests allowed to run at once."""
+    max_queue: int = 0
+    """Requests allowed to wait for a free slot. Others are shed right away."""
+    queue_timeout: Optional[float] = None
+    """Seconds a request may wait in the queue. ``None`` waits forever."""
+    retry_after: int = 1
+    """Seconds sent in the ``Retry-After`` header of shed requests."""
+
+
+@dataclass
+class AdmissionStats:
+    """Gauges and counters of an :class:`AdmissionGate`."""
+
+    in_flight: int = 0
+    """Requests currently running."""
+    queued: int = 0
+    """Requests currently waiting for a slot."""
+    peak_in_flight: int = 0
+    """Most requests running at once."""
+    peak_queued: int = 0
+    """Most requests waiting at once."""
+    admitted: int = 0
+    """Total requests admitted."""
+    shed: int = 0
+    """Total requests shed because the queue was full or timed out."""
+    timed_out: int = 0
+    """Requests shed after waiting ``queue_timeout``. Included in ``shed``."""
+
+
+class AdmissionGate:
+    """
+    Limits how many requests run at once. Requests over the limit wait in a bounded
+    FIFO queue, and are shed with :class:`ServiceUnavailableError` when the queue is
+    full or they have waited too long.
+    """
+
+    def __init__(self, limit: ConcurrencyLimit, name: str = "server") -> None:
+        if limit.max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+
+        self.limit: ConcurrencyLimit = limit
+        self.name: str = name
+        self.stats: AdmissionStats = AdmissionStats()
+        self._waiters: Deque["asyncio.Future[None]"] = collections.deque()
+
+    async def acquire(self) -> None:
+        """
+        Wait for a slot.
+
+        :raises ServiceUnavailableError: If the request is shed.
+        """
+        stats = self.stats
+        limit = self.limit
+
+        if stats.in_flight < limit.max_in_flight and not self._waiters:
+            self._admit()
+            return
+
+        if len(self._waiters) >= limit.max_queue:
+            self._shed()
+
+        waiter: "asyncio.Future[None]" = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        stats.queued += 1
+        stats.peak_queued = max(stats.peak_queued, stats.queued)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), limit.queue_timeout)
+        except asyncio.TimeoutError:
+            if not self._withdraw(waiter):
+                return
+            stats.timed_out += 1
+            self._shed()
+        except BaseException:
+            if not self._withdraw(waiter):
+                self.release()
+            raise
+        finally:
+            stats.queued -= 1
+
+    def release(self) -> None:
+        """Free a slot, handing it straight to the next queued request if any."""
+        stats = self.stats
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes to the waiter, so in_flight does not change.
+                stats.admitted += 1
+                waiter.set_result(None)
+                return
+
+        stats.in_flight -= 1
+
+    def _admit(self) -> None:
+        stats = self.stats
+        stats.in_flight += 1
+        stats.admitted += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+
+    def _withdraw(self, waiter: "asyncio.Future[None]") -> bool:
+        """
+        Remove ``waiter`` from the queue. Returns ``False`` if it was handed a slot
+        before it could be removed.
+        """
+        if waiter.done():
+            return False
+
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        return True
+
+    def _shed(self) -> None:
+        self.stats.shed += 1
+        raise ServiceUnavailableError(
+            f"{self.name} is at capacity, retry later",
+            retry_after=self.limit.retry_after,
+        )
@@ -1,6 +1,3 @@
-import functools
-import urllib.parse
-import math
 import responder
 import subprocess
 import copy
@@ -15,16 +12,16 @@ from typing import (
     Callable,
     TypeVar,
     Dict,
+    Set,
+    Hashable,
     cast,
 )
 from marshmallow import Schema, fields
-from grahamcracker import URLStr
+from starlette.middleware.gzip import GZipMiddleware
 
 from spantools import (
     MimeType,
     MimeTypeTolerant,
-    PagingReq,
-    PagingResp,
     DEFAULT_ENCODERS,
     DEFAULT_DECODERS,
     DecoderType,
@@ -32,19 +29,27 @@ from spantools import (
     DecoderIndexType,
     EncoderIndexType,
 )
-from spantools.errors_api import APILimitError
-
 from ._route import SpanRoute
-from ._req_resp import Request, Response, ProjectionBuilder
-from ._openapi import (
-    reformat_spanroute_docstring,
-    tag_name_from_schema,
-    ParamInfo,
-    ParamTypes,
-    fix_descriptions,
-    OpenAPISchema,
-)
+from ._req_resp import ProjectionBuilder, Request, Response
+from ._doc_info import ParamInfo, ParamTypes, fix_descriptions
+from ._openapi_schema import OpenAPISchema
+from ._gzip import SpanGZipMiddleware
 from ._schema_info import RouteSchemaInfo, LoadOptions, DumpOptions
+from ._logging import ErrorLog, ErrorLogPolicy, SlowRequestLog, SlowRequestPolicy
+from ._resources import (
+    ResourceRegistry,
+    ResourcePool,
+    ResourceFactory,
+    ResourceCloser,
+)
+from ._admission import AdmissionGate, AdmissionStats, ConcurrencyLimit
+from ._plan import MethodStats
+from ._batch import BatchDispatcher, BatchRequestSchema, BatchResponseSchema
+from ._micro_batch import micro_batch_method
+from ._metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_metrics
+from ._profiling import ProfilingPolicy, RequestProfiler
+from ._memory import MemoryTracingPolicy, MemoryTracer, format_memory_report
+from ._loop_lag import LoopLagMonitor, LoopLagPolicy, LoopLagStats, Priority
 
 
 HandlersDictType = Type[Union[Schema, fields.Field]]
@@ -53,6 +58,7 @@ ModelIndex = Tuple[Type, Optional[bool]]
 
 SchemaType = Optional[Union[Schema, Type[Schema], MimeType]]
 SchemaTypeInit = Optional[Union[Schema, MimeType]]
+SchemaShape = Tuple[Optional[Hashable], ...]
 
 
 class _Default:
@@ -76,6 +82,33 @@ PAGED_LIMIT_PARAM = ParamInfo(
 class SpanAPI(responder.API):
     """
     ``responder.API`` extension for data-driven micro-services
+
+    :param error_log_policy: How errors raised by routes are logged. See
+        :class:`ErrorLogPolicy` for defaults.
+    :param openapi_gzip: Pre-compress the cached OpenAPI spec for clients that accept
+        gzip.
+    :param openapi_prebuilt: Path to a spec file generated at build time with
+        ``python -m spanserver openapi build``. The file is served by the openapi
+        route as-is, and route docstrings are never converted to OpenAPI.
+    :param concurrency_limit: Limit on requests running at once across every
+        :class:`SpanRoute`. Requests over the limit wait in its queue or are shed with
+        :class:`ServiceUnavailableError`.
+    :param stage_timing: Time the stages of each :class:`SpanRoute` request into the
+        latency histograms of :func:`SpanAPI.route_stats`.
+    :param server_timing: Send stage timings to clients in a ``Server-Timing`` header.
+        Turns on ``stage_timing``.
+    :param profiling: Which requests to profile, and where to put the profiles. See
+        :class:`ProfilingPolicy`. Off by default.
+    :param slow_requests: Log :class:`SpanRoute` requests slower than a threshold, with
+        their stage timings and payload sizes. See :class:`SlowRequestPolicy`. Off by
+        default.
+    :param memory_tracing: Trace the memory allocated by each :class:`SpanRoute`
+        method with :mod:`tracemalloc`. See :class:`MemoryTracingPolicy`. Off by
+        default.
+    :param loop_lag: Measure event loop lag, and shed :class:`SpanRoute` requests
+        while it is high. See :class:`LoopLagPolicy`. Off by default.
+
+    :raises ValueError: If ``openapi_prebuilt`` is passed without ``openapi``.
     """
 
     def __init__(
@@ -88,11 +121,26 @@ class SpanAPI(responder.API):
         openapi: Optional[str] = None,
         docs_route: Optional[str] = None,
         allowed_hosts: Optional[List[str]] = None,
+        error_log_policy: Optional[ErrorLogPolicy] = None,
+        openapi_gzip: bool = False,
+        openapi_prebuilt: Optional[Union[str, PathLike]] = None,
+        concurrency_limit: Optional[ConcurrencyLimit] = None,
+        stage_timing: bool = True,
+        server_timing: bool = False,
+        profiling: Optional[ProfilingPolicy] = None,
+        memory_tracing: Optional[MemoryTracingPolicy] = None,
+        slow_requests: Optional[SlowRequestPolicy] = None,
+        loop_lag: Optional[LoopLagPolicy] = None,
         **kwargs: Any,
     ):
 
         self.openapi: OpenAPISchema
 
+        # Index of registered route paths. Responder checks for existing routes with a
+        # linear scan, which makes registering thousands of routes quadratic. Set
+        # before responder's init, which registers the docs and schema routes.
+        self._route_paths: Set[str] = set()
+
         super().__init__(
             debug=debug,
             title=title,
@@ -105,9 +153,66 @@ class SpanAPI(responder.API):
             **kwargs,
         )
         self.route_schema_info: Dict[str, RouteSchemaInfo] = dict()
+        if openapi_gzip and hasattr(self, "openapi"):
+            self.openapi.gzip_level = 9
+
+        if openapi_prebuilt is not None:
+            if openapi is None:
+                raise ValueError("openapi version must be set to serve a prebuilt spec")
+            self.openapi.prebuilt_path = openapi_prebuilt
+        self.openapi_prebuilt: Optional[Union[str, PathLike]] = openapi_prebuilt
         self._encoders: DecoderIndexType = copy.copy(DEFAULT_ENCODERS)
         self._decoders: EncoderIndexType = copy.copy(DEFAULT_DECODERS)
 
+        if error_log_policy is None:
+            error_log_policy = ErrorLogPolicy()
+        self.error_log: ErrorLog = ErrorLog(error_log_policy)
+        self.add_event_handler("shutdown", self.error_log.sink.stop)
+
+        self.slow_log: Optional[SlowRequestLog] = None
+        if slow_requests is not None:
+            self.slow_log = SlowRequestLog(slow_requests)
+            self.add_event_handler("shutdown", self.slow_log.sink.stop)
+
+        self.span_routes: List[Type[SpanRoute]] = list()
+        self.span_route_paths: Dict[Type[SpanRoute], str] = dict()
+        self.frozen: bool = False
+
+        self.resources: ResourceRegistry = ResourceRegistry()
+        self.stage_timing: bool = stage_timing or server_timing
+        self.server_timing: bool = server_timing
+        self.profiler: Optional[RequestProfiler] = None
+        if profiling is not None:
+            self.profiler = RequestProfiler(profiling)
+        self.memory_tracer: Optional[MemoryTracer] = None
+        if memory_tracing is not None:
+            self.memory_tracer = MemoryTracer(memory_tracing)
+        self.admission: Optional[AdmissionGate] = None
+        if concurrency_limit is not None:
+            self.admission = AdmissionGate(concurrency_limit)
+        self.loop_monitor: Optional[LoopLagMonitor] = None
+        if loop_lag is not None:
+            self.loop_monitor = LoopLagMonitor(loop_lag)
+            self.add_event_handler("startup", self.loop_monitor.start)
+            self.add_event_handler("shutdown", self.loop_monitor.stop)
+
+        # Routes and schemas waiting on the documentation machinery, which is only
+        # imported once the OpenAPI spec is generated.
+        self._undocumented_routes: List[Type[SpanRoute]] = list()
+        # Ordered set of schema classes whose tags have not been added yet.
+        self._untagged_schemas: Dict[Type[Schema], None] = dict()
+        self._tagged_schemas: Set[Type[Schema]] = set()
+
+        # Next index to try for auto-generated schema names, by name prefix.
+        self._schema_name_counters: Dict[str, int] = dict()
+        # Components already registered for a schema shape, so routes that use the same
+        # schema with the same options share one component.
+        self._schema_names_by_shape: Dict[Tuple[str, SchemaShape], str] = dict()
+        self._schema_shapes_by_name: Dict[str, SchemaShape] = dict()
+        self.add_event_handler("startup", self.compile)
+        self.add_event_handler("startup", self.resources.start)
+        self.add_event_handler("shutdown", self.resources.close)
+
     def add_route(
         self,
         route: str,
@@ -120,23 +225,107 @@ class SpanAPI(responder.API):
         before_request: bool = False,
     ) -> None:
         if isinstance(endpoint, type) and issubclass(endpoint, SpanRoute):
+            if self.frozen:
+                raise RuntimeError(
+                    "cannot add SpanRoute: SpanAPI is frozen. Routes must be added"
+                    " before SpanAPI.compile() runs on startup."
+                )
             endpoint = cast(Type[SpanRoute], endpoint)
-            endpoint.wrap_methods(  # type: ignore
-                decoders=self._decoders, encoders=self._encoders
-            )
+            self._compile_route(endpoint)
+            self.span_routes.append(endpoint)
+            self.span_route_paths[endpoint] = route
+            if self.openapi_prebuilt is None:
+                self._undocumented_routes.append(endpoint)
 
-            reformat_spanroute_docstring(self, endpoint)
+        if not before_request:
+            if check_existing:
+                assert route not in self._route_paths, f"Route '{route}' already exists"
+            self._route_paths.add(route)
 
         super().add_route(
             route=route,
             endpoint=endpoint,
             default=default,
             static=static,
-            check_existing=check_existing,
+            check_existing=False,
             websocket=websocket,
             before_request=before_request,
         )
 
+    def add_middleware(self, middleware_cls: Type, **middleware_config: Any) -> None:
+        if middleware_cls is GZipMiddleware:
+            middleware_cls = SpanGZipMiddleware
+        super().add_middleware(middleware_cls, **middleware_config)
+
+    def compile(self) -> None:
+        """
+        Compiles every :class:`SpanRoute` method into a single execution plan with its
+        path param loaders, schema settings, paging config, codecs and projection
+        builder resolved up-front, then freezes the API so no more routes or mimetypes
+        can be registered.
+
+        Runs automatically on startup. Routes are also compiled when they are added,
+        so requests made before startup (for instance, from a test client used outside
+        of a ``with`` block) are served the same way.
+        """
+        if self.frozen:
+            return
+
+        for route in self.span_routes:
+            self._compile_route(route)
+
+        self.frozen = True
+
+    def reset_after_fork(self) -> None:
+        """
+        Resets the log sinks of the API in a forked child process, which inherits
+        their queues and listener threads from the parent but not the threads
+        themselves. Called by :class:`PreforkServer` in each worker.
+        """
+        self.error_log.sink.reset_after_fork()
+        if self.slow_log is not None:
+            self.slow_log.sink.reset_after_fork()
+
+    def _compile_route(self, route: Type[SpanRoute]) -> None:
+        route.wrap_methods(
+            decoders=self._decoders,
+            encoders=self._encoders,
+            error_log=self.error_log,
+            resources=self.resources,
+            api_gate=self.admission,
+            timing=self.stage_timing,
+            server_timing=self.server_timing,
+            profiler=self.profiler,
+            memory_tracer=self.memory_tracer,
+            slow_log=self.slow_log,
+            lag_monitor=self.loop_monitor,
+        )
+
+    def _document_routes(self) -> None:
+        """
+        Builds the OpenAPI docstrings of routes and tags of schemas added since the
+        last call. Called by :class:`OpenAPISchema` before the spec is generated, so
+        the documentation machinery is not imported until it is needed.
+        """
+        if not self._undocumented_routes and not self._untagged_schemas:
+            return
+
+        from ._openapi import reformat_spanroute_docstring, tag_name_from_schema
+
+        for route in self._undocumented_routes:
+            reformat_spanroute_docstring(self, route)
+        self._undocumented_routes.clear()
+        self.openapi.invalidate()
+
+        for schema_type in self._untagged_schemas:
+            self._tagged_schemas.add(schema_type)
+            tag_name = tag_name_from_schema(schema_type)
+            tag_description = fix_descriptions(schema_type.__doc__)
+
+            if tag_description and not self.openapi.has_tag(tag_name):
+                self.openapi.add_tag({"name": tag_name, "description": tag_description})
+        self._untagged_schemas.clear()
+
     def openapi_save(self, path: Union[str, PathLike]) -> None:
         """Save openapi.yaml file to ``path``"""
         with open(path, "w") as f:
@@ -174,43 +363,47 @@ class SpanAPI(responder.API):
         if not isinstance(schema, Schema):
             return passed_name
 
+        shape = _schema_shape(schema)
+
         if passed_name:
-            self.openapi.add_schema(passed_name, schema)
+            # Re-using an explicit name is allowed as long as the shape matches.
+            if self._schema_shapes_by_name.get(passed_name) != shape:
+                self.openapi.add_schema(passed_name, schema)
+                self._schema_shapes_by_name[passed_name] = shape
             name = passed_name
+        elif (req_resp, shape) in self._schema_names_by_shape:
+            name = self._schema_names_by_shape[(req_resp, shape)]
         else:
             method_name = method.__name__.replace("on_", "").title()
             schema_name = schema.__class__.__name__.replace("Schema", "")
+            prefix = f"{schema_name}{method_name}{req_resp}"
 
-            i = 1
-            while True:
-                name = f"{schema_name}{method_name}{req_resp}{i}"
-                try:
-                    self.openapi.add_schema(name, schema)
-                except AssertionError:
-                    i += 1
-                else:
-                    break
+            # Start from the last index handed out for this prefix. Explicit names can
+            # still take an index, so we skip any that are already registered.
+            i = self._schema_name_counters.get(prefix, 1)
+            name = f"{prefix}{i}"
+            while name in self.openapi.schemas:
+                i += 1
+                name = f"{prefix}{i}"
+            self._schema_name_counters[prefix] = i + 1
 
-        schema_type = schema.__class__
-        tag_name = tag_name_from_schema(schema_type)
-        tag_description = fix_descriptions(schema_type.__doc__)
+            self.openapi.add_schema(name, schema)
+            self._schema_names_by_shape[(req_resp, shape)] = name
+            self._schema_shapes_by_name[name] = shape
 
-        if tag_description:
-            tag_info = {"name": tag_name, "description": tag_description}
-            if not any(t["name"] == tag_name for t in self.openapi.tags):
-                self.openapi.tags.append(tag_info)
+        schema_type = schema.__class__
+        if self.openapi_prebuilt is None and schema_type not in self._tagged_schemas:
+            self._untagged_schemas[schema_type] = None
 
         return name
 
     def _save_schema_info(
         self, endpoint_method: Callable, schema_info: RouteSchemaInfo
     ) -> None:
-        key = repr(endpoint_method).split(" ")[1]
-        self.route_schema_info[key] = schema_info
+        self.route_schema_info[endpoint_method.__qualname__] = schema_info
 
     def method_schema_info(self, endpoint_method: Callable) -> RouteSchemaInfo:
-        key = repr(endpoint_method).split(" ")[1]
-        return self.route_schema_info[key]
+        return self.route_schema_info[endpoint_method.__qualname__]
 
     def use_schema(
         self,
@@ -221,6 +414,7 @@ class SpanAPI(responder.API):
         resp: SchemaType = None,
         resp_name: Optional[str] = None,
         resp_dump: DumpOptions = DumpOptions.DUMP_ONLY,
+        timeout: Optional[float] = None,
     ) -> Callable:
         """
         Decorator for :class:`SpanRoute` methods to automatically validate incoming
@@ -257,12 +451,20 @@ class SpanAPI(responder.API):
             - **IGNORE**: Uses ``resp`` schema for documentation, but does nothing with
               outgoing data at runtime -- default responder behavior.
 
+        :param timeout: seconds the route method may run before it is cancelled and
+            :class:`RequestTimeoutError` is returned. Clients can shorten, but not
+            extend, the deadline with a ``request-timeout`` header. Can also be set
+            with the ``timeout`` of the method's :class:`DocInfo`.
+
         A ``data`` param can be added to the decorated method which data from
         ``req.media()`` will be passed into based on the ``req_load`` option above.
 
         Using ``spanreed.flag.TEXT`` as the response or request schema indicates that
         data will be loaded or sent back from req.text rather than req.media, and
         openapi documentation will be tweaked accordingly.
+
+        Schemas with the same class and options share one openapi component unless
+        ``req_name`` or ``resp_name`` is passed.
         """
         schema_req = _init_schema(req)
         schema_resp = _init_schema(resp)
@@ -292,36 +494,17 @@ class SpanAPI(responder.API):
                 _resp=schema_resp,
                 resp_name=resp_name_api,
                 resp_dump=resp_dump,
+                timeout=timeout,
             )
 
-            @functools.wraps(route_method)
-            async def wrapper(
-                # Since we are wrapping class functions, "self" needs to be the first
-                # parameter
-                route: SpanRoute,
-                http_req: Request,
-                http_resp: Response,
-                **kwargs: Any,
-            ) -> None:
-
-                # validate the incoming data if a model was provided.
-                http_req._schema = schema_options.req_schema
-                http_req._load_options = schema_options.req_load
-
-                http_resp._schema = schema_options.resp_schema
-                http_resp._dump_options = schema_options.resp_dump
-                http_resp._projection_builder = projection_builder
-                # await schema_options.load_req(http_req)
-
-                # pass loaded data into the actual route method if applicable. Await the
-                # response.
-                await route_method(route, http_req, http_resp, **kwargs)
-                # validate / dump response data.
-                # schema_options.dump_response(http_resp=http_resp, http_req=http_req)
-
             self._save_schema_info(route_method, schema_options)
 
-            return wrapper
+            # Settings are compiled into the method's execution plan when its route is
+            # added to the API.
+            route_method.schema_info = schema_options  # type: ignore
+            route_method.projection_builder = projection_builder  # type: ignore
+
+            return route_method
 
         return decorator
 
@@ -346,30 +529,304 @@ class SpanAPI(responder.API):
         """
 
         def decorator(route_method: Callable) -> Callable:
-            @functools.wraps(route_method)
-            async def wrapper(
-                inst: Callable, req: Request, resp: Response, **kwargs: Any
-            ) -> None:
+            # Settings are compiled into the method's execution plan when its route is
+            # added to the API.
+            route_method.paged = True  # type: ignore
+            route_method.paged_limit = limit  # type: ignore
+            route_method.paged_offset = default_offset  # type: ignore
 
-                paging_req = PagingReq.from_params(
-                    req.params, default_offset=default_offset, default_limit=limit
-                )
-                paging_resp: PagingResp = _set_up_paging_resp(req, app_limit=limit)
-                req._paging = paging_req
-                resp._paging = paging_resp
-                await route_method(inst, req, resp, **kwargs)
-                _adjust_paging_totals(paging_resp)
+            return route_method
 
-                paging_resp.to_headers(resp.headers)
+        return decorator
 
-            wrapper.paged = True  # type: ignore
-            wrapper.paged_limit = limit  # type: ignore
-            wrapper.paged_offset = default_offset  # type: ignore
+    @staticmethod
+    def limit_concurrency(
+        max_in_flight: int,
+        *,
+        max_queue: int = 0,
+        queue_timeout: Optional[float] = None,
+        retry_after: int = 1,
+    ) -> Callable:
+        """
+        Decorator to limit how many requests a :class:`SpanRoute` method runs at once.
+
+        :param max_in_flight: requests allowed to run at once.
+        :param max_queue: requests allowed to wait for a free slot.
+        :param queue_timeout: seconds a request waits for a slot. ``None`` waits
+            forever.
+        :param retry_after: seconds sent to shed clients in the ``Retry-After`` header.
+
+        Requests over the limit wait in a FIFO queue. When the queue is full or a
+        request times out waiting, it is shed with a 503 and a ``Retry-After`` header.
+        Limits are checked before the API-wide ``concurrency_limit``.
+
+        :raises ServiceUnavailableError: If a request is shed.
+        """
+        limit = ConcurrencyLimit(
+            max_in_flight=max_in_flight,
+            max_queue=max_queue,
+            queue_timeout=queue_timeout,
+            retry_after=retry_after,
+        )
+
+        def decorator(route_method: Callable) -> Callable:
+            route_method.admission_gate = AdmissionGate(  # type: ignore
+                limit, name=route_method.__qualname__
+            )
+            return route_method
+
+        return decorator
+
+    @staticmethod
+    def priority(priority: Priority) -> Callable:
+        """
+        Decorator to set the :class:`Priority` of a :class:`SpanRoute` method when
+        requests are shed for event loop lag. Methods are :attr:`Priority.NORMAL` by
+        default. Give health checks and cheap routes :attr:`Priority.HIGH` so they keep
+        being served while the loop lags.
+        """
+
+        def decorator(route_method: Callable) -> Callable:
+            route_method.shed_priority = priority  # type: ignore
+            return route_method
+
+        return decorator
+
+    @staticmethod
+    def single_flight(route_method: Callable) -> Callable:
+        """
+        Decorator to coalesce concurrent identical GET requests to a :class:`SpanRoute`
+        method into one execution.
+
+        Requests are identical when their path params, query params (including paging
+        and projection) and ``Accept`` header match. Requests that arrive while an
+        identical one is running wait for it, and are sent the same status, headers and
+        encoded body. The response must not depend on anything else about the request,
+        like auth headers.
+
+        :raises ValueError: When the route is added, if the decorated method is not
+            ``on_get``.
+        """
+        route_method.single_flight = True  # type: ignore
+        return route_method
+
+    @staticmethod
+    def micro_batch(*, max_size: int = 64, window: float = 0.002) -> Callable:
+        """
+        Decorator to merge concurrent requests to a :class:`SpanRoute` method into one
+        call of a batched handler.
+
+        :param max_size: most requests in a batch. A full batch runs right away.
+        :param window: seconds to wait for more requests after the first request of a
+            batch arrives.
+
+        The decorated method is called with a list of :class:`MicroBatchCall`, one for
+        each request. Each keyword-only param is passed a list of that path param's
+        values, in the same order. Annotate them as ``List[<type>]``: values are loaded
+        per request with ``<type>``.
+
+        The method may return a list of results in the same order, which are set as
+        the ``media`` of each response, or set each ``call.resp`` itself and return
+        ``None``. An exception in the results is raised for that request only. An
+        exception raised by the method is raised for every request in the batch.
+
+        .. code-block:: python
+
+            @api.route("/items/{item_id}")
+            class Items(SpanRoute):
+                @api.use_schema(resp=ItemSchema())
+                @api.micro_batch(max_size=100)
+                async def on_get(
+                    self, calls: List[MicroBatchCall], *, item_id: List[int]
+                ) -> List[Any]:
+                    found = await db.items.find({"_id": {"$in": item_id}})
+                    by_id = {item["_id"]: item for item in found}
+                    return [
+                        by_id.get(i, errors_api.NothingToReturnError("not found"))
+                        for i in item_id
+                    ]
+
+        The method is bound to the route instance of the first request in the batch.
+        Batch counters are on the ``micro_batcher.stats`` attribute of the route
+        method.
+        """
 
-            return wrapper
+        def decorator(handler: Callable) -> Callable:
+            return micro_batch_method(handler, max_size=max_size, window=window)
 
         return decorator
 
+    def concurrency_stats(self) -> Dict[str, AdmissionStats]:
+        """
+        In-flight and queued gauges for each concurrency limit, by route method
+        qualname. The API-wide limit is under ``'server'``.
+        """
+        stats: Dict[str, AdmissionStats] = dict()
+        for route in self.span_routes:
+            for plan in route._plans.values():
+                for gate in plan.gates:
+                    stats[gate.name] = gate.stats
+
+        if self.admission is not None:
+            stats[self.admission.name] = self.admission.stats
+
+        return stats
+
+    def route_stats(self) -> Dict[str, MethodStats]:
+        """
+        Counters and stage latency histograms for each :class:`SpanRoute` method, by
+        qualname.
+        """
+        return {
+            plan.name: plan.stats
+            for route in self.span_routes
+            for plan in route._plans.values()
+        }
+
+    def loop_lag_stats(self) -> LoopLagStats:
+        """
+        Event loop lag measured since the API started.
+
+        :raises ValueError: If lag is not measured.
+        """
+        if self.loop_monitor is None:
+            raise ValueError("loop lag is not measured: pass loop_lag to SpanAPI")
+        return self.loop_monitor.stats
+
+    def memory_report(self, top_sites: Optional[int] = None) -> str:
+        """
+        Text report of the allocations traced for each :class:`SpanRoute` method, with
+        the sites that retained the most memory in sampled requests. ``top_sites``
+        defaults to the :class:`MemoryTracingPolicy` setting.
+
+        :raises ValueError: If memory tracing is off.
+        """
+        if self.memory_tracer is None:
+            raise ValueError("memory tracing is off: pass memory_tracing to SpanAPI")
+
+        if top_sites is None:
+            top_sites = self.memory_tracer.policy.top_sites
+
+        stats = {name: method.memory for name, method in self.route_stats().items()}
+        return format_memory_report(stats, top_sites)
+
+    def add_resource(
+        self,
+        resource_type: type,
+        factory: ResourceFactory,
+        *,
+        size: Optional[int] = None,
+        close: Optional[ResourceCloser] = None,
+    ) -> ResourcePool:
+        """
+        Registers a resource, like a database client or http session, that is created
+        on startup, closed on shutdown, and passed to :class:`SpanRoute` methods.
+
+        :param resource_type: type route methods annotate a keyword-only param with to
+            receive the resource.
+        :param factory: function or coroutine function that creates an instance.
+        :param size: number of instances to pool. Each request checks out its own
+            instance for the duration of the route method. ``None`` creates a single
+            instance shared by all requests.
+        :param close: function or coroutine function called with each instance on
+            shutdown.
+        :return: the resource's pool. Usage counters are on its ``stats`` attribute.
+
+        :raises RuntimeError: If the API has been frozen by :func:`SpanAPI.compile`.
+        :raises ValueError: If ``resource_type`` is already registered.
+
+        .. code-block:: python
+
+            api.add_resource(
+                aiohttp.ClientSession, aiohttp.ClientSession, close=lambda s: s.close()
+            )
+
+            @api.route("/weather")
+            class Weather(SpanRoute):
+                async def on_get(
+                    self, req: Request, resp: Response, *, http: aiohttp.ClientSession
+                ):
+                    ...
+        """
+        if self.frozen:
+            raise RuntimeError("cannot add resource: SpanAPI is frozen.")
+
+        return self.resources.add(resource_type, factory, size=size, close=close)
+
+    def add_batch_route(
+        self, route: str = "/batch", *, max_items: int = 100, max_concurrency: int = 8,
+    ) -> Type[SpanRoute]:
+        """
+        Adds a route that runs a list of sub-requests in one round trip.
+
+        :param route: path of the batch route.
+        :param max_items: most sub-requests a batch may contain.
+        :param max_concurrency: most sub-requests of a batch run at once.
+        :return: the batch :class:`SpanRoute`.
+
+        Clients ``POST`` a JSON, YAML or BSON document with a ``requests`` list of
+        :class:`SubRequest` objects. Each sub-request is dispatched in-process through
+        the API's middleware to the matching route, with the same schema validation,
+        concurrency limits and error headers as a standalone request. The response has
+        a ``responses`` list of :class:`SubResponse` objects in the same order, encoded
+        with the mimetype negotiated for the batch.
+
+        .. code-block:: python
+
+            {
+                "requests": [
+                    {"path": "/items/1"},
+                    {"path": "/items", "params": {"paging-limit": "10"}},
+                    {"method": "POST", "path": "/items", "body": {"name": "new"}},
+                ]
+            }
+
+        :raises APILimitError: If a batch holds more than ``max_items`` sub-requests.
+        :raises RequestValidationError: If a sub-request calls the batch route.
+        """
+        dispatcher = BatchDispatcher(
+            self, route, max_items=max_items, max_concurrency=max_concurrency
+        )
+
+        class Batch(SpanRoute):
+            @self.use_schema(
+                req=BatchRequestSchema(),
+                req_name="BatchRequest",
+                resp=BatchResponseSchema(),
+                resp_name="BatchResponse",
+            )
+            async def on_post(self, req: Request, resp: Response) -> None:
+                batch: Dict[str, Any] = await req.media_loaded()  # type: ignore
+                responses = await dispatcher.dispatch(req, batch["requests"])
+                resp.media = {"responses": responses}  # type: ignore
+
+        self.add_route(route, Batch)
+        return Batch
+
+    def add_metrics_route(self, route: str = "/metrics") -> None:
+        """
+        Adds a route that serves the API's counters in the Prometheus text format:
+
+        - request counts by route, method, status and api error code.
+        - request latency histograms by stage, see :class:`LatencyHistogram`.
+        - request and response body size histograms.
+        - in-flight gauges, timeouts and coalesced requests by route.
+        - in-flight, queued and shed counts of concurrency limits.
+        - resource checkouts and waits.
+        - projection schema cache hits, misses and size.
+
+        Counters are plain integers updated on the event loop, so they cost nothing to
+        lock. Each :class:`PreforkServer` worker keeps and serves its own counters.
+
+        :param route: path of the metrics route.
+        """
+
+        async def metrics(req: Request, resp: Response) -> None:
+            resp.headers["Content-Type"] = METRICS_CONTENT_TYPE
+            resp.content = render_metrics(self).encode()
+
+        self.add_route(route, metrics)
+
     def register_mimetype(
         self, mimetype: MimeTypeTolerant, encoder: EncoderType, decoder: DecoderType
     ) -> None:
@@ -380,7 +837,12 @@ class SpanAPI(responder.API):
         :param encoder: Encodes mimetype data to binary.
         :param decoder: Decodes mimetype data to binary.
         :return:
+
+        :raises RuntimeError: If the API has been frozen by :func:`SpanAPI.compile`.
         """
+        if self.frozen:
+            raise RuntimeError("cannot register mimetype: SpanAPI is frozen.")
+
         try:
             mimetype = MimeType.from_name(mimetype)
         except ValueError:
@@ -390,65 +852,29 @@ class SpanAPI(responder.API):
         self._decoders[mimetype] = decoder
 
 
-def _init_schema(schema: SchemaType) -> Optional[Union[Schema, MimeType]]:
-    if isinstance(schema, type) and issubclass(schema, Schema):
-        schema = schema()
-    return schema
-
-
-def _replace_paging_info(url: URLStr, offset: int, limit: int) -> URLStr:
-    params = {"paging-offset": str(offset), "paging-limit": str(limit)}
+def _option_key(value: Any) -> Optional[Hashable]:
+    if value is None or isinstance(value, bool):
+        return value
+    return frozenset(value)
 
-    url_parts = list(urllib.parse.urlparse(url))
-    query = dict(urllib.parse.parse_qsl(url_parts[4]))
-    query.update(params)
 
-    url_parts[4] = urllib.parse.urlencode(query)
-
-    return urllib.parse.urlunparse(url_parts)
-
-
-def _set_up_paging_resp(req: Request, app_limit: int) -> PagingResp:
-    """Sets up paging info based on request."""
-    offset = int(req.params.get("paging-offset", 0))
-    user_limit = int(req.params.get("paging-limit", app_limit))
-
-    if user_limit > app_limit:
-        raise APILimitError(
-            f"item limit for {req.method} {req.full_url} is {app_limit}."
-            f" {user_limit} requested."
-        )
-
-    next_url = _replace_paging_info(
-        req.full_url, offset=offset + user_limit, limit=user_limit
-    )
-    if offset - user_limit >= 0:
-        previous_url = _replace_paging_info(
-            req.full_url, offset=offset - user_limit, limit=user_limit
-        )
-    else:
-        previous_url = None
-
-    current = math.floor(offset / user_limit) + 1
-
-    paging = PagingResp(
-        previous=previous_url,
-        next=next_url,
-        current_page=current,
-        offset=offset,
-        limit=user_limit,
-        total_items=None,
-        total_pages=None,
+def _schema_shape(schema: Schema) -> SchemaShape:
+    """
+    Key for the OpenAPI component a schema instance produces: its class plus the
+    options that change which fields are documented and how.
+    """
+    return (
+        type(schema),
+        _option_key(schema.only),
+        _option_key(schema.exclude),
+        schema.many,
+        _option_key(schema.partial),
+        _option_key(schema.load_only),
+        _option_key(schema.dump_only),
     )
-    return paging
 
 
-def _adjust_paging_totals(paging: PagingResp) -> None:
-    """
-    Adjusts total pages based on total items supplied by route. Removes url to next page
-    if necessary.
-    """
-    if paging.total_items is not None:
-        if paging.offset + paging.limit >= paging.total_items:
-            paging.next = None
-        paging.total_pages = math.ceil(paging.total_items / paging.limit)
+def _init_schema(schema: SchemaType) -> Optional[Union[Schema, MimeType]]:
+    if isinstance(schema, type) and issubclass(schema, Schema):
+        schema = schema()
+    return schema
@@ -0,0 +1,210 @@
+import asyncio
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Type
+
+from spantools import MimeTypeTolerant, EncoderIndexType, encode_content
+
+
+Scope = Dict[str, Any]
+Message = Dict[str, Any]
+RawHeaders = List[Tuple[bytes, bytes]]
+ASGIApp = Callable[
+    [Scope, Callable[[], Awaitable[Message]], Callable[[Message], Awaitable[None]]],
+    Awaitable[None],
+]
+
+
+def encode_body(
+    body: Any,
+    mimetype: MimeTypeTolerant,
+    headers: Dict[str, str],
+    encoders: EncoderIndexType,
+) -> bytes:
+    """
+    Encode the body of an in-process request. ``bytes`` are sent as-is and ``str`` as
+    text. Anything else is encoded with the mimetype of the ``content-type`` header in
+    ``headers``, or ``mimetype`` if there is none. Encoders may add headers.
+
+    :raises ContentEncodeError: If the body cannot be encoded.
+    :raises ContentTypeUnknownError: If there is no encoder for the mimetype.
+    """
+    if body is None:
+        return b""
+    if isinstance(body, bytes):
+        return body
+    if isinstance(body, str):
+        headers.setdefault("content-type", "text/plain")
+        return body.encode()
+
+    content_type = headers.get("content-type")
+    if content_type is not None:
+        mimetype = content_type
+    return encode_content(
+        content=body, mimetype=mimetype, headers=headers, encoders=encoders
+    )
+
+
+def raw_headers(headers: Dict[str, str], body: bytes) -> RawHeaders:
+    """Lower-cased headers of an ASGI scope, with the ``content-length`` of ``body``."""
+    # Encoders may have added headers that are not lower-case.
+    raw = [
+        (key.lower().encode("latin-1"), value.encode("latin-1"))
+        for key, value in headers.items()
+        if key.lower() != "content-length"
+    ]
+    raw.append((b"content-length", str(len(body)).encode()))
+    return raw
+
+
+def http_scope(
+    method: str,
+    path: str,
+    query_string: bytes,
+    headers: RawHeaders,
+    *,
+    scheme: str = "http",
+    http_version: str = "1.1",
+    root_path: str = "",
+    server: Optional[Tuple[str, int]] = ("testserver", 80),
+    client: Optional[Tuple[str, int]] = ("testclient", 50000),
+) -> Scope:
+    """Scope of an in-process http request."""
+    return {
+        "type": "http",
+        "http_version": http_version,
+        "method": method.upper(),
+        "scheme": scheme,
+        "root_path": root_path,
+        "path": path,
+        "query_string": query_string,
+        "headers": headers,
+        "server": server,
+        "client": client,
+    }
+
+
+@dataclass
+class ASGIResponse:
+    """Response sent by an app to :func:`call_app`."""
+
+    status: int
+    """Http status code."""
+    headers: List[Tuple[str, str]]
+    """Response headers in the order they were sent."""
+    body: bytes
+    """Response body."""
+
+
+async def call_app(app: ASGIApp, scope: Scope, body: bytes) -> ASGIResponse:
+    """
+    Send one request with ``body`` to ``app``, in-process, and collect its response.
+    Exceptions raised by the app are passed through.
+
+    :raises RuntimeError: If the app returned without starting a response.
+    """
+    start: Optional[Message] = None
+    chunks: List[bytes] = list()
+    request_sent = False
+    response_done = asyncio.Event()
+
+    async def receive() -> Message:
+        nonlocal request_sent
+        if request_sent:
+            await response_done.wait()
+            return {"type": "http.disconnect"}
+
+        request_sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message: Message) -> None:
+        nonlocal start
+        if message["type"] == "http.response.start":
+            start = message
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_done.set()
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        response_done.set()
+
+    if start is None:
+        raise RuntimeError("app did not send a response")
+
+    return ASGIResponse(
+        status=start["status"],
+        headers=[
+            (key.decode("latin-1"), value.decode("latin-1"))
+            for key, value in start.get("headers", [])
+        ],
+        body=b"".join(chunks),
+    )
+
+
+class Lifespan:
+    """
+    Runs the startup and shutdown handlers of an ASGI app through the lifespan
+    protocol, the way a server does. Can be used as an async context manager.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app: ASGIApp = app
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def __aenter__(self) -> "Lifespan":
+        await self.startup()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        await self.shutdown()
+
+    async def startup(self) -> None:
+        """
+        Run the app's startup handlers.
+
+        :raises RuntimeError: If a startup handler fails.
+        """
+        # Queues are made here so they belong to the loop the app runs on.
+        self._receive: "asyncio.Queue[Message]" = asyncio.Queue()
+        self._send: "asyncio.Queue[Message]" = asyncio.Queue()
+        task = asyncio.get_event_loop().create_task(
+            self.app({"type": "lifespan"}, self._receive.get, self._send.put)
+        )
+        self._task = task
+
+        message = await self._message(task, {"type": "lifespan.startup"})
+        if message["type"] == "lifespan.startup.failed":
+            await asyncio.gather(task, return_exceptions=True)
+            self._task = None
+            raise RuntimeError(f"app startup failed:\n{message.get('message', '')}")
+
+    async def shutdown(self) -> None:
+        """Run the app's shutdown handlers. Does nothing if not started."""
+        task = self._task
+        if task is None:
+            return
+
+        self._task = None
+        await self._message(task, {"type": "lifespan.shutdown"})
+        await task
+
+    async def _message(self, task: "asyncio.Task[None]", message: Message) -> Message:
+        await self._receive.put(message)
+        reply = asyncio.get_event_loop().create_task(self._send.get())
+        waiting: Set["asyncio.Future[Any]"] = {task, reply}
+        await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+        if reply.done():
+            return reply.result()
+
+        # The app finished without replying, so surface its error.
+        reply.cancel()
+        task.result()
+        raise RuntimeError("app lifespan ended without replying")
@@ -0,0 +1,183 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlencode
+
+import marshmallow
+from marshmallow import Schema, fields, post_load
+
+from spantools import MimeType, MimeTypeTolerant, decode_content
+from spantools import ContentDecodeError, ContentEncodeError, ContentTypeUnknownError
+from spantools.errors_api import APILimitError, RequestValidationError
+
+from ._req_resp import Request
+from ._asgi import Scope, call_app, encode_body, http_scope, raw_headers
+
+
+DECODABLE_MIMETYPES = (MimeType.JSON, MimeType.YAML, MimeType.BSON)
+
+
+@dataclass
+class SubRequest:
+    """One request in a batch."""
+
+    path: str
+    """Path of the route to call, like ``'/items/1'``."""
+    method: str = "GET"
+    """Http method."""
+    params: Dict[str, str] = field(default_factory=dict)
+    """Query params."""
+    headers: Dict[str, str] = field(default_factory=dict)
+    """Request headers."""
+    body: Optional[Any] = None
+    """
+    Request body. Encoded with the batch request's mimetype unless it is a ``str`` or
+    ``bytes``.
+    """
+
+
+@dataclass
+class SubResponse:
+    """Response to one :class:`SubRequest`, in the same position of the batch."""
+
+    status: int
+    """Http status code."""
+    headers: Dict[str, str]
+    """Response headers, including the error headers of failed requests."""
+    body: Optional[Any]
+    """
+    Response body, decoded if it is JSON, YAML or BSON, and as text otherwise.
+    ``None`` if empty.
+    """
+
+
+class SubRequestSchema(Schema):
+    path = fields.Str(required=True)
+    method = fields.Str(missing="GET")
+    params = fields.Dict(keys=fields.Str(), values=fields.Str(), missing=dict)
+    headers = fields.Dict(keys=fields.Str(), values=fields.Str(), missing=dict)
+    body = fields.Raw(missing=None, allow_none=True)
+
+    class Meta:
+        unknown = marshmallow.RAISE
+
+    @post_load
+    def make_sub_request(self, data: Dict[str, Any], **kwargs: Any) -> SubRequest:
+        return SubRequest(**data)
+
+
+class SubResponseSchema(Schema):
+    status = fields.Int(required=True)
+    headers = fields.Dict(keys=fields.Str(), values=fields.Str())
+    body = fields.Raw(allow_none=True)
+
+
+class BatchRequestSchema(Schema):
+    requests = fields.Nested(SubRequestSchema, many=True, required=True)
+
+
+class BatchResponseSchema(Schema):
+    responses = fields.Nested(SubResponseSchema, many=True, required=True)
+
+
+class BatchDispatcher:
+    """
+    Runs the sub-requests of a batch concurrently through the middleware and routes of
+    ``api``, in-process.
+    """
+
+    def __init__(
+        self, api: "SpanAPI", path: str, max_items: int, max_concurrency: int
+    ) -> None:
+        self.api: "SpanAPI" = api
+        self.path: str = path
+        self.max_items: int = max_items
+        self.max_concurrency: int = max_concurrency
+
+    async def dispatch(
+        self, req: Request, sub_requests: List[SubRequest]
+    ) -> List[SubResponse]:
+        """
+        :raises APILimitError: If the batch is larger than ``max_items``.
+        :raises RequestValidationError: If a sub-request calls the batch route.
+        """
+        if len(sub_requests) > self.max_items:
+            raise APILimitError(f"batches are limited to {self.max_items} requests")
+        if any(sub.path.split("?")[0] == self.path for sub in sub_requests):
+            raise RequestValidationError("batch requests cannot be nested")
+
+        mimetype = req.mimetype
+        if mimetype not in DECODABLE_MIMETYPES:
+            mimetype = MimeType.JSON
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(sub: SubRequest) -> SubResponse:
+            async with semaphore:
+                return await self._call(req._starlette.scope, sub, mimetype)
+
+        return list(await asyncio.gather(*(run(sub) for sub in sub_requests)))
+
+    async def _call(
+        self, outer: Scope, sub: SubRequest, mimetype: MimeTypeTolerant
+    ) -> SubResponse:
+        headers = {key.lower(): value for key, value in sub.headers.items()}
+        # Sub-responses are sent inside the batch response, so are not compressed.
+        headers.pop("accept-encoding", None)
+        # Sub-requests are sent to the same host as the batch, so they pass host checks.
+        if "host" not in headers:
+            headers.update(
+                (key.decode("latin-1"), value.decode("latin-1"))
+                for key, value in outer.get("headers", [])
+                if key == b"host"
+            )
+
+        try:
+            body = encode_body(sub.body, mimetype, headers, self.api._encoders)
+        except (ContentEncodeError, ContentTypeUnknownError):
+            raise RequestValidationError("sub-request body could not be encoded")
+
+        scope = http_scope(
+            sub.method,
+            sub.path,
+            urlencode(sub.params).encode(),
+            raw_headers(headers, body),
+            scheme=outer.get("scheme", "http"),
+            http_version=outer.get("http_version", "1.1"),
+            root_path=outer.get("root_path", ""),
+            server=outer.get("server"),
+            client=outer.get("client"),
+        )
+        response = await call_app(self.api.app, scope, body)
+
+        resp_headers = dict(response.headers)
+        return SubResponse(
+            status=response.status,
+            headers=resp_headers,
+            body=self._decode_body(response.body, resp_headers.get("content-type")),
+        )
+
+    def _decode_body(self, content: bytes, content_type: Optional[str]) -> Any:
+        if not content:
+            return None
+
+        try:
+            mimetype = MimeType.from_name(content_type)
+        except ValueError:
+            mimetype = None
+
+        if mimetype in DECODABLE_MIMETYPES:
+            try:
+                decoded, _ = decode_content(
+                    content=content, mimetype=mimetype, decoders=self.api._decoders
+                )
+                return decoded
+            except (ContentDecodeError, ContentTypeUnknownError):
+                pass
+
+        return content.decode(errors="replace")
+
+
+type_helper = False
+if type_helper:
+    from ._api import SpanAPI
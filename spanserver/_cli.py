@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import pathlib
+import sys
+from dataclasses import asdict
+from typing import List, Optional
+
+import yaml
+
+from ._api import SpanAPI
+from ._load import LoadGenerator, LoadRequest
+
+
+def load_api(target: str) -> SpanAPI:
+    """
+    Import a :class:`SpanAPI` from a ``'module:attribute'`` target string, for
+    instance: ``'myservice.api:api'``.
+
+    :raises ValueError: If ``target`` is malformed or does not point to a
+        :class:`SpanAPI`.
+    """
+    module_name, _, attr = target.partition(":")
+    if not module_name or not attr:
+        raise ValueError(f"target must be 'module:attribute', got '{target}'")
+
+    # Allow targets relative to the directory the command is run from, like uvicorn.
+    if "" not in sys.path:
+        sys.path.insert(0, "")
+
+    module = importlib.import_module(module_name)
+    api = getattr(module, attr)
+
+    if not isinstance(api, SpanAPI):
+        raise ValueError(f"'{target}' is not a SpanAPI")
+
+    return api
+
+
+def build_openapi(target: str, output: str) -> pathlib.Path:
+    """
+    Render the OpenAPI spec of ``target`` to ``output``. The spec is written as JSON if
+    ``output`` ends in ``.json``, and as YAML otherwise.
+
+    :raises ValueError: If the api at ``target`` does not have openapi enabled.
+    """
+    api = load_api(target)
+    if not hasattr(api, "openapi"):
+        raise ValueError(f"'{target}' does not have openapi enabled")
+
+    rendered = api.openapi.rendered
+    body = rendered.json if output.endswith(".json") else rendered.yaml
+
+    path = pathlib.Path(output)
+    path.write_bytes(body.content)
+    return path
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m spanserver")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    openapi = commands.add_parser("openapi", help="OpenAPI spec tools.")
+    openapi_commands = openapi.add_subparsers(dest="openapi_command")
+    openapi_commands.required = True
+
+    build = openapi_commands.add_parser(
+        "build", help="Render the OpenAPI spec of an api to a file."
+    )
+    build.add_argument("target", help="Import path of the api, as 'module:attribute'.")
+    build.add_argument(
+        "-o",
+        "--output",
+        default="openapi.yaml",
+        help="File to write. Written as JSON if it ends in '.json'.",
+    )
+
+    serve = commands.add_parser(
+        "serve", help="Serve an api from worker processes forked after warmup."
+    )
+    serve.add_argument("target", help="Import path of the api, as 'module:attribute'.")
+    serve.add_argument("-w", "--workers", type=int, default=2, help="Worker count.")
+    serve.add_argument("--host", default="127.0.0.1", help="Address to bind.")
+    serve.add_argument("--port", type=int, default=8000, help="Port to bind.")
+
+    load = commands.add_parser(
+        "load", help="Send concurrent requests to an api in-process and report latency."
+    )
+    load.add_argument("target", help="Import path of the api, as 'module:attribute'.")
+    load.add_argument(
+        "-r",
+        "--request",
+        action="append",
+        default=[],
+        help="Request to send, as 'METHOD /path'. Can be repeated.",
+    )
+    load.add_argument(
+        "-m",
+        "--mix",
+        help="YAML or JSON file with a list of requests, by LoadRequest field.",
+    )
+    load.add_argument(
+        "-c", "--concurrency", type=int, default=10, help="Requests in flight."
+    )
+    load.add_argument("-n", "--requests", type=int, help="Requests to send.")
+    load.add_argument("-d", "--duration", type=float, help="Seconds to run for.")
+    load.add_argument(
+        "--warmup", type=int, default=0, help="Unmeasured requests sent first."
+    )
+    load.add_argument("--seed", type=int, help="Seed for picking requests.")
+    load.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    return parser
+
+
+def load_mix(requests: List[str], mix_path: Optional[str]) -> List[LoadRequest]:
+    """
+    Build a load mix from ``'METHOD /path'`` strings and a YAML or JSON file listing
+    :class:`LoadRequest` fields.
+
+    :raises ValueError: If a request is malformed.
+    """
+    mix: List[LoadRequest] = list()
+    for request in requests:
+        method, _, path = request.strip().rpartition(" ")
+        mix.append(LoadRequest(path=path, method=method or "GET"))
+
+    if mix_path is not None:
+        try:
+            entries = yaml.safe_load(pathlib.Path(mix_path).read_text())
+            mix.extend(LoadRequest(**entry) for entry in entries)
+        except (OSError, TypeError, yaml.YAMLError) as error:
+            raise ValueError(f"could not load mix from '{mix_path}': {error}")
+
+    return mix
+
+
+def run_load(args: argparse.Namespace) -> str:
+    """Run a :class:`LoadGenerator` from ``load`` command args and format its report."""
+    if args.requests is None and args.duration is None:
+        args.requests = 1000
+
+    generator = LoadGenerator(
+        load_api(args.target),
+        load_mix(args.request, args.mix),
+        concurrency=args.concurrency,
+        requests=args.requests,
+        duration=args.duration,
+        warmup=args.warmup,
+        seed=args.seed,
+    )
+    report = asyncio.get_event_loop().run_until_complete(generator.run())
+
+    if args.json:
+        return json.dumps(asdict(report), indent=2)
+    return report.format()
+
+
+def serve(target: str, workers: int, host: str, port: int) -> None:
+    """Serve ``target`` with a :class:`PreforkServer` until interrupted."""
+    from ._prefork import PreforkServer
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+    api = load_api(target)
+    PreforkServer(api, workers=workers, host=host, port=port).serve_forever()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Entry point for ``python -m spanserver``."""
+    args = _build_parser().parse_args(argv)
+
+    try:
+        if args.command == "openapi" and args.openapi_command == "build":
+            path = build_openapi(args.target, args.output)
+            print(f"wrote OpenAPI spec to '{path}'")
+        elif args.command == "serve":
+            serve(args.target, args.workers, args.host, args.port)
+        elif args.command == "load":
+            print(run_load(args))
+    except (ValueError, ImportError, AttributeError) as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+
+    return 0
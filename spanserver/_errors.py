@@ -0,0 +1,35 @@
+import uuid
+from typing import Optional
+
+from spantools.errors_api import APIError
+
+
+class ServiceUnavailableError(APIError):
+    """Server is at capacity and shed the request. Retry after ``retry-after``."""
+
+    http_code: int = 503
+    api_code: int = 1006
+
+    def __init__(
+        self,
+        message: str,
+        error_data: Optional[dict] = None,
+        error_id: Optional[uuid.UUID] = None,
+        send_media: bool = False,
+        retry_after: Optional[int] = None,
+    ):
+        """
+        :param retry_after: Seconds the client should wait before retrying. Sent in
+            the ``Retry-After`` header.
+        """
+        super().__init__(
+            message, error_data=error_data, error_id=error_id, send_media=send_media
+        )
+        self.retry_after: Optional[int] = retry_after
+
+
+class RequestTimeoutError(APIError):
+    """Route method did not finish before its deadline and was cancelled."""
+
+    http_code: int = 504
+    api_code: int = 1007
@@ -0,0 +1,40 @@
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class _PassThroughGZipResponder(GZipResponder):
+    """
+    Gzips response bodies like starlette's responder, except for responses that
+    already set a ``Content-Encoding`` header, which are sent as-is.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int) -> None:
+        super().__init__(app, minimum_size)
+        self.pass_through = False
+
+    async def send_with_gzip(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message.get("headers", []))
+            self.pass_through = "content-encoding" in headers
+
+        if self.pass_through:
+            await self.send(message)
+        else:
+            await super().send_with_gzip(message)
+
+
+class SpanGZipMiddleware(GZipMiddleware):
+    """
+    Replaces responder's gzip middleware so pre-compressed bodies (like the cached
+    OpenAPI spec) are not compressed a second time.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            headers = Headers(scope=scope)
+            if "gzip" in headers.get("Accept-Encoding", ""):
+                responder = _PassThroughGZipResponder(self.app, self.minimum_size)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
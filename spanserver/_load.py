@@ -0,0 +1,285 @@
+import asyncio
+import math
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+from urllib.parse import urlencode
+
+from spantools import MimeType
+
+from ._asgi import Lifespan, RawHeaders, call_app, encode_body, http_scope, raw_headers
+from ._batch import SubRequest
+
+
+@dataclass
+class LoadRequest(SubRequest):
+    """
+    One kind of request in the mix sent by a :class:`LoadGenerator`. Bodies that are
+    not ``str`` or ``bytes`` are encoded with the ``Content-Type`` header's mimetype,
+    JSON by default.
+    """
+
+    weight: float = 1.0
+    """Relative share of the mix taken by this request."""
+    name: Optional[str] = None
+    """
+    Name results are reported under. Defaults to ``'<METHOD> <path>'``. Requests with
+    the same name are reported together.
+    """
+
+    @property
+    def report_name(self) -> str:
+        return self.name or f"{self.method.upper()} {self.path}"
+
+
+@dataclass
+class RouteLoad:
+    """Results for the requests reported under one name."""
+
+    name: str
+    """Name of the requests."""
+    requests: int
+    """Requests completed."""
+    statuses: Dict[int, int]
+    """Responses by http status code."""
+    throughput: float
+    """Requests completed per second."""
+    p50: float
+    """Median latency in seconds."""
+    p95: float
+    """95th percentile latency in seconds."""
+    p99: float
+    """99th percentile latency in seconds."""
+    mean: float
+    """Mean latency in seconds."""
+    max: float
+    """Slowest latency in seconds."""
+
+    @property
+    def errors(self) -> int:
+        """Responses with a status code of 400 or above."""
+        return sum(count for status, count in self.statuses.items() if status >= 400)
+
+    @classmethod
+    def from_latencies(
+        cls,
+        name: str,
+        latencies: List[float],
+        statuses: Dict[int, int],
+        duration: float,
+    ) -> "RouteLoad":
+        latencies = sorted(latencies)
+        return cls(
+            name=name,
+            requests=len(latencies),
+            statuses=dict(sorted(statuses.items())),
+            throughput=len(latencies) / duration if duration else 0.0,
+            p50=percentile(latencies, 0.50),
+            p95=percentile(latencies, 0.95),
+            p99=percentile(latencies, 0.99),
+            mean=sum(latencies) / len(latencies),
+            max=latencies[-1],
+        )
+
+
+@dataclass
+class LoadReport:
+    """Results of a :class:`LoadGenerator` run."""
+
+    duration: float
+    """Seconds the run took."""
+    concurrency: int
+    """Requests kept in flight."""
+    total: RouteLoad
+    """Results across every request."""
+    routes: Dict[str, RouteLoad]
+    """Results by :func:`LoadRequest.report_name`."""
+
+    def format(self) -> str:
+        """Text table of the report, with latencies in milliseconds."""
+        rows = list(self.routes.values()) + [self.total]
+        width = max(len(row.name) for row in rows)
+        lines = [
+            f"{self.total.requests} requests in {self.duration:.2f}s"
+            f" at concurrency {self.concurrency}",
+            f"{'route':<{width}}  {'requests':>8}  {'req/s':>9}  {'p50 ms':>8}"
+            f"  {'p95 ms':>8}  {'p99 ms':>8}  {'max ms':>8}  {'errors':>6}",
+        ]
+        for row in rows:
+            lines.append(
+                f"{row.name:<{width}}  {row.requests:>8}  {row.throughput:>9.1f}"
+                f"  {row.p50 * 1000:>8.2f}  {row.p95 * 1000:>8.2f}"
+                f"  {row.p99 * 1000:>8.2f}  {row.max * 1000:>8.2f}  {row.errors:>6}"
+            )
+        return "\n".join(lines)
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """Nearest-rank ``q`` percentile of ``ordered``, ``0 < q <= 1``."""
+    rank = max(math.ceil(q * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+@dataclass
+class _Prepared:
+    name: str
+    method: str
+    path: str
+    query_string: bytes
+    headers: RawHeaders
+    body: bytes
+
+
+class LoadGenerator:
+    """
+    Sends a weighted mix of requests to ``api`` over ASGI, in-process, keeping
+    ``concurrency`` requests in flight. Runs stop after ``requests`` requests or
+    ``duration`` seconds, whichever comes first.
+
+    Latency is measured from when a request is sent to the app until its response is
+    complete, so it includes time spent waiting on other requests sharing the event
+    loop.
+
+    Runs start and stop the API through the ASGI lifespan protocol, like a server,
+    unless ``lifespan`` is ``False``. Turn it off when the API is already started, for
+    instance by an :class:`AsyncClient`.
+    """
+
+    def __init__(
+        self,
+        api: "SpanAPI",
+        mix: Sequence[LoadRequest],
+        *,
+        concurrency: int = 10,
+        requests: Optional[int] = None,
+        duration: Optional[float] = None,
+        warmup: int = 0,
+        seed: Optional[int] = None,
+        lifespan: bool = True,
+    ) -> None:
+        if not mix:
+            raise ValueError("mix must have at least one request")
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        if requests is None and duration is None:
+            raise ValueError("requests or duration must be set")
+
+        self.api: "SpanAPI" = api
+        self.mix: List[LoadRequest] = list(mix)
+        self.concurrency: int = concurrency
+        self.requests: Optional[int] = requests
+        self.duration: Optional[float] = duration
+        self.warmup: int = warmup
+        self.lifespan: bool = lifespan
+
+        self._random = random.Random(seed)
+        self._prepared: List[_Prepared] = [self._prepare(req) for req in self.mix]
+        self._weights: List[float] = [req.weight for req in self.mix]
+
+    async def run(self) -> LoadReport:
+        """Run the load and report the results."""
+        if not self.lifespan:
+            return await self._run()
+
+        async with Lifespan(self.api):
+            return await self._run()
+
+    async def _run(self) -> LoadReport:
+        for _ in range(self.warmup):
+            await self._send(self._pick())
+
+        latencies: Dict[str, List[float]] = {req.name: list() for req in self._prepared}
+        statuses: Dict[str, Dict[int, int]] = {
+            req.name: dict() for req in self._prepared
+        }
+
+        started = time.perf_counter()
+        stop_at = None if self.duration is None else started + self.duration
+        issued = 0
+
+        async def worker() -> None:
+            nonlocal issued
+            while self.requests is None or issued < self.requests:
+                if stop_at is not None and time.perf_counter() >= stop_at:
+                    return
+                issued += 1
+
+                prepared = self._pick()
+                sent = time.perf_counter()
+                status = await self._send(prepared)
+                latencies[prepared.name].append(time.perf_counter() - sent)
+                counts = statuses[prepared.name]
+                counts[status] = counts.get(status, 0) + 1
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        duration = time.perf_counter() - started
+
+        return self._report(latencies, statuses, duration)
+
+    def _report(
+        self,
+        latencies: Dict[str, List[float]],
+        statuses: Dict[str, Dict[int, int]],
+        duration: float,
+    ) -> LoadReport:
+        routes = {
+            name: RouteLoad.from_latencies(name, values, statuses[name], duration)
+            for name, values in latencies.items()
+            if values
+        }
+
+        all_statuses: Dict[int, int] = dict()
+        for counts in statuses.values():
+            for status, count in counts.items():
+                all_statuses[status] = all_statuses.get(status, 0) + count
+
+        all_latencies = [value for values in latencies.values() for value in values]
+        if not all_latencies:
+            raise ValueError("no requests completed during the run")
+
+        return LoadReport(
+            duration=duration,
+            concurrency=self.concurrency,
+            total=RouteLoad.from_latencies(
+                "total", all_latencies, all_statuses, duration
+            ),
+            routes=routes,
+        )
+
+    def _pick(self) -> _Prepared:
+        return self._random.choices(self._prepared, self._weights)[0]
+
+    def _prepare(self, req: LoadRequest) -> _Prepared:
+        headers = {key.lower(): value for key, value in req.headers.items()}
+        headers.setdefault("host", "testserver")
+        body = encode_body(req.body, MimeType.JSON, headers, self.api._encoders)
+
+        return _Prepared(
+            name=req.report_name,
+            method=req.method.upper(),
+            path=req.path,
+            query_string=urlencode(req.params).encode(),
+            headers=raw_headers(headers, body),
+            body=body,
+        )
+
+    async def _send(self, prepared: _Prepared) -> int:
+        scope = http_scope(
+            prepared.method,
+            prepared.path,
+            prepared.query_string,
+            prepared.headers,
+            client=("loadgenerator", 50000),
+        )
+        try:
+            response = await call_app(self.api.app, scope, prepared.body)
+        except Exception:
+            # Errors that escape the app are sent as a 500 by its error middleware.
+            return 500
+        return response.status
+
+
+type_helper = False
+if type_helper:
+    from ._api import SpanAPI
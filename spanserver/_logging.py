@@ -0,0 +1,298 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Any, Optional, List, Dict, Tuple, Type
+
+from spantools import Error
+from spantools.errors_api import APIError
+
+from ._req_resp import Request, Response, content_length
+from ._timing import StageClock
+
+
+def _default_handlers() -> List[logging.Handler]:
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+    return [handler]
+
+
+class LogSink:
+    """
+    Hands log records off to a background thread, which passes them on to
+    ``handlers``. Emitting a record on the event loop only costs a queue put --
+    formatting and I/O happen on the listener thread.
+
+    The listener thread is started on the first emitted record, and
+    :func:`LogSink.stop` flushes all pending records before returning.
+    """
+
+    def __init__(self, handlers: Optional[List[logging.Handler]] = None) -> None:
+        if handlers is None:
+            handlers = _default_handlers()
+
+        self.handlers: List[logging.Handler] = handlers
+        self._queue: "queue.SimpleQueue[Optional[logging.LogRecord]]" = (
+            queue.SimpleQueue()
+        )
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self._lock = threading.Lock()
+
+        atexit.register(self.stop)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Queue ``record`` to be handled on the listener thread."""
+        if self._listener is None:
+            self.start()
+        self._queue.put_nowait(record)
+
+    def start(self) -> None:
+        """Start the listener thread if it is not running."""
+        with self._lock:
+            if self._listener is None:
+                self._listener = logging.handlers.QueueListener(
+                    self._queue, *self.handlers, respect_handler_level=True
+                )
+                self._listener.start()
+
+    def stop(self) -> None:
+        """Flush pending records and stop the listener thread."""
+        with self._lock:
+            if self._listener is not None:
+                self._listener.stop()
+                self._listener = None
+
+    def reset_after_fork(self) -> None:
+        """
+        Drop the listener thread and queue inherited from the parent process. Threads
+        do not survive ``os.fork``, so a forked child must call this before emitting.
+        """
+        self._queue = queue.SimpleQueue()
+        self._listener = None
+        self._lock = threading.Lock()
+
+
+@dataclass
+class ErrorLogPolicy:
+    """Settings for how :class:`SpanAPI` logs errors raised while handling requests."""
+
+    traceback_min_status: int = 500
+    """Tracebacks are only logged for errors with an http code at or above this."""
+
+    client_error_sample_rate: float = 1.0
+    """Fraction of errors below ``traceback_min_status`` that are logged."""
+
+    rate_limit: Optional[int] = 10
+    """
+    Max records logged per ``rate_window`` for the same error on the same route
+    method. ``None`` disables rate limiting.
+    """
+
+    rate_window: float = 60.0
+    """Length of the rate limiting window in seconds."""
+
+    logger_name: str = "spanserver.errors"
+    """Logger name set on emitted records."""
+
+    handlers: Optional[List[logging.Handler]] = None
+    """
+    Handlers that records are written to from the sink's background thread. Defaults
+    to a ``sys.stderr`` stream handler.
+    """
+
+
+class ErrorLog:
+    """Builds structured error records and hands them to a :class:`LogSink`."""
+
+    def __init__(self, policy: ErrorLogPolicy) -> None:
+        self.policy: ErrorLogPolicy = policy
+        self.sink: LogSink = LogSink(policy.handlers)
+        # Rate limiting windows: key -> [window start, count, suppressed count]
+        self._windows: Dict[Tuple[str, str, str], List[float]] = dict()
+
+    def log(
+        self,
+        exc: BaseException,
+        error_data: Error,
+        exc_api: APIError,
+        req: Request,
+        source: str,
+    ) -> None:
+        """
+        Log an error raised by route method ``source``. Records carry ``error_id``,
+        ``error_name``, ``error_code``, ``http_code``, ``http_method``, ``url`` and
+        ``source`` attributes for structured handlers.
+        """
+        policy = self.policy
+        with_traceback = exc_api.http_code >= policy.traceback_min_status
+
+        if (
+            not with_traceback
+            and policy.client_error_sample_rate < 1.0
+            and random.random() >= policy.client_error_sample_rate
+        ):
+            return
+
+        suppressed = self._check_rate((source, req.method, error_data.name))
+        if suppressed is None:
+            return
+
+        message = f'({error_data.id}) - {error_data.name} "{exc_api}"'
+        if suppressed:
+            message += f" ({suppressed} similar errors suppressed)"
+
+        exc_info: Optional[
+            Tuple[Type[BaseException], BaseException, Optional[TracebackType]]
+        ] = None
+
+        if with_traceback:
+            level = logging.ERROR
+            exc_info = (type(exc), exc, exc.__traceback__)
+        else:
+            level = logging.WARNING
+
+        record = logging.LogRecord(
+            name=policy.logger_name,
+            level=level,
+            pathname=__file__,
+            lineno=0,
+            msg=message,
+            args=(),
+            exc_info=exc_info,
+        )
+        # Structured fields are set the same way the ``extra`` argument of
+        # ``Logger.log`` would set them.
+        record.__dict__.update(
+            error_id=error_data.id,
+            error_name=error_data.name,
+            error_code=error_data.code,
+            http_code=exc_api.http_code,
+            http_method=req.method,
+            url=req.full_url,
+            source=source,
+        )
+
+        self.sink.emit(record)
+
+    def _check_rate(self, key: Tuple[str, str, str]) -> Optional[int]:
+        """
+        Returns ``None`` if the record should be dropped, otherwise the number of
+        records suppressed since the last one logged for ``key``.
+        """
+        limit = self.policy.rate_limit
+        if limit is None:
+            return 0
+
+        now = time.monotonic()
+        window = self._windows.get(key)
+
+        if window is None or now - window[0] >= self.policy.rate_window:
+            suppressed = 0 if window is None else int(window[2])
+            self._windows[key] = [now, 1, 0]
+            return suppressed
+
+        if window[1] >= limit:
+            window[2] += 1
+            return None
+
+        window[1] += 1
+        return 0
+
+
+@dataclass
+class SlowRequestPolicy:
+    """Settings for how :class:`SpanAPI` logs slow :class:`SpanRoute` requests."""
+
+    threshold: float = 1.0
+    """Requests that take longer than this many seconds are logged."""
+
+    logger_name: str = "spanserver.slow_requests"
+    """Logger name set on emitted records."""
+
+    handlers: Optional[List[logging.Handler]] = None
+    """
+    Handlers that records are written to from the sink's background thread. Defaults
+    to a ``sys.stderr`` stream handler.
+    """
+
+
+class SlowRequestLog:
+    """
+    Builds structured records for requests slower than the policy's threshold, with
+    their stage timings and payload sizes, and hands them to a :class:`LogSink`.
+    """
+
+    def __init__(self, policy: SlowRequestPolicy) -> None:
+        self.policy: SlowRequestPolicy = policy
+        self.sink: LogSink = LogSink(policy.handlers)
+
+    def log(
+        self,
+        clock: StageClock,
+        req: Request,
+        resp: Response,
+        source: str,
+        path_params: Dict[str, Any],
+    ) -> bool:
+        """
+        Log the request timed by ``clock`` if it was slow. Records carry ``source``,
+        ``http_method``, ``url``, ``path_params``, ``status``, ``duration``,
+        ``stages``, ``query_bytes``, ``request_bytes``, ``response_bytes``,
+        ``mimetype``, ``projection`` and ``paging`` attributes for structured handlers.
+        Durations are in seconds.
+
+        Returns whether the request was logged.
+        """
+        duration = clock.last - clock.started
+        if duration < self.policy.threshold:
+            return False
+
+        stages: Dict[str, float] = dict()
+        for stage, seconds in clock.laps:
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
+        status = resp.status_code or 200
+        breakdown = ", ".join(
+            f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in stages.items()
+        )
+        message = (
+            f"{req.method.upper()} {req.url.path} took {duration * 1000:.1f}ms"
+            f" ({breakdown}) - {status}"
+        )
+
+        record = logging.LogRecord(
+            name=self.policy.logger_name,
+            level=logging.WARNING,
+            pathname=__file__,
+            lineno=0,
+            msg=message,
+            args=(),
+            exc_info=None,
+        )
+        paging = req._paging
+        record.__dict__.update(
+            source=source,
+            http_method=req.method,
+            url=req.full_url,
+            path_params={name: str(value) for name, value in path_params.items()},
+            status=status,
+            duration=duration,
+            stages=stages,
+            query_bytes=len(req._starlette.scope.get("query_string", b"")),
+            request_bytes=content_length(req),
+            response_bytes=len(resp.content or b""),
+            mimetype=resp.headers.get("Content-Type"),
+            projection=dict(req._projection or dict()),
+            paging=None
+            if paging is None
+            else {"offset": paging.offset, "limit": paging.limit},
+        )
+
+        self.sink.emit(record)
+        return True
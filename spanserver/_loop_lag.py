@@ -0,0 +1,142 @@
+import asyncio
+import enum
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from ._errors import ServiceUnavailableError
+from ._timing import LatencyHistogram
+
+
+class Priority(enum.IntEnum):
+    """Priority of a :class:`SpanRoute` method when load is shed for loop lag."""
+
+    LOW = 0
+    """Shed first, once lag passes ``LoopLagPolicy.low_priority_threshold``."""
+    NORMAL = 1
+    """Shed once lag passes ``LoopLagPolicy.shed_threshold``."""
+    HIGH = 2
+    """Never shed. For health checks and cheap routes."""
+
+
+@dataclass(frozen=True)
+class LoopLagPolicy:
+    """
+    Settings for measuring how late the event loop runs scheduled callbacks, and for
+    shedding :class:`SpanRoute` requests while it lags.
+    """
+
+    interval: float = 0.05
+    """Seconds between lag samples."""
+    smoothing: float = 0.5
+    """
+    Weight of each new sample in the smoothed lag, between 0 and 1. Lower values take
+    longer to react to a blocked loop, and longer to recover from one.
+    """
+    shed_threshold: Optional[float] = None
+    """
+    Smoothed lag, in seconds, above which :attr:`Priority.NORMAL` requests are shed.
+    ``None`` only measures lag.
+    """
+    low_priority_threshold: Optional[float] = None
+    """
+    Smoothed lag above which :attr:`Priority.LOW` requests are shed. Defaults to half
+    of ``shed_threshold``.
+    """
+    retry_after: int = 1
+    """Seconds sent in the ``Retry-After`` header of shed requests."""
+
+
+@dataclass
+class LoopLagStats:
+    """Event loop lag measured by a :class:`SpanAPI`, in seconds."""
+
+    lag: float = 0.0
+    """Smoothed lag that requests are shed on."""
+    last: float = 0.0
+    """Most recent sample."""
+    peak: float = 0.0
+    """Largest sample."""
+    samples: LatencyHistogram = field(default_factory=LatencyHistogram)
+    """Histogram of every sample."""
+
+
+class LoopLagMonitor:
+    """
+    Samples event loop lag from a background task: the time between when a sleep of
+    ``interval`` should have ended and when the loop got around to resuming it. Lag
+    grows when callbacks, like CPU-heavy schema dumps, block the loop.
+    """
+
+    def __init__(self, policy: LoopLagPolicy) -> None:
+        if policy.interval <= 0:
+            raise ValueError("interval must be positive")
+        if not 0 < policy.smoothing <= 1:
+            raise ValueError("smoothing must be above 0 and at most 1")
+
+        self.policy: LoopLagPolicy = policy
+        self.stats: LoopLagStats = LoopLagStats()
+        self._task: Optional["asyncio.Task[None]"] = None
+
+        low_threshold = policy.low_priority_threshold
+        if low_threshold is None and policy.shed_threshold is not None:
+            low_threshold = policy.shed_threshold / 2
+        self._thresholds: Dict[Priority, Optional[float]] = {
+            Priority.LOW: low_threshold,
+            Priority.NORMAL: policy.shed_threshold,
+            Priority.HIGH: None,
+        }
+
+    @property
+    def sheds(self) -> bool:
+        """Whether any requests are shed on lag."""
+        return any(threshold is not None for threshold in self._thresholds.values())
+
+    async def start(self) -> None:
+        """Start sampling on the running event loop. Does nothing if started."""
+        if self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self._sample())
+
+    async def stop(self) -> None:
+        """Stop sampling."""
+        task = self._task
+        if task is None:
+            return
+
+        self._task = None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def _sample(self) -> None:
+        loop = asyncio.get_event_loop()
+        interval = self.policy.interval
+        while True:
+            due = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.observe(max(loop.time() - due, 0.0))
+
+    def observe(self, lag: float) -> None:
+        """Add a lag sample, in seconds."""
+        stats = self.stats
+        stats.last = lag
+        stats.peak = max(stats.peak, lag)
+        stats.samples.observe(lag)
+        stats.lag += self.policy.smoothing * (lag - stats.lag)
+
+    def check(self, priority: Priority) -> None:
+        """
+        Shed a request of ``priority`` if the loop lags past its threshold.
+
+        :raises ServiceUnavailableError: If the request is shed.
+        """
+        threshold = self._thresholds[priority]
+        lag = self.stats.lag
+        if threshold is None or lag <= threshold:
+            return
+
+        raise ServiceUnavailableError(
+            f"event loop is lagging by {lag * 1000:.0f}ms, retry later",
+            retry_after=self.policy.retry_after,
+        )
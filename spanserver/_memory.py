@@ -0,0 +1,273 @@
+import dis
+import random
+import tracemalloc
+from dataclasses import dataclass, field
+from types import CodeType
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple
+
+from ._timing import StageClock
+from ._stepping import SteppedCoroutine
+
+
+MEMORY_STAGES: Tuple[str, ...] = ("admission", "params", "decode", "handler", "dump")
+"""Stages of a request that allocations are attributed to."""
+
+# Python 3.9+ can reset the traced peak, which lets a request's peak include
+# allocations freed again before it next awaits.
+_reset_peak: Optional[Callable[[], None]] = getattr(tracemalloc, "reset_peak", None)
+
+
+@dataclass
+class MemoryTracingPolicy:
+    """
+    Settings for tracing the memory allocated by :class:`SpanRoute` requests with
+    :mod:`tracemalloc`. Tracing slows down the whole process, so it is meant for
+    diagnosing memory growth rather than for production traffic.
+    """
+
+    frames: int = 25
+    """
+    Frames stored for each traced allocation. Sites are only found for allocations made
+    within this many frames of the route method.
+    """
+
+    site_sample_rate: float = 0.05
+    """
+    Fraction of requests whose retained allocations are grouped by site. Each sampled
+    request takes two snapshots of every traced allocation, which is slow. Only
+    allocations made under the route method are kept, so allocations of concurrent
+    requests to other routes are left out.
+    """
+
+    top_sites: int = 10
+    """Number of allocation sites listed for each route in reports."""
+
+
+@dataclass
+class AllocationSite:
+    """Allocations still alive when a sampled request finished, by traceback."""
+
+    location: str
+    """File and line of the innermost frame, like ``'service/routes.py:42'``."""
+    traceback: List[str]
+    """Frames of the allocating call stack, as ``'file:line'``, innermost last."""
+    size: int = 0
+    """Bytes retained, summed over sampled requests."""
+    count: int = 0
+    """Allocations retained, summed over sampled requests."""
+
+
+@dataclass
+class MemoryStats:
+    """Allocations made by requests to a :class:`SpanRoute` method."""
+
+    requests: int = 0
+    """Requests traced."""
+    allocated: Dict[str, int] = field(
+        default_factory=lambda: dict.fromkeys(MEMORY_STAGES, 0)
+    )
+    """
+    Net bytes allocated by each stage, summed over requests. Allocations freed in the
+    same stage cancel out.
+    """
+    retained: int = 0
+    """Bytes still allocated when requests finished, summed over requests."""
+    peak: int = 0
+    """Most bytes a single request had allocated at once."""
+    sampled: int = 0
+    """Requests whose retained allocations were grouped into ``sites``."""
+    sites: Dict[Tuple[str, ...], AllocationSite] = field(default_factory=dict)
+    """Retained allocations of sampled requests, by traceback."""
+
+    @property
+    def mean_retained(self) -> Optional[float]:
+        return self.retained / self.requests if self.requests else None
+
+    def top_sites(self, count: int = 10) -> List[AllocationSite]:
+        """The ``count`` sites that retained the most bytes."""
+        sites = sorted(self.sites.values(), key=lambda site: site.size, reverse=True)
+        return sites[:count]
+
+
+class AllocationMeter:
+    """
+    Counts the bytes allocated by one request, by stage. Allocations are only counted
+    while the request's own code runs, so other requests sharing the event loop are
+    not billed to it.
+    """
+
+    __slots__ = ("stages", "stage", "mark", "net", "peak", "decoded")
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, int] = dict.fromkeys(MEMORY_STAGES, 0)
+        self.stage: Optional[str] = "admission"
+        self.mark: int = 0
+        self.net: int = 0
+        self.peak: int = 0
+        # Bytes allocated decoding request media, which happens during the handler.
+        self.decoded: int = 0
+
+    def resume(self) -> None:
+        """Start counting, when the request's code runs again."""
+        if _reset_peak is not None:
+            _reset_peak()
+        self.mark = tracemalloc.get_traced_memory()[0]
+
+    def pause(self) -> None:
+        """Bill allocations since the last mark to the current stage."""
+        current, traced_peak = tracemalloc.get_traced_memory()
+        if _reset_peak is not None:
+            self.peak = max(self.peak, self.net + traced_peak - self.mark)
+
+        delta = current - self.mark
+        self.mark = current
+        if self.stage is None:
+            return
+
+        self.stages[self.stage] += delta
+        self.net += delta
+        self.peak = max(self.peak, self.net)
+
+    def lap(self, stage: Optional[str]) -> None:
+        """End the current stage and start ``stage``. ``None`` stops counting."""
+        self.pause()
+        self.stage = stage
+
+    def split(self, stage: str, part: str, size: int) -> None:
+        """Move ``size`` bytes billed to ``stage`` over to ``part``."""
+        self.stages[stage] -= size
+        self.stages[part] += size
+
+    def record(self, stats: MemoryStats) -> None:
+        stats.requests += 1
+        stats.retained += self.net
+        stats.peak = max(stats.peak, self.peak)
+        for stage, size in self.stages.items():
+            stats.allocated[stage] += size
+
+
+class MeteredClock(StageClock):
+    """:class:`StageClock` that also moves an :class:`AllocationMeter` to each stage."""
+
+    __slots__ = ("meter",)
+
+    def __init__(self, stage: str, meter: AllocationMeter) -> None:
+        super().__init__(stage)
+        self.meter: AllocationMeter = meter
+
+    def lap(self, stage: Optional[str]) -> None:
+        self.meter.lap(stage)
+        super().lap(stage)
+
+
+class MemoryTracer:
+    """Starts :mod:`tracemalloc`, and traces requests into :class:`MemoryStats`."""
+
+    def __init__(self, policy: MemoryTracingPolicy) -> None:
+        self.policy: MemoryTracingPolicy = policy
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(policy.frames)
+
+    def sampled(self) -> bool:
+        rate = self.policy.site_sample_rate
+        return rate > 0 and random.random() < rate
+
+    async def run(
+        self,
+        call: Coroutine[Any, Any, None],
+        meter: AllocationMeter,
+        stats: MemoryStats,
+        endpoint: "CodeSpan",
+    ) -> None:
+        """
+        Run ``call``, counting its allocations with ``meter`` into ``stats``. Sites are
+        kept for allocations made under the route method's code, ``endpoint``.
+        """
+        before = self._snapshot() if self.sampled() else None
+        try:
+            await SteppedCoroutine(call, meter.resume, meter.pause)
+        finally:
+            meter.split("handler", "decode", meter.decoded)
+            meter.record(stats)
+            if before is not None:
+                after = self._snapshot()
+                if after is not None:
+                    stats.sampled += 1
+                    diffs = after.compare_to(before, "traceback")
+                    _add_sites(stats, diffs, endpoint)
+
+    @staticmethod
+    def _snapshot() -> Optional[tracemalloc.Snapshot]:
+        if not tracemalloc.is_tracing():
+            return None
+        return tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ]
+        )
+
+
+CodeSpan = Tuple[str, int, int]
+
+
+def code_span(code: CodeType) -> CodeSpan:
+    """File name, first line and last line of ``code``."""
+    last = max(line for _, line in dis.findlinestarts(code))
+    return code.co_filename, code.co_firstlineno, last
+
+
+def _under(traceback: tracemalloc.Traceback, span: CodeSpan) -> bool:
+    filename, first, last = span
+    return any(
+        frame.filename == filename and first <= frame.lineno <= last
+        for frame in traceback
+    )
+
+
+def _add_sites(
+    stats: MemoryStats, diffs: List[tracemalloc.StatisticDiff], endpoint: CodeSpan
+) -> None:
+    for diff in diffs:
+        if diff.size_diff <= 0 or not _under(diff.traceback, endpoint):
+            continue
+
+        frames = tuple(f"{frame.filename}:{frame.lineno}" for frame in diff.traceback)
+        site = stats.sites.get(frames)
+        if site is None:
+            site = AllocationSite(location=frames[-1], traceback=list(frames))
+            stats.sites[frames] = site
+
+        site.size += diff.size_diff
+        site.count += max(diff.count_diff, 0)
+
+
+def format_memory_report(stats: Dict[str, MemoryStats], top_sites: int) -> str:
+    """
+    Text report of ``stats`` by route method name, largest retained total first.
+    Sizes are in KiB.
+    """
+    traced = [(name, method) for name, method in stats.items() if method.requests]
+    traced.sort(key=lambda item: item[1].retained, reverse=True)
+
+    lines: List[str] = list()
+    for name, method in traced:
+        allocated = ", ".join(
+            f"{stage} {size / 1024:.1f}" for stage, size in method.allocated.items()
+        )
+        lines.extend(
+            [
+                f"{name}: {method.requests} requests,"
+                f" {method.retained / 1024:.1f} KiB retained"
+                f" ({(method.mean_retained or 0) / 1024:.1f} per request),"
+                f" peak {method.peak / 1024:.1f}",
+                f"  allocated by stage: {allocated}",
+            ]
+        )
+        for site in method.top_sites(top_sites):
+            lines.append(
+                f"  {site.size / 1024:.1f} KiB in {site.count} blocks at"
+                f" {site.location}"
+            )
+
+    return "\n".join(lines)
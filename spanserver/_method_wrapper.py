@@ -1,25 +1,40 @@
-import sys
-import traceback
+import asyncio
 import functools
-from typing import Callable, Any, Dict, List
+from typing import Callable, Any, Coroutine, Dict, List, Optional, Tuple
 
 from spantools import (
     Error,
-    DecoderIndexType,
-    EncoderIndexType,
+    PagingReq,
     errors_api,
     ContentEncodeError,
 )
 
 from ._req_resp import Request, Response
-from ._openapi import ParamInfo
+from ._doc_info import ParamInfo
+from ._logging import ErrorLog
+from ._paging import _set_up_paging_resp, _adjust_paging_totals
+from ._plan import MethodPlan, MethodStats
+from ._resources import ResourcePool
+from ._admission import AdmissionGate
+from ._errors import RequestTimeoutError, ServiceUnavailableError
+from ._single_flight import SingleFlight, ResponseSnapshot, flight_key
+from ._timing import StageClock, STOPPED_CLOCK
+from ._profiling import RequestProfiler
+from ._memory import AllocationMeter, MemoryStats, MemoryTracer, MeteredClock
+from ._memory import code_span
+from ._loop_lag import LoopLagMonitor, Priority
 
 
 URLInfoType = List[ParamInfo]
 DumpErrors = (errors_api.ResponseValidationError, ContentEncodeError)
 
+DEADLINE_HEADER = "request-timeout"
+"""Header clients send to shorten the deadline of a request, in seconds."""
 
-def _handle_route_error(exc: BaseException, req: Request, resp: Response) -> None:
+
+def _handle_route_error(
+    exc: BaseException, req: Request, resp: Response, error_log: ErrorLog, source: str
+) -> None:
     error_data, exc_api = Error.from_exception(exc)
 
     # Set the response status code
@@ -28,8 +43,11 @@ def _handle_route_error(exc: BaseException, req: Request, resp: Response) -> Non
     # Set the header error info
     error_data.to_headers(resp.headers)
 
-    sys.stderr.write(f'ERROR: ({error_data.id}) - {error_data.name} "{exc_api}"\n')
-    traceback.print_exc(file=sys.stderr)
+    retry_after = getattr(exc_api, "retry_after", None)
+    if retry_after is not None:
+        resp.headers["Retry-After"] = str(retry_after)
+
+    error_log.log(exc, error_data, exc_api, req, source)
 
     if exc_api.send_media and not isinstance(exc_api, DumpErrors):
         try:
@@ -48,29 +66,319 @@ def _load_params(param_loaders: URLInfoType, **kwargs: Any) -> Dict[str, Any]:
     return kwargs
 
 
-def method_wrapper(
-    endpoint_method: Callable,
-    param_info: URLInfoType,
-    decoders: DecoderIndexType,
-    encoders: EncoderIndexType,
+async def _checkout_resources(
+    resources: List[Tuple[str, ResourcePool]], kwargs: Dict[str, Any]
+) -> List[Tuple[ResourcePool, Any]]:
+    checked_out: List[Tuple[ResourcePool, Any]] = list()
+    try:
+        for name, pool in resources:
+            resource = await pool.checkout()
+            checked_out.append((pool, resource))
+            kwargs[name] = resource
+    except BaseException:
+        _release_resources(checked_out)
+        raise
+
+    return checked_out
+
+
+async def _admit(gates: Tuple[AdmissionGate, ...]) -> List[AdmissionGate]:
+    admitted: List[AdmissionGate] = list()
+    try:
+        for gate in gates:
+            await gate.acquire()
+            admitted.append(gate)
+    except BaseException:
+        _leave(admitted)
+        raise
+
+    return admitted
+
+
+def _leave(admitted: List[AdmissionGate]) -> None:
+    for gate in reversed(admitted):
+        gate.release()
+
+
+def _shed_on_lag(
+    monitor: LoopLagMonitor, priority: Priority, stats: MethodStats
+) -> None:
+    try:
+        monitor.check(priority)
+    except ServiceUnavailableError:
+        stats.lag_shed += 1
+        raise
+
+
+def _deadline(req: Request, timeout: Optional[float]) -> Optional[float]:
+    """
+    Event loop time by which the route method must finish. A client deadline can only
+    shorten the route's ``timeout``.
+    """
+    client_value = req.headers.get(DEADLINE_HEADER)
+    if client_value is not None:
+        try:
+            client_timeout = float(client_value)
+        except ValueError:
+            client_timeout = -1.0
+        if not client_timeout > 0:
+            raise errors_api.RequestValidationError(
+                f"{DEADLINE_HEADER} header must be a positive number of seconds"
+            )
+        if timeout is None or client_timeout < timeout:
+            timeout = client_timeout
+
+    if timeout is None:
+        return None
+    return asyncio.get_event_loop().time() + timeout
+
+
+async def _run_endpoint(
+    call: Coroutine[Any, Any, None], deadline: Optional[float], stats: MethodStats
+) -> None:
+    """
+    Awaits ``call``, cancelling it if it runs past ``deadline``. The call runs in the
+    current task, so per-request layers like the profiler still see the route method.
+    """
+    if deadline is None:
+        await call
+        return
+
+    loop = asyncio.get_event_loop()
+    if loop.time() >= deadline:
+        call.close()
+        stats.timeouts += 1
+        raise RequestTimeoutError("route method did not finish before its deadline")
+
+    current = asyncio.current_task()
+    assert current is not None
+    task: "asyncio.Task[Any]" = current
+    expired = False
+
+    def expire() -> None:
+        nonlocal expired
+        expired = True
+        task.cancel()
+
+    timer = loop.call_at(deadline, expire)
+    try:
+        await call
+    except asyncio.CancelledError:
+        # Cancellations from elsewhere, like a client disconnect, are passed through.
+        if not expired:
+            raise
+        stats.timeouts += 1
+        raise RequestTimeoutError("route method did not finish before its deadline")
+    finally:
+        timer.cancel()
+
+
+def _start_clock(req: Request, timing: bool) -> StageClock:
+    if req._allocations is not None:
+        return MeteredClock("admission", req._allocations)
+    return StageClock("admission") if timing else STOPPED_CLOCK
+
+
+def _finish_timing(
+    clock: StageClock,
+    req: Request,
+    resp: Response,
+    plan: MethodPlan,
+    kwargs: Dict[str, Any],
+) -> None:
+    clock.split("handler", "decode", req._decode_time)
+    if plan.timing:
+        clock.record(plan.stats.stages)
+    if plan.server_timing:
+        resp.headers["Server-Timing"] = clock.server_timing()
+
+    slow_log = plan.slow_log
+    if slow_log is not None:
+        path_params = {info.name: kwargs.get(info.name) for info in plan.param_info}
+        if slow_log.log(clock, req, resp, plan.name, path_params):
+            plan.stats.slow += 1
+
+
+def _release_resources(checked_out: List[Tuple[ResourcePool, Any]]) -> None:
+    for pool, resource in checked_out:
+        pool.release(resource)
+
+
+def _coalesce(execute: Callable, flights: SingleFlight, stats: MethodStats) -> Callable:
+    """
+    Wraps ``execute`` so concurrent identical requests share one execution, and
+    receive a copy of its response.
+    """
+
+    @functools.wraps(execute)
+    async def wrapper(
+        self: "SpanRoute", req: Request, resp: Response, *args: Any, **kwargs: Any
+    ) -> None:
+        async def run() -> ResponseSnapshot:
+            await execute(self, req, resp, *args, **kwargs)
+            return ResponseSnapshot.from_response(resp)
+
+        snapshot, leader = await flights.run(flight_key(req, kwargs), run)
+        if not leader:
+            stats.coalesced += 1
+            snapshot.to_response(resp)
+            stats.count_response(req, resp)
+
+    return wrapper
+
+
+def _trace_memory(
+    execute: Callable, tracer: MemoryTracer, stats: MemoryStats, endpoint: Callable
 ) -> Callable:
-    @functools.wraps(endpoint_method)
+    """Wraps ``execute`` so the allocations of each request are counted by stage."""
+    span = code_span(endpoint.__code__)
+
+    @functools.wraps(execute)
     async def wrapper(
         self: "SpanRoute", req: Request, resp: Response, *args: Any, **kwargs: Any
     ) -> None:
+        meter = AllocationMeter()
+        req._allocations = meter
+        call = execute(self, req, resp, *args, **kwargs)
+        await tracer.run(call, meter, stats, span)
+
+    return wrapper
+
+
+def _profile(execute: Callable, profiler: RequestProfiler, name: str) -> Callable:
+    """
+    Wraps ``execute`` so requests picked by ``profiler`` run under a profiler. Other
+    requests run ``execute`` as is.
+    """
+    respond = profiler.policy.respond
+
+    @functools.wraps(execute)
+    async def wrapper(
+        self: "SpanRoute", req: Request, resp: Response, *args: Any, **kwargs: Any
+    ) -> None:
+        requested = profiler.requested(req)
+        if not requested and not profiler.sampled():
+            await execute(self, req, resp, *args, **kwargs)
+            return
+
+        call = execute(self, req, resp, *args, **kwargs)
+        await profiler.run(name, call, resp, respond=requested and respond)
+
+    return wrapper
+
+
+def _add_layers(execute: Callable, plan: MethodPlan) -> Callable:
+    """Wraps ``execute`` in the optional per-request features of ``plan``."""
+    wrapper = execute
+    if plan.memory_tracer is not None:
+        wrapper = _trace_memory(
+            wrapper, plan.memory_tracer, plan.stats.memory, plan.endpoint
+        )
+    if plan.profiler is not None:
+        wrapper = _profile(wrapper, plan.profiler, plan.name)
+    if plan.single_flight is not None:
+        wrapper = _coalesce(wrapper, plan.single_flight, plan.stats)
+    return wrapper
+
+
+def method_wrapper(plan: MethodPlan) -> Callable:
+    """
+    Returns the single coroutine function that executes ``plan`` for each request:
+    sheds the request if the event loop lags, waits for admission under the plan's
+    concurrency limits, loads path params, checks out resources, sets up paging, awaits
+    the route method until its deadline, and dumps the response, handling any errors
+    raised along the way. Each of these stages is timed into the plan's latency
+    histograms.
+
+    Single-flight plans run one execution for concurrent identical requests, and send
+    its encoded response to each of them. Requests picked by the plan's profiler run
+    under :mod:`cProfile`, and plans with a memory tracer count the allocations of
+    each stage.
+    """
+    endpoint = plan.endpoint
+    param_info = plan.param_info
+    resources = plan.resources
+    gates = plan.gates
+    paging = plan.paging
+    error_log = plan.error_log
+    source = plan.name
+    timeout = plan.timeout
+    stats = plan.stats
+    lag_monitor = plan.lag_monitor
+    priority = plan.priority
+    # Slow requests are logged with their stage timings.
+    timing = plan.timing or plan.slow_log is not None
+
+    @functools.wraps(endpoint)
+    async def execute(
+        self: "SpanRoute", req: Request, resp: Response, *args: Any, **kwargs: Any
+    ) -> None:
+        clock = _start_clock(req, timing)
+        stats.in_flight += 1
+        admitted: Optional[List[AdmissionGate]] = None
+        checked_out: Optional[List[Tuple[ResourcePool, Any]]] = None
         try:
-            kwargs = _load_params(param_info, **kwargs)
-            req._decoders = decoders
-            resp._encoders = encoders
-            resp._req_accept = req.headers.get("Accept")
+            # Shed before queueing for admission or decoding the body.
+            if lag_monitor is not None:
+                _shed_on_lag(lag_monitor, priority, stats)
+
+            # Time spent waiting for admission counts against the deadline.
+            deadline = _deadline(req, timeout)
+
+            if gates:
+                admitted = await _admit(gates)
+            clock.lap("params")
+
+            if param_info:
+                kwargs = _load_params(param_info, **kwargs)
+
+            if resources:
+                checked_out = await _checkout_resources(resources, kwargs)
+
+            req._plan = plan
+            resp._plan = plan
             resp._projection = req.projection
+            clock.lap("handler")
 
-            await endpoint_method(self, req, resp, *args, **kwargs)
+            if paging is None:
+                await _run_endpoint(
+                    endpoint(self, req, resp, *args, **kwargs), deadline, stats
+                )
+            else:
+                req._paging = PagingReq.from_params(
+                    req.params,
+                    default_offset=paging.default_offset,
+                    default_limit=paging.limit,
+                )
+                paging_resp = _set_up_paging_resp(req, app_limit=paging.limit)
+                resp._paging = paging_resp
 
+                await _run_endpoint(
+                    endpoint(self, req, resp, *args, **kwargs), deadline, stats
+                )
+
+                _adjust_paging_totals(paging_resp)
+                paging_resp.to_headers(resp.headers)
+
+            clock.lap("dump")
             resp._dump_media()
 
         except BaseException as error:
-            _handle_route_error(error, req, resp)
+            _handle_route_error(error, req, resp, error_log, source)
+
+        finally:
+            if checked_out:
+                _release_resources(checked_out)
+            if admitted:
+                _leave(admitted)
+            stats.in_flight -= 1
+            stats.count_response(req, resp)
+            clock.lap(None)
+            if timing:
+                _finish_timing(clock, req, resp, plan, kwargs)
+
+    wrapper = _add_layers(execute, plan)
+    wrapper.plan = plan  # type: ignore
 
     return wrapper
 
@@ -0,0 +1,182 @@
+from typing import Dict, Iterable, List, Tuple
+
+from ._req_resp import ProjectionBuilder
+from ._timing import LatencyHistogram
+from ._plan import MethodPlan
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+"""Content type of the Prometheus text exposition format."""
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class MetricsWriter:
+    """
+    Writes metric families in the Prometheus text exposition format. Samples are
+    grouped under their family however they are written.
+    """
+
+    def __init__(self, prefix: str = "spanserver_") -> None:
+        self.prefix: str = prefix
+        self._families: Dict[str, List[str]] = dict()
+
+    def declare(self, name: str, metric_type: str, help_text: str) -> None:
+        """Add a metric family with its ``HELP`` and ``TYPE`` lines."""
+        name = self.prefix + name
+        self._families.setdefault(
+            name, [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+        )
+
+    def sample(self, name: str, labels: Labels, value: float, family: str = "") -> None:
+        """Add a sample to the family ``family``, or ``name`` if not given."""
+        lines = self._families[self.prefix + (family or name)]
+        lines.append(
+            f"{self.prefix}{name}{_format_labels(labels)} {_format_value(value)}"
+        )
+
+    def histogram(self, name: str, labels: Labels, histogram: LatencyHistogram) -> None:
+        """Add the cumulative buckets, sum and count of ``histogram``."""
+        cumulative = 0
+        bounds: Iterable[float] = list(histogram.bounds) + [float("inf")]
+        for bound, count in zip(bounds, histogram.counts):
+            cumulative += count
+            bucket_labels = labels + (("le", _format_value(bound)),)
+            self.sample(f"{name}_bucket", bucket_labels, cumulative, family=name)
+        self.sample(f"{name}_sum", labels, histogram.sum, family=name)
+        self.sample(f"{name}_count", labels, histogram.count, family=name)
+
+    def render(self) -> str:
+        lines = [line for family in self._families.values() for line in family]
+        return "\n".join(lines) + "\n"
+
+
+def render_metrics(api: "SpanAPI") -> str:
+    """Render the counters of ``api`` in the Prometheus text exposition format."""
+    writer = MetricsWriter()
+    _write_routes(writer, api)
+    _write_admission(writer, api)
+    _write_loop_lag(writer, api)
+    _write_resources(writer, api)
+    _write_projection_cache(writer)
+    return writer.render()
+
+
+def _route_labels(api: "SpanAPI") -> Iterable[Tuple[Labels, MethodPlan]]:
+    for route in api.span_routes:
+        path = api.span_route_paths.get(route, route.__qualname__)
+        for http_method, plan in route._plans.items():
+            yield (("route", path), ("method", http_method.upper())), plan
+
+
+def _write_routes(writer: MetricsWriter, api: "SpanAPI") -> None:
+    writer.declare("requests_total", "counter", "Requests by status and api code.")
+    writer.declare("requests_in_flight", "gauge", "Requests currently running.")
+    writer.declare("request_timeouts_total", "counter", "Requests past deadline.")
+    writer.declare("requests_coalesced_total", "counter", "Single-flight requests.")
+    writer.declare("requests_slow_total", "counter", "Requests logged as slow.")
+    writer.declare("requests_lag_shed_total", "counter", "Requests shed for loop lag.")
+    writer.declare("request_duration_seconds", "histogram", "Request latency by stage.")
+    writer.declare("request_size_bytes", "histogram", "Request body sizes.")
+    writer.declare("response_size_bytes", "histogram", "Response body sizes.")
+
+    for labels, plan in _route_labels(api):
+        stats = plan.stats
+        for (status, error_code), count in sorted(stats.responses.items()):
+            status_labels = (("status", str(status)), ("error_code", error_code))
+            writer.sample("requests_total", labels + status_labels, count)
+        writer.sample("requests_in_flight", labels, stats.in_flight)
+        writer.sample("request_timeouts_total", labels, stats.timeouts)
+        writer.sample("requests_coalesced_total", labels, stats.coalesced)
+        writer.sample("requests_slow_total", labels, stats.slow)
+        writer.sample("requests_lag_shed_total", labels, stats.lag_shed)
+        for stage, histogram in stats.stages.items():
+            if histogram.count:
+                writer.histogram(
+                    "request_duration_seconds", labels + (("stage", stage),), histogram,
+                )
+        writer.histogram("request_size_bytes", labels, stats.request_bytes)
+        writer.histogram("response_size_bytes", labels, stats.response_bytes)
+
+
+def _write_admission(writer: MetricsWriter, api: "SpanAPI") -> None:
+    stats = api.concurrency_stats()
+    if not stats:
+        return
+
+    writer.declare("admission_in_flight", "gauge", "Requests holding a slot.")
+    writer.declare("admission_queued", "gauge", "Requests waiting for a slot.")
+    writer.declare("admission_shed_total", "counter", "Requests shed with a 503.")
+    for name, limit_stats in stats.items():
+        labels: Labels = (("limit", name),)
+        writer.sample("admission_in_flight", labels, limit_stats.in_flight)
+        writer.sample("admission_queued", labels, limit_stats.queued)
+        writer.sample("admission_shed_total", labels, limit_stats.shed)
+
+
+def _write_loop_lag(writer: MetricsWriter, api: "SpanAPI") -> None:
+    if api.loop_monitor is None:
+        return
+
+    stats = api.loop_monitor.stats
+    writer.declare("event_loop_lag_seconds", "gauge", "Smoothed event loop lag.")
+    writer.declare("event_loop_lag_peak_seconds", "gauge", "Largest event loop lag.")
+    writer.declare(
+        "event_loop_lag_samples_seconds", "histogram", "Event loop lag samples."
+    )
+    writer.sample("event_loop_lag_seconds", (), stats.lag)
+    writer.sample("event_loop_lag_peak_seconds", (), stats.peak)
+    writer.histogram("event_loop_lag_samples_seconds", (), stats.samples)
+
+
+def _write_resources(writer: MetricsWriter, api: "SpanAPI") -> None:
+    stats = api.resources.stats()
+    if not stats:
+        return
+
+    writer.declare("resource_in_use", "gauge", "Resource instances checked out.")
+    writer.declare("resource_checkouts_total", "counter", "Resource checkouts.")
+    writer.declare(
+        "resource_wait_seconds_total", "counter", "Time spent waiting on resources."
+    )
+    for name, resource_stats in stats.items():
+        labels: Labels = (("resource", name),)
+        writer.sample("resource_in_use", labels, resource_stats.in_use)
+        writer.sample("resource_checkouts_total", labels, resource_stats.checkouts)
+        writer.sample("resource_wait_seconds_total", labels, resource_stats.wait_time)
+
+
+def _write_projection_cache(writer: MetricsWriter) -> None:
+    info = ProjectionBuilder._build_projection_schema.cache_info()
+    writer.declare("projection_cache_hits_total", "counter", "Projection cache hits.")
+    writer.declare(
+        "projection_cache_misses_total", "counter", "Projection cache misses."
+    )
+    writer.declare("projection_cache_size", "gauge", "Cached projection schemas.")
+    writer.sample("projection_cache_hits_total", (), info.hits)
+    writer.sample("projection_cache_misses_total", (), info.misses)
+    writer.sample("projection_cache_size", (), info.currsize)
+
+
+type_helper = False
+if type_helper:
+    from ._api import SpanAPI
@@ -0,0 +1,165 @@
+import asyncio
+import functools
+import inspect
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from typing_inspect_isle import get_args, get_origin
+
+from ._req_resp import Request, Response
+
+
+@dataclass
+class MicroBatchCall:
+    """One request in a micro-batch."""
+
+    req: Request
+    """The request."""
+    resp: Response
+    """The response. Its media is set from the handler's results, if returned."""
+    params: Dict[str, Any]
+    """Loaded path params of the request."""
+
+
+@dataclass
+class MicroBatchStats:
+    """Counters of a micro-batched :class:`SpanRoute` method."""
+
+    batches: int = 0
+    """Handler calls."""
+    calls: int = 0
+    """Requests served by the handler."""
+    largest: int = 0
+    """Most requests served by one handler call."""
+
+
+_Pending = Tuple[MicroBatchCall, "asyncio.Future[None]"]
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests for a route method and runs them through one call of
+    a batched handler, once ``max_size`` requests are waiting or ``window`` seconds
+    after the first one arrived.
+    """
+
+    def __init__(self, handler: Callable, max_size: int, window: float) -> None:
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+
+        self.handler: Callable = handler
+        self.max_size: int = max_size
+        self.window: float = window
+        self.stats: MicroBatchStats = MicroBatchStats()
+
+        self._pending: List[_Pending] = list()
+        self._route: Any = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, route: Any, call: MicroBatchCall) -> None:
+        """Add ``call`` to the next batch, and wait for the batch to run."""
+        loop = asyncio.get_event_loop()
+        done: "asyncio.Future[None]" = loop.create_future()
+
+        if not self._pending:
+            # The handler is bound to the route instance of the first request.
+            self._route = route
+            self._timer = loop.call_later(self.window, self._flush)
+        self._pending.append((call, done))
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+
+        await done
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        pending, self._pending = self._pending, list()
+        if pending:
+            asyncio.ensure_future(self._run(self._route, pending))
+
+    async def _run(self, route: Any, pending: List[_Pending]) -> None:
+        calls = [call for call, _ in pending]
+
+        stats = self.stats
+        stats.batches += 1
+        stats.calls += len(calls)
+        stats.largest = max(stats.largest, len(calls))
+
+        try:
+            results = await self.handler(route, calls, **_param_lists(calls))
+            if results is not None and len(results) != len(calls):
+                raise ValueError(
+                    f"{self.handler.__qualname__} returned {len(results)} results for"
+                    f" {len(calls)} requests"
+                )
+        except BaseException as error:
+            results = [error] * len(calls)
+
+        _fan_out(pending, results)
+
+
+def _param_lists(calls: List[MicroBatchCall]) -> Dict[str, List[Any]]:
+    params: Dict[str, List[Any]] = {name: list() for name in calls[0].params}
+    for call in calls:
+        for name, value in call.params.items():
+            params[name].append(value)
+    return params
+
+
+def _fan_out(pending: List[_Pending], results: Optional[List[Any]]) -> None:
+    for index, (call, done) in enumerate(pending):
+        # Requests cancelled while waiting are skipped.
+        if done.done():
+            continue
+
+        result = None if results is None else results[index]
+        if isinstance(result, BaseException):
+            done.set_exception(result)
+            continue
+
+        if results is not None:
+            call.resp.media = result
+        done.set_result(None)
+
+
+def micro_batch_method(handler: Callable, max_size: int, window: float) -> Callable:
+    """
+    Builds the per-request route method for a batched ``handler``. Its keyword-only
+    params take the element type of the handler's list annotations, so path params are
+    still loaded and documented per request.
+    """
+    batcher = MicroBatcher(handler, max_size=max_size, window=window)
+
+    @functools.wraps(handler)
+    async def route_method(
+        self: Any, req: Request, resp: Response, **params: Any
+    ) -> None:
+        await batcher.submit(self, MicroBatchCall(req=req, resp=resp, params=params))
+
+    handler_params = inspect.signature(handler).parameters.values()
+    route_params = [
+        inspect.Parameter(name, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+        for name in ("self", "req", "resp")
+    ]
+    route_params.extend(
+        param.replace(annotation=_element_type(param.annotation))
+        for param in handler_params
+        if param.kind is param.KEYWORD_ONLY
+    )
+
+    route_method.__signature__ = inspect.Signature(route_params)  # type: ignore
+    route_method.micro_batcher = batcher  # type: ignore
+
+    return route_method
+
+
+def _element_type(annotation: Any) -> Any:
+    if get_origin(annotation) is list:
+        args = get_args(annotation)
+        if args:
+            return args[0]
+    return annotation
@@ -2,15 +2,9 @@ import textwrap
 import yaml
 import marshmallow
 import gemma
-import datetime
 import uuid
 import inflect
 import re
-import apispec
-import responder.ext.schema
-import responder.api
-from enum import Enum
-from dataclasses import dataclass, field
 from typing import (
     Type,
     Callable,
@@ -20,34 +14,13 @@ from typing import (
     Union,
     List,
     TypeVar,
-    Sequence,
     Tuple,
     cast,
-    overload,
 )
 
 from spantools import MimeType
-from spantools.errors_api import RequestValidationError
 
-
-class OpenAPISchema(responder.ext.schema.Schema):
-    """Extension of responder's schema class to handle tags."""
-
-    def __init__(self, *args: Any, **kwargs: Any) -> None:
-        super().__init__(*args, **kwargs)
-        self.tags: List[dict] = list()
-
-    @property
-    def _apispec(self) -> apispec.APISpec:
-        spec = super()._apispec
-        for tag in self.tags:
-            spec.tag(tag)
-        return spec
-
-
-# Override responder's schema with our class.
-responder.ext.schema = OpenAPISchema
-responder.api.OpenAPISchema = OpenAPISchema
+from ._doc_info import ParamTypes, ParamInfo, DocRespInfo, DocInfo, fix_descriptions
 
 
 ParamDecoderType = TypeVar("ParamDecoderType")
@@ -56,54 +29,12 @@ ParamDecoderType = TypeVar("ParamDecoderType")
 INFLECT = inflect.engine()
 
 
-# Param Info Classes #####
-# These classes help flag what params should be expected
-
-
-class ParamTypes(Enum):
-    PATH = "PATH"
-    QUERY = "QUERY"
-    HEADER = "HEADER"
-
-
 DEFAULT_RESP_CODE = 5000000000
 
 
 # STRING FORMATTING FUNCTIONS.
 
 
-@overload
-def fix_descriptions(description: str) -> str:
-    ...
-
-
-@overload
-def fix_descriptions(description: None) -> None:
-    ...
-
-
-def fix_descriptions(description: Optional[str]) -> Optional[str]:
-    """
-    Makes sure that a description starts with a capital letter and ends with a period
-    for consistency.
-    """
-    if description is None:
-        return None
-
-    description = textwrap.dedent(description)
-    description = description.strip("\n").rstrip("\n")
-
-    if description[-1] not in [c for c in "!'\":?."]:
-        description += "."
-
-    first_letter = description[0]
-    capitalized = first_letter.capitalize()
-
-    description = capitalized + description[1:]
-
-    return description
-
-
 def camel_case_split(string: str) -> List[str]:
     matches = re.finditer(
         ".+?(?:(?<=[a-z])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])|$)", string
@@ -151,138 +82,6 @@ def _separate_description_summary(docstring: str) -> Tuple[str, Optional[str]]:
     return summary, description
 
 
-# OPENAPI DATA OBJECTS #####
-
-
-@dataclass
-class ParamInfo:
-    """Parameter detail."""
-
-    param_type: ParamTypes
-    """Type of parameter."""
-
-    name: str
-    """Name of parameter."""
-
-    decode_types: Sequence[type]
-    """Python types for decoding from string."""
-
-    description: Optional[str] = None
-    """Description of parameter."""
-
-    required: bool = True
-    """Whether the parameter is required."""
-
-    default: Optional[Any] = None
-    """Default value used if the parameter is not passed."""
-
-    max: Optional[float] = None
-    """Maximum allowed value of the parameter."""
-
-    min: Optional[float] = None
-    """Minimum allowed value of the parameter."""
-
-    def __post_init__(self) -> None:
-        self.description = fix_descriptions(self.description)
-
-    def load_param(self, value: Any) -> Any:
-
-        for decoder in self.decode_types:
-            try:
-                if decoder is bool:
-                    value = value.lower()
-                    return value == "true" or value == "1"
-                else:
-                    return decoder(value)
-            except BaseException:
-                pass
-
-        raise RequestValidationError(
-            f"URL param {self.name} could not be cast to {decoder}"
-        )
-
-    def openapi_spec(self) -> Dict[str, Any]:
-
-        schema_format_block: List[Dict[str, Any]] = list()
-        for decode_type in self.decode_types:
-            this_type, this_format = PARAM_SCHEMA_TRANSLATOR.get(
-                decode_type, ("string", decode_type.__name__.lower())
-            )
-
-            format_block: Dict[str, Any] = {"type": this_type}
-
-            if this_format is not None:
-                format_block["format"] = this_format
-
-            if self.default is not None and issubclass(type(self.default), decode_type):
-                format_block["default"] = self.default
-
-            if issubclass(decode_type, (int, float)):
-                if self.min:
-                    format_block["minimum"] = self.min
-
-                if self.max:
-                    format_block["maximum"] = self.max
-
-            schema_format_block.append(format_block)
-
-        if len(schema_format_block) > 1:
-            schema_block = {"anyOf": schema_format_block}
-        else:
-            schema_block = schema_format_block[0]
-
-        param_block = {
-            "in": self.param_type.value.lower(),
-            "name": self.name,
-            "schema": schema_block,
-            "required": self.required,
-        }
-        if self.description:
-            param_block["description"] = self.description
-
-        return param_block
-
-
-@dataclass
-class DocRespInfo:
-    """Documentation information about method responses."""
-
-    description: Optional[str] = None
-    """Description of the response code."""
-    example: Optional[Any] = None
-    """Example of response payload."""
-    params: List[ParamInfo] = field(default_factory=list)
-    """Response Headers Details."""
-
-    def __post_init__(self) -> None:
-        self.description = fix_descriptions(self.description)
-
-
-@dataclass
-class ApiTag:
-    """Tag information."""
-
-    name: str
-    """Name of tag."""
-    description: str
-    """Tag Description."""
-
-    def __post_init__(self) -> None:
-        self.description = fix_descriptions(self.description)
-
-
-@dataclass
-class DocInfo:
-    req_example: Optional[Any] = None
-    """Example request body data."""
-    req_params: List[ParamInfo] = field(default_factory=list)
-    """Request parameter details."""
-    responses: Dict[int, DocRespInfo] = field(default_factory=dict)
-    """Response codes and details."""
-    tags: List[str] = field(default_factory=list)
-    """Tags for this method."""
-
-
 # OPENAPI Construction Functions #####
 
 
@@ -310,10 +109,9 @@ def reformat_spanroute_docstring(api: "SpanAPI", route: Type["SpanRoute"]) -> No
             continue
 
         method_name = method_name.replace("on_", "")
-        try:
-            schema_info: Optional[RouteSchemaInfo] = api.method_schema_info(handler)
-        except KeyError:
-            schema_info = None
+        # Read from the method itself rather than api.method_schema_info(), since
+        # routes are documented lazily and method names are not unique across routes.
+        schema_info: Optional[RouteSchemaInfo] = getattr(handler, "schema_info", None)
 
         method_openapi = _build_method(
             http_method=method_name,
@@ -711,17 +509,6 @@ def _handler_apply_schemas(method_yaml: dict, schema_info: "RouteSchemaInfo") ->
     _apply_schema_tags(method_yaml, schema_info)
 
 
-PARAM_SCHEMA_TRANSLATOR: Dict[Type, Tuple[str, Optional[str]]] = {
-    str: ("string", None),
-    bool: ("boolean", None),
-    int: ("integer", None),
-    float: ("number", "float"),
-    datetime.date: ("string", "date"),
-    datetime.datetime: ("string", "date-time"),
-    uuid.UUID: ("string", "uuid"),
-}
-
-
 def _handler_apply_params(method_yaml: dict, doc_info: DocInfo) -> None:
     # REQ PARAMS
     params: List[dict] = list()
@@ -0,0 +1,198 @@
+import gzip
+import hashlib
+import json
+import yaml
+import apispec
+import responder.ext.schema
+import responder.api
+from dataclasses import dataclass
+from os import PathLike
+from typing import Any, List, Optional, Set, Union
+
+from responder import Request, Response
+
+
+@dataclass(frozen=True)
+class RenderedBody:
+    """A pre-encoded representation of the OpenAPI spec."""
+
+    content: bytes
+    """Encoded spec."""
+    gzipped: Optional[bytes]
+    """Gzip-compressed ``content``. ``None`` if compression is turned off."""
+    content_type: str
+    """Content-Type header value."""
+    etag: str
+    """Quoted ETag header value."""
+
+
+@dataclass(frozen=True)
+class RenderedSpec:
+    """OpenAPI spec rendered once and reused until routes, schemas or tags change."""
+
+    yaml_text: str
+    """Spec as YAML text."""
+    yaml: RenderedBody
+    """Spec as YAML bytes."""
+    json: RenderedBody
+    """Spec as JSON bytes."""
+    route_count: int
+    """Number of app routes when the spec was rendered."""
+
+
+def _render_body(
+    content: bytes, content_type: str, gzip_level: Optional[int]
+) -> RenderedBody:
+    digest = hashlib.sha1(content).hexdigest()
+    if gzip_level is not None:
+        gzipped: Optional[bytes] = gzip.compress(content, compresslevel=gzip_level)
+    else:
+        gzipped = None
+
+    return RenderedBody(
+        content=content, gzipped=gzipped, content_type=content_type, etag=f'"{digest}"',
+    )
+
+
+class OpenAPISchema(responder.ext.schema.Schema):
+    """
+    Extension of responder's schema class to handle tags, and to cache the rendered
+    spec until routes, schemas or tags change.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.tags: List[dict] = list()
+        self._tag_names: Set[str] = set()
+        self.gzip_level: Optional[int] = None
+        """
+        Compression level used to pre-compress the spec for clients that accept gzip.
+        ``None`` serves the spec uncompressed.
+        """
+        self.prebuilt_path: Optional[Union[str, PathLike]] = None
+        """
+        Spec file built ahead of time. When set, it is served as-is and route
+        docstrings are never converted to OpenAPI.
+        """
+        self._rendered: Optional[RenderedSpec] = None
+
+    def invalidate(self) -> None:
+        """Drop the cached spec so it is rendered again on next access."""
+        self._rendered = None
+
+    def add_schema(self, name: str, schema: Any, check_existing: bool = True) -> None:
+        super().add_schema(name, schema, check_existing=check_existing)
+        self.invalidate()
+
+    def add_tag(self, tag: dict) -> None:
+        """Add an OpenAPI tag object to the spec."""
+        self.tags.append(tag)
+        self._tag_names.add(tag["name"])
+        self.invalidate()
+
+    def has_tag(self, name: str) -> bool:
+        """Whether a tag called ``name`` has been added."""
+        return name in self._tag_names
+
+    @property
+    def _apispec(self) -> apispec.APISpec:
+        self._document_routes()
+
+        spec = super()._apispec
+        for tag in self.tags:
+            spec.tag(tag)
+        return spec
+
+    def _document_routes(self) -> None:
+        # Route docstrings are converted to OpenAPI lazily by SpanAPI.
+        document_routes = getattr(self.app, "_document_routes", None)
+        if document_routes is not None:
+            document_routes()
+
+    @property
+    def rendered(self) -> RenderedSpec:
+        """The cached spec, rendered first if anything has changed since last access."""
+        if self.prebuilt_path is not None:
+            if self._rendered is None:
+                self._rendered = self._load_prebuilt(self.prebuilt_path)
+            return self._rendered
+
+        self._document_routes()
+
+        route_count = len(self.app.router.routes)
+        rendered = self._rendered
+        if rendered is not None and rendered.route_count == route_count:
+            return rendered
+
+        spec = self._apispec
+        rendered = self._render(
+            spec.to_yaml(), json.dumps(spec.to_dict(), default=str), route_count
+        )
+        self._rendered = rendered
+        return rendered
+
+    def _render(self, yaml_text: str, json_text: str, route_count: int) -> RenderedSpec:
+        return RenderedSpec(
+            yaml_text=yaml_text,
+            yaml=_render_body(
+                yaml_text.encode(), "application/x-yaml", self.gzip_level
+            ),
+            json=_render_body(json_text.encode(), "application/json", self.gzip_level),
+            route_count=route_count,
+        )
+
+    def _load_prebuilt(self, path: Union[str, PathLike]) -> RenderedSpec:
+        with open(path, "r") as f:
+            text = f.read()
+
+        if str(path).endswith(".json"):
+            json_text = text
+            yaml_text = yaml.dump(json.loads(text))
+        else:
+            yaml_text = text
+            json_text = json.dumps(yaml.safe_load(text), default=str)
+
+        return self._render(yaml_text, json_text, len(self.app.router.routes))
+
+    @property
+    def openapi(self) -> str:
+        return self.rendered.yaml_text
+
+    def schema_response(self, req: Request, resp: Response) -> None:
+        rendered = self.rendered
+
+        accept = req.headers.get("Accept", "")
+        if "json" in accept and "yaml" not in accept:
+            body = rendered.json
+        else:
+            body = rendered.yaml
+
+        accepts_gzip = "gzip" in req.headers.get("Accept-Encoding", "")
+        use_gzip = accepts_gzip and body.gzipped is not None
+        etag = body.etag[:-1] + '-gzip"' if use_gzip else body.etag
+
+        resp.headers["ETag"] = etag
+        resp.headers["Vary"] = "Accept, Accept-Encoding"
+        resp.headers["Cache-Control"] = "no-cache"
+
+        if_none_match = req.headers.get("If-None-Match", "")
+        if (
+            etag in (t.strip() for t in if_none_match.split(","))
+            or if_none_match == "*"
+        ):
+            resp.status_code = 304
+            resp.content = b""
+            return
+
+        resp.status_code = 200
+        resp.headers["Content-Type"] = body.content_type
+        if use_gzip:
+            resp.headers["Content-Encoding"] = "gzip"
+            resp.content = body.gzipped
+        else:
+            resp.content = body.content
+
+
+# Override responder's schema with our class.
+responder.ext.schema = OpenAPISchema
+responder.api.OpenAPISchema = OpenAPISchema
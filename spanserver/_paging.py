@@ -0,0 +1,66 @@
+import urllib.parse
+import math
+from grahamcracker import URLStr
+
+from spantools import PagingResp
+from spantools.errors_api import APILimitError
+
+from ._req_resp import Request
+
+
+def _replace_paging_info(url: URLStr, offset: int, limit: int) -> URLStr:
+    params = {"paging-offset": str(offset), "paging-limit": str(limit)}
+
+    url_parts = list(urllib.parse.urlparse(url))
+    query = dict(urllib.parse.parse_qsl(url_parts[4]))
+    query.update(params)
+
+    url_parts[4] = urllib.parse.urlencode(query)
+
+    return urllib.parse.urlunparse(url_parts)
+
+
+def _set_up_paging_resp(req: Request, app_limit: int) -> PagingResp:
+    """Sets up paging info based on request."""
+    offset = int(req.params.get("paging-offset", 0))
+    user_limit = int(req.params.get("paging-limit", app_limit))
+
+    if user_limit > app_limit:
+        raise APILimitError(
+            f"item limit for {req.method} {req.full_url} is {app_limit}."
+            f" {user_limit} requested."
+        )
+
+    next_url = _replace_paging_info(
+        req.full_url, offset=offset + user_limit, limit=user_limit
+    )
+    if offset - user_limit >= 0:
+        previous_url = _replace_paging_info(
+            req.full_url, offset=offset - user_limit, limit=user_limit
+        )
+    else:
+        previous_url = None
+
+    current = math.floor(offset / user_limit) + 1
+
+    paging = PagingResp(
+        previous=previous_url,
+        next=next_url,
+        current_page=current,
+        offset=offset,
+        limit=user_limit,
+        total_items=None,
+        total_pages=None,
+    )
+    return paging
+
+
+def _adjust_paging_totals(paging: PagingResp) -> None:
+    """
+    Adjusts total pages based on total items supplied by route. Removes url to next page
+    if necessary.
+    """
+    if paging.total_items is not None:
+        if paging.offset + paging.limit >= paging.total_items:
+            paging.next = None
+        paging.total_pages = math.ceil(paging.total_items / paging.limit)
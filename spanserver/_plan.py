@@ -0,0 +1,237 @@
+from dataclasses import dataclass, field
+from marshmallow import Schema
+from typing import Callable, Dict, Optional, List, Tuple, Union
+
+from spantools import MimeType, DecoderIndexType, EncoderIndexType
+
+from ._req_resp import ProjectionBuilder, Request, Response, content_length
+from ._schema_info import RouteSchemaInfo, LoadOptions, DumpOptions
+from ._doc_info import ParamInfo, DocInfo
+from ._logging import ErrorLog, SlowRequestLog
+from ._resources import ResourcePool
+from ._admission import AdmissionGate
+from ._single_flight import SingleFlight
+from ._timing import StageHistograms, SizeHistogram, stage_histograms
+from ._profiling import RequestProfiler
+from ._memory import MemoryStats, MemoryTracer
+from ._loop_lag import LoopLagMonitor, Priority
+
+
+@dataclass(frozen=True)
+class PagingConfig:
+    """Paging settings from :func:`SpanAPI.paged`."""
+
+    limit: int
+    """Max items a client can request."""
+    default_offset: int
+    """Offset used when the client does not pass one."""
+
+
+@dataclass
+class MethodStats:
+    """Counters for a :class:`SpanRoute` method, kept across recompiles."""
+
+    timeouts: int = 0
+    """Requests cancelled for running past their deadline."""
+    coalesced: int = 0
+    """Requests served the response of an identical request already in flight."""
+    stages: StageHistograms = field(default_factory=stage_histograms)
+    """Latency histograms of each stage of a request, by stage name."""
+    in_flight: int = 0
+    """Requests currently running."""
+    responses: Dict[Tuple[int, str], int] = field(default_factory=dict)
+    """
+    Responses by http status and api error code. The error code is ``''`` for
+    responses without an error.
+    """
+    request_bytes: SizeHistogram = field(default_factory=SizeHistogram)
+    """Sizes of request bodies, from their ``Content-Length`` header."""
+    response_bytes: SizeHistogram = field(default_factory=SizeHistogram)
+    """Sizes of encoded response bodies."""
+    slow: int = 0
+    """Requests logged by the API's slow request log."""
+    lag_shed: int = 0
+    """Requests shed with a 503 because the event loop was lagging."""
+    memory: MemoryStats = field(default_factory=MemoryStats)
+    """Allocations of requests, when the API's :class:`MemoryTracingPolicy` is set."""
+
+    def count_response(self, req: Request, resp: Response) -> None:
+        """Count the status, error code and body sizes of a finished request."""
+        key = (resp.status_code or 200, resp.headers.get("error-code", ""))
+        self.responses[key] = self.responses.get(key, 0) + 1
+
+        self.request_bytes.observe(content_length(req))
+        self.response_bytes.observe(len(resp.content or b""))
+
+
+@dataclass(frozen=True)
+class MethodPlan:
+    """
+    Everything needed to execute a :class:`SpanRoute` method, resolved once when the
+    route is compiled so requests do not have to walk through decorator layers.
+    """
+
+    endpoint: Callable
+    """Undecorated route method."""
+    name: str
+    """Qualified name of ``endpoint``."""
+    http_method: str
+    """Lower-case http method handled by ``endpoint``."""
+    param_info: List[ParamInfo]
+    """Loaders for path params passed to ``endpoint``."""
+    resources: List[Tuple[str, ResourcePool]]
+    """Resources checked out for ``endpoint``, by param name."""
+
+    req_schema: Optional[Union[Schema, MimeType]]
+    """Schema (or mimetype flag) used to load request media."""
+    req_load: LoadOptions
+    """Options for loading request media."""
+    resp_schema: Optional[Union[Schema, MimeType]]
+    """Schema (or mimetype flag) used to dump response media."""
+    resp_dump: DumpOptions
+    """Options for dumping response media."""
+    projection_builder: Optional[ProjectionBuilder]
+    """Builds projected response schemas. ``None`` if projection is not supported."""
+
+    paging: Optional[PagingConfig]
+    """Paging settings. ``None`` if the method is not paged."""
+
+    timeout: Optional[float]
+    """
+    Seconds ``endpoint`` may run before it is cancelled. ``None`` runs it until the
+    client's deadline, if any.
+    """
+
+    gates: Tuple[AdmissionGate, ...]
+    """
+    Concurrency limits a request must pass before running ``endpoint``: the method's
+    own limit first, then the API's.
+    """
+    single_flight: Optional[SingleFlight]
+    """
+    Coalesces concurrent identical requests into one execution. ``None`` if the method
+    is not decorated with :func:`SpanAPI.single_flight`.
+    """
+
+    decoders: DecoderIndexType
+    """Mimetype decoders for request media."""
+    encoders: EncoderIndexType
+    """Mimetype encoders for response media."""
+    error_log: ErrorLog
+    """Log for errors raised while executing the plan."""
+    stats: MethodStats
+    """Counters updated while executing the plan."""
+    timing: bool = True
+    """Time each stage of a request into ``stats.stages``."""
+    server_timing: bool = False
+    """Send stage timings in a ``Server-Timing`` response header."""
+    profiler: Optional[RequestProfiler] = None
+    """Profiles requests picked by the API's :class:`ProfilingPolicy`, if any."""
+    memory_tracer: Optional[MemoryTracer] = None
+    """Traces the allocations of requests into ``stats.memory``, if set."""
+    slow_log: Optional[SlowRequestLog] = None
+    """Logs requests slower than the API's :class:`SlowRequestPolicy`, if set."""
+    priority: Priority = Priority.NORMAL
+    """Priority of requests when they are shed for event loop lag."""
+    lag_monitor: Optional[LoopLagMonitor] = None
+    """
+    Sheds requests while the event loop lags, if the API's :class:`LoopLagPolicy` sets
+    shed thresholds.
+    """
+
+
+def compile_method_plan(
+    endpoint: Callable,
+    http_method: str,
+    param_info: List[ParamInfo],
+    resources: List[Tuple[str, ResourcePool]],
+    decoders: DecoderIndexType,
+    encoders: EncoderIndexType,
+    error_log: ErrorLog,
+    api_gate: Optional[AdmissionGate] = None,
+    doc_info: Optional[DocInfo] = None,
+    stats: Optional[MethodStats] = None,
+    timing: bool = True,
+    server_timing: bool = False,
+    profiler: Optional[RequestProfiler] = None,
+    memory_tracer: Optional[MemoryTracer] = None,
+    slow_log: Optional[SlowRequestLog] = None,
+    lag_monitor: Optional[LoopLagMonitor] = None,
+) -> MethodPlan:
+    """
+    Flattens the settings :func:`SpanAPI.use_schema` and :func:`SpanAPI.paged` attach
+    to ``endpoint`` into a :class:`MethodPlan`. A ``timeout`` passed to
+    :func:`SpanAPI.use_schema` takes precedence over the one in ``doc_info``.
+
+    :raises ValueError: If a method other than GET is marked as single-flight.
+    """
+    schema_info: Optional[RouteSchemaInfo] = getattr(endpoint, "schema_info", None)
+
+    if schema_info is not None:
+        req_schema = schema_info.req_schema
+        req_load = schema_info.req_load
+        resp_schema = schema_info.resp_schema
+        resp_dump = schema_info.resp_dump
+    else:
+        req_schema = None
+        req_load = LoadOptions.IGNORE
+        resp_schema = None
+        resp_dump = DumpOptions.IGNORE
+
+    if getattr(endpoint, "paged", False):
+        paging: Optional[PagingConfig] = PagingConfig(
+            limit=getattr(endpoint, "paged_limit"),
+            default_offset=getattr(endpoint, "paged_offset"),
+        )
+    else:
+        paging = None
+
+    timeout = None if schema_info is None else schema_info.timeout
+    if timeout is None and doc_info is not None:
+        timeout = doc_info.timeout
+
+    if getattr(endpoint, "single_flight", False):
+        if http_method != "get":
+            raise ValueError(
+                f"{endpoint.__qualname__}: only GET methods can be single-flight"
+            )
+        single_flight: Optional[SingleFlight] = SingleFlight()
+    else:
+        single_flight = None
+
+    gates = tuple(
+        gate
+        for gate in (getattr(endpoint, "admission_gate", None), api_gate)
+        if gate is not None
+    )
+
+    if lag_monitor is not None and not lag_monitor.sheds:
+        lag_monitor = None
+
+    return MethodPlan(
+        endpoint=endpoint,
+        name=endpoint.__qualname__,
+        http_method=http_method,
+        param_info=param_info,
+        resources=resources,
+        req_schema=req_schema,
+        req_load=req_load,
+        resp_schema=resp_schema,
+        resp_dump=resp_dump,
+        projection_builder=getattr(endpoint, "projection_builder", None),
+        paging=paging,
+        timeout=timeout,
+        gates=gates,
+        single_flight=single_flight,
+        decoders=decoders,
+        encoders=encoders,
+        error_log=error_log,
+        stats=MethodStats() if stats is None else stats,
+        timing=timing or server_timing,
+        server_timing=server_timing,
+        profiler=profiler,
+        memory_tracer=memory_tracer,
+        slow_log=slow_log,
+        priority=getattr(endpoint, "shed_priority", Priority.NORMAL),
+        lag_monitor=lag_monitor,
+    )
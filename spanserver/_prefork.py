@@ -0,0 +1,302 @@
+import gc
+import logging
+import os
+import select
+import signal
+import socket
+import time
+import uvicorn
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from ._api import SpanAPI
+
+
+logger = logging.getLogger("spanserver.prefork")
+
+
+@dataclass(frozen=True)
+class WorkerStats:
+    """Memory use of a worker process."""
+
+    pid: int
+    """Process id of the worker."""
+    rss: Optional[int]
+    """Resident set size in bytes. ``None`` if it can't be read on this platform."""
+    pss: Optional[int]
+    """
+    Proportional set size in bytes: pages shared with the parent and other workers are
+    split between them. ``None`` if it can't be read on this platform.
+    """
+
+
+def _read_proc_kb(path: str, field: str) -> Optional[int]:
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def worker_stats(pid: int) -> WorkerStats:
+    """Read the memory use of process ``pid`` from ``/proc``."""
+    return WorkerStats(
+        pid=pid,
+        rss=_read_proc_kb(f"/proc/{pid}/status", "VmRSS"),
+        pss=_read_proc_kb(f"/proc/{pid}/smaps_rollup", "Pss"),
+    )
+
+
+def _gc_call(name: str) -> None:
+    # gc.freeze() and gc.unfreeze() were added in python 3.7.
+    method = getattr(gc, name, None)
+    if method is not None:
+        method()
+
+
+def warm_up(api: SpanAPI) -> None:
+    """
+    Do the work every worker would otherwise repeat at startup: compile route plans
+    and render the OpenAPI spec.
+    """
+    api.compile()
+
+    if hasattr(api, "openapi"):
+        api.openapi.rendered
+
+
+class PreforkServer:
+    """
+    Runs a :class:`SpanAPI` in ``workers`` processes forked from a warmed-up parent.
+
+    Routes are compiled and the OpenAPI spec is rendered once in the parent. The
+    parent's heap is then frozen with :func:`gc.freeze`, so the garbage collector in
+    the workers does not touch -- and copy -- the pages they share with the parent.
+    All workers accept connections from the same listening socket.
+
+    Sending ``SIGHUP`` to the parent gracefully restarts the workers: a new set is
+    forked, and the old set is stopped once the new one is ready. ``SIGINT`` and
+    ``SIGTERM`` stop the workers, letting open connections finish first. Workers
+    that die unexpectedly are replaced.
+
+    :param api: api to serve.
+    :param workers: number of worker processes.
+    :param host: address to bind.
+    :param port: port to bind. ``0`` picks a free port.
+    :param ready_timeout: seconds to wait for workers to finish starting up.
+    :param uvicorn_options: passed on to ``uvicorn.Config`` in each worker.
+
+    :raises RuntimeError: If the platform does not support ``os.fork``.
+    """
+
+    def __init__(
+        self,
+        api: SpanAPI,
+        workers: int = 2,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        ready_timeout: float = 30.0,
+        **uvicorn_options: Any,
+    ) -> None:
+        if not hasattr(os, "fork"):
+            raise RuntimeError("PreforkServer requires os.fork")
+
+        self.api: SpanAPI = api
+        self.workers: int = workers
+        self.host: str = host
+        self.port: int = port
+        self.ready_timeout: float = ready_timeout
+        self.uvicorn_options: Dict[str, Any] = uvicorn_options
+
+        self.startup_time: Optional[float] = None
+        """Seconds from :func:`PreforkServer.start` until all workers were ready."""
+
+        self.socket: Optional[socket.socket] = None
+        self._pids: List[int] = list()
+        self._should_exit = False
+        self._should_restart = False
+
+    @property
+    def pids(self) -> List[int]:
+        """Process ids of the current workers."""
+        return list(self._pids)
+
+    @property
+    def bound_port(self) -> int:
+        """Port the listening socket is bound to."""
+        if self.socket is None:
+            raise RuntimeError("server is not started")
+        return self.socket.getsockname()[1]
+
+    def stats(self) -> List[WorkerStats]:
+        """Memory use of the current workers."""
+        return [worker_stats(pid) for pid in self._pids]
+
+    def start(self) -> None:
+        """
+        Warm up the api, bind the socket and fork the workers. Returns once every
+        worker has finished starting up.
+        """
+        started = time.perf_counter()
+
+        warm_up(self.api)
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(2048)
+        self.socket.set_inheritable(True)
+
+        # Move everything allocated so far into the permanent generation so it is
+        # never scanned -- and so never copied -- by the workers' garbage collectors.
+        gc.collect()
+        _gc_call("freeze")
+
+        self._pids = self._fork_workers(self.workers)
+
+        self.startup_time = time.perf_counter() - started
+        self._report("started", self.startup_time)
+
+    def stop(self) -> None:
+        """Stop all workers, waiting for them to finish open connections."""
+        self._stop_workers(self._pids)
+        self._pids = list()
+
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+        _gc_call("unfreeze")
+
+    def restart(self) -> None:
+        """Fork a new set of workers, then stop the current ones once it is ready."""
+        started = time.perf_counter()
+
+        old_pids = self._pids
+        self._pids = self._fork_workers(self.workers)
+        self._stop_workers(old_pids)
+
+        self._report("restarted", time.perf_counter() - started)
+
+    def serve_forever(self) -> None:
+        """Start the workers and supervise them until ``SIGINT`` or ``SIGTERM``."""
+        signal.signal(signal.SIGINT, self._handle_exit)
+        signal.signal(signal.SIGTERM, self._handle_exit)
+        signal.signal(signal.SIGHUP, self._handle_restart)
+
+        self.start()
+        try:
+            while not self._should_exit:
+                if self._should_restart:
+                    self._should_restart = False
+                    self.restart()
+                self._replace_dead_workers()
+                time.sleep(0.1)
+        finally:
+            self.stop()
+
+    def _handle_exit(self, sig: int, frame: Any) -> None:
+        self._should_exit = True
+
+    def _handle_restart(self, sig: int, frame: Any) -> None:
+        self._should_restart = True
+
+    def _replace_dead_workers(self) -> None:
+        for pid in list(self._pids):
+            try:
+                done, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done, status = pid, 0
+
+            if done == 0:
+                continue
+
+            logger.warning(f"worker [{pid}] exited with status {status}, replacing")
+            self._pids.remove(pid)
+            self._pids.extend(self._fork_workers(1))
+
+    def _fork_workers(self, count: int) -> List[int]:
+        ready_read, ready_write = os.pipe()
+        pids: List[int] = list()
+
+        for _ in range(count):
+            pid = os.fork()
+            if pid == 0:
+                os.close(ready_read)
+                self._run_worker(ready_write)
+            pids.append(pid)
+
+        os.close(ready_write)
+        try:
+            self._wait_ready(ready_read, count)
+        finally:
+            os.close(ready_read)
+
+        return pids
+
+    def _wait_ready(self, ready_read: int, count: int) -> None:
+        deadline = time.monotonic() + self.ready_timeout
+        ready = 0
+        while ready < count:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"{count - ready} worker(s) did not start in time")
+
+            readable, _, _ = select.select([ready_read], [], [], remaining)
+            if not readable:
+                continue
+
+            data = os.read(ready_read, count)
+            if not data:
+                raise RuntimeError("worker(s) exited during startup")
+            ready += len(data)
+
+    def _run_worker(self, ready_write: int) -> None:
+        """Runs in the forked child. Never returns."""
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGHUP, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            self.api.reset_after_fork()
+
+            def notify_ready() -> None:
+                os.write(ready_write, b"1")
+                os.close(ready_write)
+
+            self.api.add_event_handler("startup", notify_ready)
+
+            config = uvicorn.Config(self.api, **self.uvicorn_options)
+            server = uvicorn.Server(config)
+            server.run(sockets=[self.socket])
+        except BaseException:
+            logger.exception("worker crashed")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def _stop_workers(self, pids: List[int]) -> None:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        for pid in pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+
+    def _report(self, action: str, elapsed: float) -> None:
+        logger.info(
+            f"{len(self._pids)} workers {action} on {self.host}:{self.bound_port} "
+            f"in {elapsed:.3f}s"
+        )
+        for stats in self.stats():
+            rss = "?" if stats.rss is None else f"{stats.rss / 2 ** 20:.1f}MiB"
+            pss = "?" if stats.pss is None else f"{stats.pss / 2 ** 20:.1f}MiB"
+            logger.info(f"worker [{stats.pid}] rss={rss} pss={pss}")
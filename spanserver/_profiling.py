@@ -0,0 +1,109 @@
+import asyncio
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Coroutine, Optional, Union
+
+from ._req_resp import Request, Response
+from ._stepping import SteppedCoroutine
+
+
+PROFILE_ID_HEADER = "profile-id"
+"""Response header with the id of the profile taken for a request."""
+
+
+@dataclass
+class ProfilingPolicy:
+    """
+    Settings for profiling individual requests to :class:`SpanRoute` methods. Only the
+    profiled request's own code is profiled: the profiler is paused whenever the
+    request awaits, so other requests running on the event loop are not captured.
+    """
+
+    token: Optional[str] = None
+    """
+    Requests with this value in the ``header`` header are profiled. ``None`` turns off
+    header-triggered profiling.
+    """
+
+    header: str = "x-spanserver-profile"
+    """Request header that triggers profiling."""
+
+    sample_rate: float = 0.0
+    """Fraction of all requests profiled and written to ``output_dir``."""
+
+    output_dir: Optional[Union[str, "os.PathLike[str]"]] = None
+    """
+    Directory profiles are written to as ``'<profile id>.prof'`` files, readable with
+    :mod:`pstats` or snakeviz.
+    """
+
+    respond: bool = False
+    """
+    Replace the body of header-triggered responses with a text report of the
+    profile, sorted by cumulative time.
+    """
+
+    report_lines: int = 40
+    """Number of functions listed in text reports."""
+
+
+class RequestProfiler:
+    """Decides which requests to profile, and runs them under :mod:`cProfile`."""
+
+    def __init__(self, policy: ProfilingPolicy) -> None:
+        if policy.sample_rate and policy.output_dir is None:
+            raise ValueError("output_dir must be set to sample requests")
+
+        self.policy: ProfilingPolicy = policy
+
+    def requested(self, req: Request) -> bool:
+        """Whether ``req`` carries the authorized profiling header."""
+        token = self.policy.token
+        if token is None:
+            return False
+
+        value = req.headers.get(self.policy.header)
+        return value is not None and hmac.compare_digest(value, token)
+
+    def sampled(self) -> bool:
+        return self.policy.sample_rate > 0 and random.random() < self.policy.sample_rate
+
+    async def run(
+        self, name: str, call: Coroutine[Any, Any, None], resp: Response, respond: bool,
+    ) -> None:
+        """Run ``call`` under a profiler, then save or report the profile."""
+        profiler = cProfile.Profile()
+        try:
+            await SteppedCoroutine(call, profiler.enable, profiler.disable)
+        finally:
+            profile_id = f"{name}-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+            resp.headers[PROFILE_ID_HEADER] = profile_id
+            await self._save(profiler, profile_id)
+
+            if respond:
+                resp.status_code = 200
+                # Setting text also sets the mimetype, whatever the route returned.
+                resp.text = self.report(profiler)
+
+    async def _save(self, profiler: cProfile.Profile, profile_id: str) -> None:
+        output_dir = self.policy.output_dir
+        if output_dir is None:
+            return
+
+        path = os.path.join(output_dir, f"{profile_id}.prof")
+        # Writing the file is blocking I/O, so it is kept off the event loop.
+        await asyncio.get_event_loop().run_in_executor(None, profiler.dump_stats, path)
+
+    def report(self, profiler: cProfile.Profile) -> str:
+        """Text report of ``profiler``'s stats, sorted by cumulative time."""
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats("cumulative").print_stats(self.policy.report_lines)
+        return stream.getvalue()
@@ -4,6 +4,8 @@ import responder.api as resp_api  # noqa: F401
 import responder.routes as resp_routes  # noqa: F401
 import functools
 import marshmallow
+import time
+import tracemalloc
 import uuid
 from marshmallow import Schema, ValidationError
 from typing import (
@@ -29,7 +31,6 @@ from spantools import (
     PagingResp,
     MimeTypeTolerant,
     DecoderIndexType,
-    EncoderIndexType,
     encode_content,
 )
 from spantools import ContentDecodeError, ContentEncodeError, ContentTypeUnknownError
@@ -64,10 +65,13 @@ class Request(_ResponderRequest, Generic[MediaType, LoadedType]):
         self._media: Optional[Union[MediaType, _NotLoadedFlag]] = NOT_LOADED
         self._media_loaded: Optional[Union[LoadedType, _NotLoadedFlag]] = NOT_LOADED
         self._paging: Optional[PagingReq] = None
-        self._decoders: Optional[DecoderIndexType] = None
-        self._schema: Optional[Schema] = None
-        self._load_options: LoadOptions = LoadOptions.IGNORE
         self._projection: Optional[Dict[str, int]] = None
+        # Execution plan of the route method handling this request, if any.
+        self._plan: Optional["MethodPlan"] = None
+        # Seconds spent decoding and loading media, reported as its own timing stage.
+        self._decode_time: float = 0.0
+        # Counts the allocations of the request when memory tracing is on.
+        self._allocations: Optional["AllocationMeter"] = None
 
     @property
     def mimetype(self) -> Union[str, MimeType]:
@@ -117,6 +121,16 @@ class Request(_ResponderRequest, Generic[MediaType, LoadedType]):
 
         return self._projection
 
+    def _media_settings(
+        self,
+    ) -> Tuple[
+        Optional[Union[Schema, MimeType]], LoadOptions, Optional[DecoderIndexType]
+    ]:
+        plan = self._plan
+        if plan is None:
+            return None, LoadOptions.IGNORE, None
+        return plan.req_schema, plan.req_load, plan.decoders
+
     async def media(self) -> Optional[MediaType]:
         """
         Replacement for request's ``Request.media()``. Can handle bson with no special
@@ -126,10 +140,12 @@ class Request(_ResponderRequest, Generic[MediaType, LoadedType]):
             self._media = cast(Optional[MediaType], self._media)
             return self._media
 
-        if self._load_options is LoadOptions.IGNORE:
+        schema_set, load_options, decoders = self._media_settings()
+
+        if load_options is LoadOptions.IGNORE:
             schema = None
         else:
-            schema = self._schema
+            schema = schema_set
 
         if isinstance(schema, MimeType):
             mimetype: MimeTypeTolerant = schema
@@ -141,16 +157,18 @@ class Request(_ResponderRequest, Generic[MediaType, LoadedType]):
         if content == b"":
             content = None
 
-        if content is None and self._schema is None:
+        if content is None and schema_set is None:
             return None
 
+        started = time.perf_counter()
+        allocated = 0 if self._allocations is None else _traced_memory()
         try:
             loaded, mimetype_decoded = decode_content(  # type: ignore
                 content=content,
                 mimetype=mimetype,
                 data_schema=schema,
                 allow_sniff=True,
-                decoders=self._decoders,
+                decoders=decoders,
             )
         except ValidationError as error:
             raise RequestValidationError(
@@ -158,8 +176,12 @@ class Request(_ResponderRequest, Generic[MediaType, LoadedType]):
             )
         except (ContentDecodeError, ContentTypeUnknownError):
             raise RequestValidationError("Media could not be decoded.")
+        finally:
+            self._decode_time += time.perf_counter() - started
+            if self._allocations is not None:
+                self._allocations.decoded += _traced_memory() - allocated
 
-        if self._load_options is LoadOptions.VALIDATE_ONLY:
+        if load_options is LoadOptions.VALIDATE_ONLY:
             loaded = mimetype_decoded
 
         self._media = mimetype_decoded
@@ -177,6 +199,18 @@ class Request(_ResponderRequest, Generic[MediaType, LoadedType]):
         return self._media_loaded
 
 
+def content_length(req: Request) -> int:
+    """Size of the request body from its ``Content-Length`` header, ``0`` if unset."""
+    try:
+        return int(req.headers.get("content-length", 0))
+    except ValueError:
+        return 0
+
+
+def _traced_memory() -> int:
+    return tracemalloc.get_traced_memory()[0]
+
+
 class ProjectionBuilder:
     """Handles building projection schemas for a route."""
 
@@ -250,15 +284,24 @@ class Response(_ResponderResponse):
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         self.mimetype: MimeTypeTolerant = None
         super().__init__(*args, **kwargs)
-        self._req_accept: MimeTypeTolerant = None
         self._paging: Optional[PagingResp] = None
-        self._encoders: Optional[EncoderIndexType] = None
-        self._schema: Optional[Schema] = None
-        self._dump_options: DumpOptions = DumpOptions.IGNORE
         self._projection: Dict[str, int] = dict()
-        self._projection_builder: Optional[ProjectionBuilder] = None
+        # Execution plan of the route method handling this request, if any.
+        self._plan: Optional["MethodPlan"] = None
         self.apply_projection: bool = True
 
+    @property
+    def _schema(self) -> Optional[Union[Schema, MimeType]]:
+        return None if self._plan is None else self._plan.resp_schema
+
+    @property
+    def _dump_options(self) -> DumpOptions:
+        return DumpOptions.IGNORE if self._plan is None else self._plan.resp_dump
+
+    @property
+    def _projection_builder(self) -> Optional["ProjectionBuilder"]:
+        return None if self._plan is None else self._plan.projection_builder
+
     @property
     def paging(self) -> PagingResp:
         """
@@ -286,7 +329,7 @@ class Response(_ResponderResponse):
                 headers=self.headers,
                 data_schema=schema,
                 validate=validate,
-                encoders=self._encoders,
+                encoders=None if self._plan is None else self._plan.encoders,
             )
         except ValidationError as error:
             self.media = None
@@ -300,18 +343,19 @@ class Response(_ResponderResponse):
         self.content = content
 
     def _resp_calculate_mimetype_and_schema(self) -> Optional[Schema]:
-        accept = self._req_accept
+        accept = self.req.headers.get("Accept")
         if accept == "*/*":
             accept = None
 
         if accept is not None:
             self.mimetype = accept
 
-        if isinstance(self._schema, MimeType):
+        schema_set = self._schema
+        if isinstance(schema_set, MimeType):
             schema = None
-            self.mimetype = self._schema
+            self.mimetype = schema_set
         else:
-            schema = self._schema
+            schema = schema_set
 
         return schema
 
@@ -354,6 +398,12 @@ class Response(_ResponderResponse):
         return content, schema, validate
 
 
+type_helper = False
+if type_helper:
+    from ._plan import MethodPlan  # noqa: F401
+    from ._memory import AllocationMeter  # noqa: F401
+
+
 # We need to monkey-patch responder's Request class with our own subclass of it so we
 # can add bson support.
 responder.models.Request = Request
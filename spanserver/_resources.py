@@ -0,0 +1,203 @@
+import asyncio
+import inspect
+import time
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
+
+
+ResourceT = TypeVar("ResourceT")
+ResourceFactory = Callable[[], Union[ResourceT, Awaitable[ResourceT]]]
+ResourceCloser = Callable[[ResourceT], Union[None, Awaitable[None]]]
+
+
+async def _maybe_await(value: Any) -> Any:
+    if inspect.isawaitable(value):
+        value = await value
+    return value
+
+
+@dataclass
+class ResourceStats:
+    """Usage counters for a resource registered with :func:`SpanAPI.add_resource`."""
+
+    size: Optional[int]
+    """Number of pooled instances. ``None`` for a single shared instance."""
+    in_use: int = 0
+    """Instances currently checked out."""
+    peak_in_use: int = 0
+    """Most instances checked out at once."""
+    checkouts: int = 0
+    """Total checkouts."""
+    saturated_checkouts: int = 0
+    """Checkouts that found every instance in use and had to wait."""
+    wait_time: float = 0.0
+    """Total seconds spent waiting for an instance."""
+    max_wait: float = 0.0
+    """Longest wait for an instance in seconds."""
+
+
+class ResourcePool(Generic[ResourceT]):
+    """
+    Instances of a resource created on startup and closed on shutdown. Pooled
+    instances are checked out for the duration of a route method. A pool without a
+    ``size`` holds one instance shared by all requests, for resources like http
+    sessions that manage their own connection pool.
+    """
+
+    def __init__(
+        self,
+        resource_type: Type[ResourceT],
+        factory: ResourceFactory,
+        size: Optional[int],
+        close: Optional[ResourceCloser],
+    ) -> None:
+        if size is not None and size < 1:
+            raise ValueError("resource pool size must be at least 1")
+
+        self.resource_type: Type[ResourceT] = resource_type
+        self.factory: ResourceFactory = factory
+        self.size: Optional[int] = size
+        self.closer: Optional[ResourceCloser] = close
+        self.stats: ResourceStats = ResourceStats(size=size)
+
+        self._instances: List[ResourceT] = list()
+        self._idle: Optional["asyncio.Queue[ResourceT]"] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.started: bool = False
+
+    async def start(self) -> None:
+        """Create the pool's instances. Does nothing if already started."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self.started:
+                return
+
+            count = 1 if self.size is None else self.size
+            self._instances = [await _maybe_await(self.factory()) for _ in range(count)]
+
+            if self.size is not None:
+                self._idle = asyncio.Queue()
+                for instance in self._instances:
+                    self._idle.put_nowait(instance)
+
+            self.started = True
+
+    async def close(self) -> None:
+        """Close every instance with the pool's ``close`` function."""
+        if not self.started:
+            return
+
+        instances = self._instances
+        self._instances = list()
+        self._idle = None
+        self.started = False
+
+        if self.closer is not None:
+            for instance in instances:
+                await _maybe_await(self.closer(instance))
+
+    async def checkout(self) -> ResourceT:
+        """
+        Get an instance, waiting for one to be released if all are in use. The pool is
+        started first if it has not been, for instance when requests are made without
+        running the ASGI lifespan.
+        """
+        if not self.started:
+            await self.start()
+
+        stats = self.stats
+        stats.checkouts += 1
+
+        if self._idle is None:
+            return self._instances[0]
+
+        if self._idle.empty():
+            stats.saturated_checkouts += 1
+            started = time.perf_counter()
+            instance = await self._idle.get()
+            waited = time.perf_counter() - started
+            stats.wait_time += waited
+            stats.max_wait = max(stats.max_wait, waited)
+        else:
+            instance = self._idle.get_nowait()
+
+        stats.in_use += 1
+        stats.peak_in_use = max(stats.peak_in_use, stats.in_use)
+        return instance
+
+    def release(self, instance: ResourceT) -> None:
+        """Return a checked out instance to the pool."""
+        if self._idle is None:
+            return
+
+        self.stats.in_use -= 1
+        self._idle.put_nowait(instance)
+
+
+class ResourceRegistry:
+    """Resources available to route methods, by type."""
+
+    def __init__(self) -> None:
+        self.pools: Dict[type, ResourcePool] = dict()
+
+    def add(
+        self,
+        resource_type: type,
+        factory: ResourceFactory,
+        size: Optional[int] = None,
+        close: Optional[ResourceCloser] = None,
+    ) -> ResourcePool:
+        if resource_type in self.pools:
+            raise ValueError(
+                f"resource {resource_type.__qualname__} already registered"
+            )
+
+        pool: ResourcePool = ResourcePool(resource_type, factory, size, close)
+        self.pools[resource_type] = pool
+        return pool
+
+    def params_for(self, endpoint: Callable) -> List[Tuple[str, ResourcePool]]:
+        """
+        Keyword-only params of ``endpoint`` annotated with a registered resource type,
+        as ``(param name, pool)`` pairs.
+        """
+        if not self.pools:
+            return list()
+
+        params = inspect.signature(endpoint).parameters
+        return [
+            (param.name, self.pools[param.annotation])
+            for param in params.values()
+            if param.kind is param.KEYWORD_ONLY and param.annotation in self.pools
+        ]
+
+    async def start(self) -> None:
+        """Create the instances of every registered resource."""
+        for pool in self.pools.values():
+            await pool.start()
+
+    async def close(self) -> None:
+        """Close the instances of every registered resource."""
+        for pool in self.pools.values():
+            await pool.close()
+
+    def stats(self) -> Dict[str, ResourceStats]:
+        """Usage counters for each resource, by type name."""
+        return {
+            resource_type.__qualname__: pool.stats
+            for resource_type, pool in self.pools.items()
+        }
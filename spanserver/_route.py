@@ -1,13 +1,21 @@
 import inspect
+import uuid
 from typing_inspect_isle import is_union_type, get_args
 from responder import Response, Request
-from typing import Any, TypeVar, Generic, List, Callable
+from typing import Any, TypeVar, Generic, List, Callable, Dict, FrozenSet, Optional
 
-from spantools import DecoderIndexType, EncoderIndexType
+from spantools import DecoderIndexType, EncoderIndexType, Error
 from spantools.errors_api import InvalidMethodError
 
-from ._method_wrapper import _handle_route_error, method_wrapper
-from ._openapi import ParamTypes, ParamInfo, DocInfo
+from ._method_wrapper import method_wrapper
+from ._doc_info import ParamTypes, ParamInfo, DocInfo
+from ._logging import ErrorLog, SlowRequestLog
+from ._plan import MethodPlan, MethodStats, compile_method_plan
+from ._resources import ResourceRegistry
+from ._admission import AdmissionGate
+from ._profiling import RequestProfiler
+from ._memory import MemoryTracer
+from ._loop_lag import LoopLagMonitor
 
 
 ParamType = TypeVar("ParamType", bound=type)
@@ -20,17 +28,85 @@ class SpanRoute:
     documentation for more information on class-based routing.
     """
 
+    _allowed_methods: FrozenSet[str] = frozenset()
+    """Lower-case http methods with an ``on_`` handler."""
+    _allow_header: str = "OPTIONS"
+    """Value of the ``Allow`` header sent with 405 and OPTIONS responses."""
+    _method_error_headers: Dict[str, Dict[str, str]] = dict()
+    """Static 405 error headers, cached per unsupported http method."""
+    _raw_methods: Dict[str, Callable]
+    """Original ``on_`` methods defined on this class, by http method."""
+    _kw_params: Dict[str, List[ParamInfo]]
+    """Keyword-only params of each of ``_raw_methods``: path params and resources."""
+    _doc_params: Dict[str, List[ParamInfo]]
+    """Request params documented by the user for each of ``_raw_methods``."""
+    _param_info: Dict[str, List[ParamInfo]]
+    """Path param loaders for each of ``_raw_methods``."""
+    _plans: Dict[str, MethodPlan]
+    """Compiled execution plans, by http method."""
+    _stats: Dict[str, MethodStats]
+    """Counters for each of ``_raw_methods``, shared by every plan compiled for it."""
+
     async def on_request(self, req: Request, resp: Response, **kwargs: Any) -> None:
-        if not hasattr(self, f"on_{req.method}"):
-            error = InvalidMethodError(
-                f"'{req.full_url}' does not support {req.method.upper()}"
+        method = req.method
+        if method in self._allowed_methods:
+            return
+
+        # Unsupported methods are answered from the precomputed method table. Since
+        # there is no ``on_`` handler for them, responder will not call anything else.
+        resp.headers["Allow"] = self._allow_header
+        resp.content = b""
+
+        if method == "options" or (method == "head" and "get" in self._allowed_methods):
+            resp.status_code = 204 if method == "options" else 200
+            return
+
+        resp.status_code = InvalidMethodError.http_code
+        resp.headers.update(self._invalid_method_headers(method))
+        resp.headers["error-id"] = str(uuid.uuid4())
+
+    @classmethod
+    def _invalid_method_headers(cls, method: str) -> Dict[str, str]:
+        try:
+            return cls._method_error_headers[method]
+        except KeyError:
+            pass
+
+        headers: Dict[str, str] = dict()
+        error_data, _ = Error.from_exception(
+            InvalidMethodError(
+                f"{method.upper()} is not supported. Allowed: {cls._allow_header}"
             )
-            _handle_route_error(error, req, resp)
+        )
+        error_data.to_headers(headers)
+        # The id is set per-response.
+        headers.pop("error-id")
+
+        cls._method_error_headers[method] = headers
+        return headers
+
+    @classmethod
+    def _build_method_table(cls) -> None:
+        methods = frozenset(
+            name[3:]
+            for name in dir(cls)
+            if name.startswith("on_") and name != "on_request"
+        )
+
+        allowed = set(methods) | {"options"}
+        if "get" in methods:
+            allowed.add("head")
+
+        cls._allowed_methods = methods
+        cls._allow_header = ", ".join(sorted(m.upper() for m in allowed))
+        cls._method_error_headers = dict()
 
     def __init_subclass__(cls, **kwargs: Any) -> None:
         if cls.Document is SpanRoute.Document:
             cls.Document = type("Document", (object,), {})  # type: ignore
 
+        cls._build_method_table()
+
         for method in cls.__dict__:
             if not method.startswith("on_"):
                 continue
@@ -42,15 +118,82 @@ class SpanRoute:
 
     @classmethod
     def wrap_methods(
-        cls, decoders: DecoderIndexType, encoders: EncoderIndexType
+        cls,
+        decoders: DecoderIndexType,
+        encoders: EncoderIndexType,
+        error_log: ErrorLog,
+        resources: ResourceRegistry,
+        api_gate: Optional[AdmissionGate] = None,
+        timing: bool = True,
+        server_timing: bool = False,
+        profiler: Optional[RequestProfiler] = None,
+        memory_tracer: Optional[MemoryTracer] = None,
+        slow_log: Optional[SlowRequestLog] = None,
+        lag_monitor: Optional[LoopLagMonitor] = None,
     ) -> None:
+        """
+        Compiles each ``on_`` method into a :class:`MethodPlan` and replaces it with a
+        single coroutine that executes the plan. Can be called again to recompile the
+        original methods with new settings.
+
+        Keyword-only params annotated with a type from ``resources`` are injected
+        resources. All other keyword-only params are path params.
+        """
+        if "_raw_methods" not in cls.__dict__:
+            cls._collect_methods()
+
+        cls._param_info = dict()
+        cls._plans = dict()
+        for http_method, method in cls._raw_methods.items():
+            method_resources = resources.params_for(method)
+            resource_names = {name for name, _ in method_resources}
+            path_params = [
+                info
+                for info in cls._kw_params[http_method]
+                if info.name not in resource_names
+            ]
+
+            cls._param_info[http_method] = path_params
+            doc_config: DocInfo = getattr(cls.Document, http_method)
+            doc_config.req_params = cls._doc_params[http_method] + path_params
+
+            plan = compile_method_plan(
+                method,
+                http_method,
+                path_params,
+                method_resources,
+                decoders=decoders,
+                encoders=encoders,
+                error_log=error_log,
+                api_gate=api_gate,
+                doc_info=doc_config,
+                stats=cls._stats[http_method],
+                timing=timing,
+                server_timing=server_timing,
+                profiler=profiler,
+                memory_tracer=memory_tracer,
+                slow_log=slow_log,
+                lag_monitor=lag_monitor,
+            )
+            cls._plans[http_method] = plan
+            setattr(cls, f"on_{http_method}", method_wrapper(plan))
+
+        cls._build_method_table()
+
+    @classmethod
+    def _collect_methods(cls) -> None:
+        cls._raw_methods = dict()
+        cls._kw_params = dict()
+        cls._doc_params = dict()
+        cls._stats = dict()
+
         request_methods = tuple(
             item
             for item in cls.__dict__.items()  # type: ignore
             if item[0].startswith("on_")
         )
 
-        # wrap request method in error-handler and pull out documentation config info
+        # pull out documentation config info
         for name, method in request_methods:
             if not callable(method):
                 raise TypeError(f"method {name} not callable")
@@ -58,14 +201,10 @@ class SpanRoute:
             http_method = name.replace("on_", "")
             doc_config: DocInfo = getattr(cls.Document, http_method)
 
-            url_param_info = get_url_param_loaders(method)
-            doc_config.req_params.extend(url_param_info)
-
-            wrapped = method_wrapper(
-                method, url_param_info, decoders=decoders, encoders=encoders
-            )
-
-            setattr(cls, f"on_{http_method}", wrapped)
+            cls._raw_methods[http_method] = method
+            cls._kw_params[http_method] = get_url_param_loaders(method)
+            cls._doc_params[http_method] = list(doc_config.req_params)
+            cls._stats[http_method] = MethodStats()
 
     class Document:
         pass
@@ -56,6 +56,9 @@ class RouteSchemaInfo:
     resp_dump: DumpOptions
     """Options for dumping resp schemas."""
 
+    timeout: Optional[float] = None
+    """Seconds the route method may run before it is cancelled."""
+
     def __post_init__(self, _req: RouteSchemaType, _resp: RouteSchemaType) -> None:
         # Cache isinstance info for schemas
         self.req_schema = _req
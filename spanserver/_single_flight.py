@@ -0,0 +1,83 @@
+import asyncio
+import functools
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from urllib.parse import parse_qsl
+
+from ._req_resp import Request, Response
+
+
+@dataclass(frozen=True)
+class ResponseSnapshot:
+    """Encoded response of a request, shared with coalesced requests."""
+
+    status_code: int
+    """Http status code."""
+    headers: Dict[str, str]
+    """Response headers, including error and paging headers."""
+    content: bytes
+    """Encoded body from :func:`Response._dump_media`."""
+
+    @classmethod
+    def from_response(cls, resp: Response) -> "ResponseSnapshot":
+        return cls(
+            status_code=resp.status_code,
+            headers=dict(resp.headers),
+            content=resp.content or b"",
+        )
+
+    def to_response(self, resp: Response) -> None:
+        resp.status_code = self.status_code
+        resp.headers.update(self.headers)
+        resp.content = self.content
+
+
+def flight_key(req: Request, path_params: Dict[str, Any]) -> Hashable:
+    """
+    Key of requests that can share a response: path params, query params (which
+    include paging and projection), and the ``Accept`` header the response mimetype is
+    negotiated from.
+    """
+    return (
+        tuple(sorted(path_params.items())),
+        tuple(sorted(parse_qsl(req.url.query, keep_blank_values=True))),
+        req.headers.get("accept"),
+    )
+
+
+class SingleFlight:
+    """
+    Runs one execution of a route method for concurrent requests with the same
+    :func:`flight_key`. The execution runs in its own task, so it finishes for the
+    requests still waiting on it if the request that started it disconnects.
+    """
+
+    def __init__(self) -> None:
+        self._flights: Dict[Hashable, "asyncio.Future[ResponseSnapshot]"] = dict()
+
+    @property
+    def in_flight(self) -> int:
+        """Executions currently running."""
+        return len(self._flights)
+
+    async def run(
+        self, key: Hashable, execute: Callable[[], Awaitable[ResponseSnapshot]]
+    ) -> Tuple[ResponseSnapshot, bool]:
+        """
+        Await the running execution for ``key``, or start one with ``execute``.
+
+        :return: the response, and whether this call started the execution.
+        """
+        flight = self._flights.get(key)
+        leader = flight is None
+
+        if flight is None:
+            flight = asyncio.ensure_future(execute())
+            self._flights[key] = flight
+            flight.add_done_callback(functools.partial(self._land, key))
+
+        return await asyncio.shield(flight), leader
+
+    def _land(self, key: Hashable, flight: "asyncio.Future[ResponseSnapshot]") -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
@@ -0,0 +1,40 @@
+from typing import Any, Callable, Coroutine, Generator
+
+
+class SteppedCoroutine:
+    """
+    Awaitable that drives a coroutine, calling ``resume`` before each step of it and
+    ``pause`` after. The hooks bracket only the coroutine's own code, not the time it
+    spends waiting while other requests run on the event loop.
+    """
+
+    def __init__(
+        self,
+        coro: Coroutine[Any, Any, None],
+        resume: Callable[[], None],
+        pause: Callable[[], None],
+    ) -> None:
+        self.coro: Coroutine[Any, Any, None] = coro
+        self.resume: Callable[[], None] = resume
+        self.pause: Callable[[], None] = pause
+
+    def __await__(self) -> Generator[Any, Any, None]:
+        coro = self.coro
+        step: Callable[[Any], Any] = coro.send
+        value: Any = None
+
+        while True:
+            self.resume()
+            try:
+                yielded = step(value)
+            except StopIteration:
+                return
+            finally:
+                self.pause()
+
+            try:
+                value = yield yielded
+                step = coro.send
+            except BaseException as error:
+                value = error
+                step = coro.throw
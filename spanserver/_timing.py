@@ -0,0 +1,151 @@
+import bisect
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+STAGES: Tuple[str, ...] = ("admission", "params", "decode", "handler", "dump", "total")
+"""Stages of a request timed by :func:`method_wrapper`."""
+
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+"""Upper bounds, in seconds, of the buckets of a :class:`LatencyHistogram`."""
+
+
+SIZE_BUCKETS: Tuple[float, ...] = tuple(float(4 ** power) for power in range(3, 12))
+"""Upper bounds, in bytes, of the buckets of a :class:`SizeHistogram`: 64B to 4MiB."""
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket histogram of durations in seconds. Observing a value is a binary
+    search and an increment, cheap enough to run on every request.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.bounds: Tuple[float, ...] = bounds
+        """Bucket upper bounds. Values above the last bound go in an overflow bucket."""
+        self.counts: List[int] = [0] * (len(bounds) + 1)
+        """Observations per bucket. Not cumulative."""
+        self.count: int = 0
+        """Total observations."""
+        self.sum: float = 0.0
+        """Sum of observed values."""
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Upper bound of the bucket holding the ``q`` quantile, ``0 <= q <= 1``. Values in
+        the overflow bucket return ``inf``. ``None`` if nothing was observed.
+        """
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                break
+
+        return self.bounds[index] if index < len(self.bounds) else float("inf")
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+
+class SizeHistogram(LatencyHistogram):
+    """:class:`LatencyHistogram` of body sizes in bytes."""
+
+    __slots__ = ()
+
+    def __init__(self, bounds: Tuple[float, ...] = SIZE_BUCKETS) -> None:
+        super().__init__(bounds)
+
+
+StageHistograms = Dict[str, LatencyHistogram]
+
+
+def stage_histograms() -> StageHistograms:
+    return {stage: LatencyHistogram() for stage in STAGES}
+
+
+class StageClock:
+    """
+    Times the stages of one request with a monotonic clock. A stage runs from when it
+    is started with :func:`StageClock.lap` until the next stage starts or the clock
+    stops.
+    """
+
+    __slots__ = ("started", "stage", "last", "laps")
+
+    def __init__(self, stage: str) -> None:
+        self.started: float = time.perf_counter()
+        self.stage: Optional[str] = stage
+        self.last: float = self.started
+        self.laps: List[Tuple[str, float]] = list()
+
+    def lap(self, stage: Optional[str]) -> None:
+        """End the current stage and start ``stage``. ``None`` stops the clock."""
+        now = time.perf_counter()
+        if self.stage is not None:
+            self.laps.append((self.stage, now - self.last))
+        self.stage = stage
+        self.last = now
+
+    def split(self, stage: str, part: str, seconds: float) -> None:
+        """Move ``seconds`` of the lap recorded for ``stage`` to a lap for ``part``."""
+        if not seconds:
+            return
+        for index, (lap_stage, lap_seconds) in enumerate(self.laps):
+            if lap_stage == stage:
+                self.laps[index] = (stage, max(lap_seconds - seconds, 0.0))
+                self.laps.insert(index, (part, seconds))
+                return
+
+    def record(self, histograms: StageHistograms) -> None:
+        """Observe each lap and the total time in ``histograms``."""
+        for stage, seconds in self.laps:
+            histograms[stage].observe(seconds)
+        histograms["total"].observe(self.last - self.started)
+
+    def server_timing(self) -> str:
+        """Laps and total time as a ``Server-Timing`` header value, in milliseconds."""
+        laps = self.laps + [("total", self.last - self.started)]
+        return ", ".join(f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in laps)
+
+
+class _StoppedClock(StageClock):
+    """Clock for plans that do not time requests. Laps do nothing."""
+
+    def __init__(self) -> None:
+        super().__init__("total")
+        self.stage = None
+
+    def lap(self, stage: Optional[str]) -> None:
+        pass
+
+
+STOPPED_CLOCK: StageClock = _StoppedClock()
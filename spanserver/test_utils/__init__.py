@@ -1,4 +1,10 @@
-from ._api import validate_error, validate_response
+from ._api import (
+    validate_error,
+    validate_response,
+    ResponseOutput,
+    set_response_output,
+)
+from ._client import AsyncClient
 from ._errors import (
     ResponseValidationError,
     TextValidationError,
@@ -19,6 +25,9 @@ from spantools import NoErrorReturnedError
 (
     validate_error,
     validate_response,
+    ResponseOutput,
+    set_response_output,
+    AsyncClient,
     ResponseValidationError,
     TextValidationError,
     DataValidationError,
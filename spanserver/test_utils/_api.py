@@ -1,9 +1,10 @@
 import requests
 import uuid
 import json
+import contextlib
 import dataclasses
 from grahamcracker import schema_for, DataSchema
-from typing import Type, Tuple, Optional, Dict, Union, Any
+from typing import Type, Tuple, Optional, Dict, Union, Any, Iterator, List
 from marshmallow import Schema, ValidationError
 from bson import InvalidBSON, InvalidDocument
 
@@ -29,6 +30,41 @@ class _ErrorSchema(DataSchema[Error]):
 _ERROR_SCHEMA = _ErrorSchema()
 
 
+@dataclasses.dataclass
+class ResponseOutput:
+    """
+    How :func:`validate_response` and :func:`validate_error` print the response they
+    check.
+    """
+
+    quiet: bool = False
+    """
+    Only print responses that fail validation. Responses that pass are never
+    formatted, which saves time on large payloads.
+    """
+    max_chars: Optional[int] = None
+    """
+    Most characters printed for the headers and for the body. Longer output is cut
+    short. ``None`` prints everything.
+    """
+
+
+_output = ResponseOutput()
+
+
+def set_response_output(output: ResponseOutput) -> ResponseOutput:
+    """
+    Set the default :class:`ResponseOutput` of :func:`validate_response` and
+    :func:`validate_error`, like from a ``conftest.py``.
+
+    :return: the previous default, so it can be restored.
+    """
+    global _output
+    previous = _output
+    _output = output
+    return previous
+
+
 def _validate_status(
     response: requests.Response, valid_status_codes: Union[int, Tuple[int, ...]]
 ) -> None:
@@ -42,26 +78,67 @@ def _validate_status(
         )
 
 
-def _print_response_data(response: requests.Response) -> None:
+def _truncate(text: str, max_chars: Optional[int]) -> str:
+    if max_chars is None or len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}\n... {len(text) - max_chars} more characters"
 
-    print("RESPONSE:", response)
-    print()
-    print("HEADERS:", json.dumps(dict(response.headers), indent=4), sep="\n")
-    print()
+
+def _print_response_data(
+    response: requests.Response, max_chars: Optional[int] = None
+) -> None:
+
+    lines: List[str] = [
+        f"RESPONSE: {response}",
+        "",
+        "HEADERS:",
+        _truncate(json.dumps(dict(response.headers), indent=4), max_chars),
+        "",
+    ]
 
     try:
-        print("JSON:", json.dumps(response.json(), indent=4), sep="\n")
+        body = json.dumps(response.json(), indent=4)
+        lines.extend(["JSON:", _truncate(body, max_chars)])
     except (json.JSONDecodeError, UnicodeDecodeError, TypeError):
-        print("CONTENT:", response.content, sep="\n")
+        lines.extend(["CONTENT:", _truncate(str(response.content), max_chars)])
+
+    print("\n".join(lines))
 
 
-def validate_error(response: requests.Response, error_type: Type[APIError]) -> Error:
+@contextlib.contextmanager
+def _response_output(
+    response: requests.Response, output: Optional[ResponseOutput]
+) -> Iterator[None]:
+    """Prints ``response`` before validating it, or if validation fails when quiet."""
+    if output is None:
+        output = _output
+
+    if not output.quiet:
+        _print_response_data(response, output.max_chars)
+        yield
+        return
+
+    try:
+        yield
+    # Validation errors are SpanErrors, which inherit from BaseException.
+    except BaseException:
+        _print_response_data(response, output.max_chars)
+        raise
+
+
+def validate_error(
+    response: requests.Response,
+    error_type: Type[APIError],
+    output: Optional[ResponseOutput] = None,
+) -> Error:
     """
     Validates response contains correct error info, prints response and headers for
     test logs.
 
     :param response: from test client.
     :param error_type: APIError class that returned error should correspond to.
+    :param output: How the response is printed. Defaults to the
+        :func:`set_response_output` setting.
 
     :raises NoErrorReturnedError: No error information in response headers.
     :raises StatusMismatchError: Response http code does not match ``error_type``.
@@ -73,19 +150,20 @@ def validate_error(response: requests.Response, error_type: Type[APIError]) -> E
 
     All exceptions are inherited from :class:`ResponseValidationError`
     """
-    _print_response_data(response)
+    with _response_output(response, output):
+        error = Error.from_headers(response.headers)
 
-    error = Error.from_headers(response.headers)
-
-    try:
-        assert error.name == error_type.__name__
-        assert error.code == error_type.api_code
-        assert error.message
-        assert isinstance(error.id, uuid.UUID)
-    except AssertionError:
-        raise WrongExceptionError(f"Expected {error_type.__name__}. Got {error.name}")
+        try:
+            assert error.name == error_type.__name__
+            assert error.code == error_type.api_code
+            assert error.message
+            assert isinstance(error.id, uuid.UUID)
+        except AssertionError:
+            raise WrongExceptionError(
+                f"Expected {error_type.__name__}. Got {error.name}"
+            )
 
-    _validate_status(response, error_type.http_code)
+        _validate_status(response, error_type.http_code)
 
     return error
 
@@ -186,6 +264,7 @@ def validate_response(
     expected_headers: Optional[Dict[str, str]] = None,
     expected_paging: Optional[PagingResp] = None,
     paging_urls: bool = True,
+    output: Optional[ResponseOutput] = None,
 ) -> Optional[Any]:
     """
     Validate response object from test client. For use when writing tests.
@@ -198,6 +277,8 @@ def validate_response(
     :param expected_paging: Paging object with expected values.
     :param paging_urls: Whether to check the URLs of the paging object. Default is
         ``True``.
+    :param output: How the response is printed. Defaults to the
+        :func:`set_response_output` setting.
 
     :return: Loaded Data.
 
@@ -224,11 +305,10 @@ def validate_response(
 
     All exceptions are inherited from :class:`ResponseValidationError`
     """
-    _print_response_data(response)
-
-    _validate_status(response, valid_status_codes)
-    data = _validate_data(response, data_schema, text_value)
-    _validate_headers(response, expected_headers)
-    _validate_paging(response, expected_paging, paging_urls)
+    with _response_output(response, output):
+        _validate_status(response, valid_status_codes)
+        data = _validate_data(response, data_schema, text_value)
+        _validate_headers(response, expected_headers)
+        _validate_paging(response, expected_paging, paging_urls)
 
     return data
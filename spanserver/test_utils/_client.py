@@ -0,0 +1,182 @@
+import http
+import io
+import requests
+from types import TracebackType
+from typing import Any, Dict, List, Optional, Tuple, Type
+from urllib.parse import unquote, urljoin, urlsplit
+
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3 import HTTPResponse
+from requests.packages.urllib3._collections import HTTPHeaderDict
+
+from .._asgi import ASGIResponse, Lifespan, Scope, call_app, http_scope, raw_headers
+
+
+class _HeaderDict(HTTPHeaderDict):
+    def get_all(self, key: str, default: Any) -> List[str]:
+        return self.getheaders(key)
+
+
+class _OriginalResponse:
+    """Stands in for the ``http.client`` response requests reads cookies from."""
+
+    def __init__(self, headers: List[Tuple[str, str]]) -> None:
+        self.msg: _HeaderDict = _HeaderDict(headers)
+        self.closed: bool = False
+
+    def isclosed(self) -> bool:
+        return self.closed
+
+
+def _reason(status: int) -> str:
+    try:
+        return http.HTTPStatus(status).phrase
+    except ValueError:
+        return ""
+
+
+class AsyncClient:
+    """
+    Sends requests to a :class:`SpanAPI` straight over ASGI, without sockets, on the
+    running event loop. Requests can be sent concurrently with :func:`asyncio.gather`,
+    and return ``requests.Response`` objects that work with :func:`validate_response`
+    and :func:`validate_error`.
+
+    Used as an async context manager, the client runs the API's startup and shutdown
+    handlers:
+
+    .. code-block:: python
+
+        async with test_utils.AsyncClient(api) as client:
+            responses = await asyncio.gather(
+                *(client.get(f"/items/{i}") for i in range(100))
+            )
+
+        for r in responses:
+            test_utils.validate_response(r, data_schema=ItemSchema())
+
+    :param api: API to send requests to.
+    :param base_url: Scheme and host requests are sent to. Relative urls are joined to
+        it.
+    :param raise_server_exceptions: Raise exceptions that escape the app, instead of
+        returning a 500 response.
+    """
+
+    def __init__(
+        self,
+        api: "SpanAPI",
+        base_url: str = "http://testserver",
+        raise_server_exceptions: bool = True,
+    ) -> None:
+        self.api: "SpanAPI" = api
+        self.base_url: str = base_url
+        self.raise_server_exceptions: bool = raise_server_exceptions
+
+        self._adapter: HTTPAdapter = HTTPAdapter()
+        self._lifespan: Lifespan = Lifespan(api)
+
+    async def __aenter__(self) -> "AsyncClient":
+        await self.startup()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        await self.shutdown()
+
+    async def startup(self) -> None:
+        """
+        Run the API's startup handlers through the ASGI lifespan protocol.
+
+        :raises RuntimeError: If a startup handler fails.
+        """
+        await self._lifespan.startup()
+
+    async def shutdown(self) -> None:
+        """Run the API's shutdown handlers. Does nothing if not started."""
+        await self._lifespan.shutdown()
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """
+        Send a request. ``kwargs`` are the same as ``requests.request``: ``params``,
+        ``data``, ``json``, ``headers``, ``files``, ``cookies`` and ``auth``.
+        """
+        prepared = requests.Request(
+            method.upper(), urljoin(self.base_url, url), **kwargs
+        ).prepare()
+        return await self.send(prepared)
+
+    async def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def head(self, url: str, **kwargs: Any) -> requests.Response:
+        return await self.request("HEAD", url, **kwargs)
+
+    async def options(self, url: str, **kwargs: Any) -> requests.Response:
+        return await self.request("OPTIONS", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs: Any) -> requests.Response:
+        return await self.request("PUT", url, **kwargs)
+
+    async def patch(self, url: str, **kwargs: Any) -> requests.Response:
+        return await self.request("PATCH", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs: Any) -> requests.Response:
+        return await self.request("DELETE", url, **kwargs)
+
+    async def send(self, request: requests.PreparedRequest) -> requests.Response:
+        """Send a prepared request to the API over ASGI."""
+        body = request.body or b""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        try:
+            response = await call_app(self.api, _scope(request, body), body)
+        except BaseException:
+            if self.raise_server_exceptions:
+                raise
+            response = ASGIResponse(status=500, headers=list(), body=b"")
+
+        content = b"" if request.method == "HEAD" else response.body
+        raw = HTTPResponse(
+            body=io.BytesIO(content),
+            headers=response.headers,
+            status=response.status,
+            reason=_reason(response.status),
+            version=11,
+            preload_content=False,
+            original_response=_OriginalResponse(response.headers),
+        )
+        return self._adapter.build_response(request, raw)
+
+
+def _scope(request: requests.PreparedRequest, body: bytes) -> Scope:
+    parts = urlsplit(str(request.url))
+    default_port = 443 if parts.scheme == "https" else 80
+    host = parts.hostname or "testserver"
+    port = parts.port or default_port
+
+    headers: Dict[str, str] = dict()
+    if "host" not in request.headers:
+        headers["host"] = host if port == default_port else f"{host}:{port}"
+    headers.update(request.headers)
+
+    return http_scope(
+        str(request.method),
+        unquote(parts.path),
+        parts.query.encode("latin-1"),
+        raw_headers(headers, body),
+        scheme=parts.scheme,
+        server=(host, port),
+    )
+
+
+type_helper = False
+if type_helper:
+    from .._api import SpanAPI
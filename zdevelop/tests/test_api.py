@@ -5,13 +5,19 @@ import copy
 import fractions
 import datetime
 import io
+import json
 import csv
+import logging
 import pathlib
+import pstats
+import time
+import tracemalloc
 from bson import BSON
 from bson.raw_bson import RawBSONDocument
 from dataclasses import dataclass, field
 from grahamcracker import schema_for, DataSchema, MISSING
-from typing import Union, Optional, Type, Dict, List, Any
+import asyncio
+from typing import Union, Optional, Type, Dict, List, Any, Tuple
 
 from spanserver import (
     Request,
@@ -20,10 +26,26 @@ from spanserver import (
     LoadOptions,
     DumpOptions,
     SpanAPI,
+    ErrorLogPolicy,
     MimeType,
     PagingResp,
+    ResourcePool,
+    ConcurrencyLimit,
+    ServiceUnavailableError,
+    RequestTimeoutError,
+    DocInfo,
+    MicroBatchCall,
+    LatencyHistogram,
+    ProfilingPolicy,
+    LoadGenerator,
+    LoadRequest,
+    MemoryTracingPolicy,
+    SlowRequestPolicy,
+    LoopLagPolicy,
+    Priority,
     errors_api,
 )
+from spanserver._admission import AdmissionGate
 from spantools import DEFAULT_ENCODERS
 from spanserver.test_utils import validate_error, validate_response
 
@@ -70,6 +92,22 @@ DRACO = Name(UUID_VALUE, "Draco", "Malfoy")
 DRACO_DUMPED = {"id": UUID_STR, "first": "Draco", "last": "Malfoy"}
 
 
+class RecordCollector(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records: List[logging.LogRecord] = list()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+
+def api_with_error_log(**policy_kwargs) -> Tuple[SpanAPI, RecordCollector]:
+    collector = RecordCollector()
+    policy = ErrorLogPolicy(handlers=[collector], **policy_kwargs)
+    api = SpanAPI(openapi="3.0.0", error_log_policy=policy)
+    return api, collector
+
+
 class TestInit:
     def test_route_type_error(self, api: SpanAPI):
         with pytest.raises(TypeError):
@@ -79,6 +117,1468 @@ class TestInit:
                 on_get = None
 
 
+class TestCompile:
+    def test_compile_on_startup(self, api: SpanAPI):
+        @api.route("/test")
+        class TestRoute(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                resp.media = "hello"
+
+        assert not api.frozen
+
+        with api.requests as client:
+            assert api.frozen
+            validate_response(client.get("/test"), text_value="hello")
+
+        with pytest.raises(RuntimeError):
+
+            @api.route("/test2")
+            class TestRoute2(SpanRoute):
+                async def on_get(self, req: Request, resp: Response):
+                    pass
+
+        with pytest.raises(RuntimeError):
+            api.register_mimetype("text/csv", encoder=str.encode, decoder=bytes.decode)
+
+    def test_compile_plan_flattened(self, api: SpanAPI):
+        @api.route("/test/{item_id}")
+        class TestRoute(SpanRoute):
+            @api.use_schema(
+                resp=NameSchema(many=True), resp_dump=DumpOptions.DUMP_AND_VALIDATE
+            )
+            @api.paged(limit=5, default_offset=1)
+            async def on_get(self, req: Request, resp: Response, *, item_id: int):
+                resp.media = [HARRY]
+
+        api.compile()
+
+        plan = TestRoute.on_get.plan
+        assert plan.endpoint is TestRoute._raw_methods["get"]
+        assert not hasattr(plan.endpoint, "__wrapped__")
+
+        assert plan.http_method == "get"
+        assert [p.name for p in plan.param_info] == ["item_id"]
+        assert isinstance(plan.resp_schema, NameSchema)
+        assert plan.resp_dump is DumpOptions.DUMP_AND_VALIDATE
+        assert plan.req_schema is None
+        assert plan.projection_builder is not None
+        assert plan.paging.limit == 5
+        assert plan.paging.default_offset == 1
+
+        with api.requests as client:
+            r = client.get("/test/1")
+            data = validate_response(r, data_schema=NameSchema(many=True))
+
+        assert data == [HARRY]
+        assert r.headers["paging-limit"] == "5"
+
+    def test_recompile_does_not_double_wrap(self, api: SpanAPI):
+        @api.route("/test/{item_id}")
+        class TestRoute(SpanRoute):
+            async def on_get(self, req: Request, resp: Response, *, item_id: int):
+                resp.media = "hello"
+
+        wrapped = TestRoute.on_get
+        api.compile()
+
+        assert TestRoute.on_get is not wrapped
+        assert TestRoute.on_get.plan.endpoint is wrapped.plan.endpoint
+        assert len(TestRoute.Document.get.req_params) == 1
+
+        validate_response(api.requests.get("/test/1"), text_value="hello")
+
+
+class Connection:
+    """Stand-in for a pooled database connection."""
+
+    created: List["Connection"] = list()
+
+    def __init__(self):
+        self.closed = False
+        Connection.created.append(self)
+
+    async def close(self):
+        self.closed = True
+
+
+class TestResources:
+    def test_lifecycle(self, api: SpanAPI):
+        Connection.created = list()
+        api.add_resource(Connection, Connection, size=2, close=Connection.close)
+
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            async def on_get(
+                self, req: Request, resp: Response, *, item_id: int, db: Connection
+            ):
+                resp.media = {"item_id": item_id, "db": id(db)}
+
+        with api.requests as client:
+            assert len(Connection.created) == 2
+
+            r = client.get("/items/1")
+            validate_response(r)
+            data = r.json()
+
+            assert data["item_id"] == 1
+            assert data["db"] in [id(c) for c in Connection.created]
+
+        assert all(c.closed for c in Connection.created)
+
+    def test_not_path_param(self, api: SpanAPI):
+        api.add_resource(Connection, Connection)
+
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            async def on_get(
+                self, req: Request, resp: Response, *, item_id: int, db: Connection
+            ):
+                resp.media = {"item_id": item_id, "db": id(db)}
+
+        api.compile()
+
+        assert [p.name for p in Items.on_get.plan.param_info] == ["item_id"]
+        assert [name for name, _ in Items.on_get.plan.resources] == ["db"]
+        assert [p.name for p in Items.Document.get.req_params] == ["item_id"]
+
+    def test_registered_after_route(self, api: SpanAPI):
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            async def on_get(
+                self, req: Request, resp: Response, *, item_id: int, db: Connection
+            ):
+                resp.media = {"item_id": item_id, "db": id(db)}
+
+        pool = api.add_resource(Connection, Connection)
+
+        with api.requests as client:
+            validate_response(client.get("/items/1"))
+
+        assert pool.stats.checkouts == 1
+
+    def test_shared_instance(self, api: SpanAPI):
+        Connection.created = list()
+        pool = api.add_resource(Connection, Connection)
+
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            async def on_get(
+                self, req: Request, resp: Response, *, item_id: int, db: Connection
+            ):
+                resp.media = {"item_id": item_id, "db": id(db)}
+
+        first = api.requests.get("/items/1").json()
+        second = api.requests.get("/items/2").json()
+
+        assert len(Connection.created) == 1
+        assert first["db"] == second["db"]
+        assert pool.stats.checkouts == 2
+        assert pool.stats.in_use == 0
+
+    def test_released_on_error(self, api: SpanAPI):
+        pool = api.add_resource(Connection, Connection, size=1)
+
+        @api.route("/items")
+        class Items(SpanRoute):
+            async def on_get(self, req: Request, resp: Response, *, db: Connection):
+                raise errors_api.NothingToReturnError("nope")
+
+        validate_error(api.requests.get("/items"), errors_api.NothingToReturnError)
+        validate_error(api.requests.get("/items"), errors_api.NothingToReturnError)
+
+        assert pool.stats.in_use == 0
+        assert pool.stats.checkouts == 2
+
+    def test_saturation_stats(self):
+        pool = ResourcePool(Connection, Connection, size=1, close=None)
+
+        async def use():
+            conn = await pool.checkout()
+            await asyncio.sleep(0.01)
+            pool.release(conn)
+
+        async def run():
+            await asyncio.gather(use(), use(), use())
+
+        asyncio.get_event_loop().run_until_complete(run())
+
+        assert pool.stats.checkouts == 3
+        assert pool.stats.saturated_checkouts == 2
+        assert pool.stats.peak_in_use == 1
+        assert pool.stats.max_wait > 0
+        assert pool.stats.wait_time >= pool.stats.max_wait
+        assert pool.stats.in_use == 0
+
+    def test_duplicate_resource(self, api: SpanAPI):
+        api.add_resource(Connection, Connection)
+        with pytest.raises(ValueError):
+            api.add_resource(Connection, Connection)
+
+    def test_frozen(self, api: SpanAPI):
+        api.compile()
+        with pytest.raises(RuntimeError):
+            api.add_resource(Connection, Connection)
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+class TestConcurrencyLimits:
+    def test_admitted(self, api: SpanAPI):
+        @api.route("/slow")
+        class Slow(SpanRoute):
+            @api.limit_concurrency(1)
+            async def on_get(self, req: Request, resp: Response):
+                resp.media = {"ok": True}
+
+        validate_response(api.requests.get("/slow"))
+        validate_response(api.requests.get("/slow"))
+
+        name = Slow.on_get.admission_gate.name
+        assert name.endswith("Slow.on_get")
+        stats = api.concurrency_stats()[name]
+        assert stats.admitted == 2
+        assert stats.peak_in_flight == 1
+        assert stats.in_flight == 0
+
+    def test_shed(self, api: SpanAPI):
+        @api.route("/slow")
+        class Slow(SpanRoute):
+            @api.limit_concurrency(1, retry_after=5)
+            async def on_get(self, req: Request, resp: Response):
+                resp.media = {"ok": True}
+
+        gate = Slow.on_get.admission_gate
+
+        run(gate.acquire())
+        r = api.requests.get("/slow")
+        gate.release()
+
+        validate_error(r, ServiceUnavailableError)
+        assert r.headers["Retry-After"] == "5"
+        assert gate.stats.shed == 1
+        assert gate.stats.in_flight == 0
+
+    def test_api_limit(self):
+        api = SpanAPI(concurrency_limit=ConcurrencyLimit(1, retry_after=2))
+
+        @api.route("/items")
+        class Items(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                resp.media = {"ok": True}
+
+        validate_response(api.requests.get("/items"))
+
+        run(api.admission.acquire())
+        r = api.requests.get("/items")
+        api.admission.release()
+
+        validate_error(r, ServiceUnavailableError)
+        assert r.headers["Retry-After"] == "2"
+        assert api.concurrency_stats()["server"].shed == 1
+
+    def test_route_slot_released_when_api_sheds(self):
+        api = SpanAPI(concurrency_limit=ConcurrencyLimit(1))
+
+        @api.route("/slow")
+        class Slow(SpanRoute):
+            @api.limit_concurrency(1)
+            async def on_get(self, req: Request, resp: Response):
+                resp.media = {"ok": True}
+
+        run(api.admission.acquire())
+        validate_error(api.requests.get("/slow"), ServiceUnavailableError)
+
+        assert Slow.on_get.admission_gate.stats.in_flight == 0
+
+    def test_queue_fifo(self):
+        gate = AdmissionGate(ConcurrencyLimit(1, max_queue=2))
+        order: List[int] = list()
+
+        async def use(index: int):
+            await gate.acquire()
+            order.append(index)
+            await asyncio.sleep(0.01)
+            gate.release()
+
+        async def main():
+            await asyncio.gather(*(use(i) for i in range(3)))
+
+        run(main())
+
+        assert order == [0, 1, 2]
+        assert gate.stats.peak_queued == 2
+        assert gate.stats.admitted == 3
+        assert gate.stats.in_flight == 0
+        assert gate.stats.queued == 0
+
+    def test_queue_full(self):
+        gate = AdmissionGate(ConcurrencyLimit(1, max_queue=1))
+
+        async def main():
+            await gate.acquire()
+            waiting = asyncio.ensure_future(gate.acquire())
+            await asyncio.sleep(0)
+
+            with pytest.raises(ServiceUnavailableError):
+                await gate.acquire()
+
+            gate.release()
+            await waiting
+            gate.release()
+
+        run(main())
+
+        assert gate.stats.shed == 1
+        assert gate.stats.admitted == 2
+        assert gate.stats.in_flight == 0
+
+    def test_queue_timeout(self):
+        gate = AdmissionGate(ConcurrencyLimit(1, max_queue=1, queue_timeout=0.01))
+
+        async def main():
+            await gate.acquire()
+            with pytest.raises(ServiceUnavailableError):
+                await gate.acquire()
+            gate.release()
+
+        run(main())
+
+        assert gate.stats.timed_out == 1
+        assert gate.stats.shed == 1
+        assert gate.stats.queued == 0
+        assert gate.stats.in_flight == 0
+
+
+class TestTimeouts:
+    def test_timeout(self, api: SpanAPI):
+        cancelled: List[bool] = list()
+
+        @api.route("/slow")
+        class Slow(SpanRoute):
+            @api.use_schema(timeout=0.01)
+            async def on_get(self, req: Request, resp: Response):
+                try:
+                    await asyncio.sleep(1)
+                except asyncio.CancelledError:
+                    cancelled.append(True)
+                    raise
+
+        validate_error(api.requests.get("/slow"), RequestTimeoutError)
+
+        assert cancelled == [True]
+        assert Slow.on_get.plan.stats.timeouts == 1
+        assert api.route_stats()[Slow.on_get.plan.name].timeouts == 1
+
+    def test_within_timeout(self, api: SpanAPI):
+        @api.route("/slow")
+        class Slow(SpanRoute):
+            @api.use_schema(timeout=1.0)
+            async def on_get(self, req: Request, resp: Response):
+                resp.media = {"ok": True}
+
+        validate_response(api.requests.get("/slow"))
+
+        assert Slow.on_get.plan.stats.timeouts == 0
+
+    def test_document_timeout(self, api: SpanAPI):
+        @api.route("/slow")
+        class Slow(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                await asyncio.sleep(1)
+
+            class Document:
+                get = DocInfo(timeout=0.01)
+
+        validate_error(api.requests.get("/slow"), RequestTimeoutError)
+        assert Slow.on_get.plan.timeout == 0.01
+
+    def test_client_deadline_shortens(self, api: SpanAPI):
+        @api.route("/slow")
+        class Slow(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                await asyncio.sleep(1)
+
+        r = api.requests.get("/slow", headers={"request-timeout": "0.01"})
+        validate_error(r, RequestTimeoutError)
+
+    def test_client_deadline_cannot_extend(self, api: SpanAPI):
+        @api.route("/slow")
+        class Slow(SpanRoute):
+            @api.use_schema(timeout=0.01)
+            async def on_get(self, req: Request, resp: Response):
+                await asyncio.sleep(1)
+
+        r = api.requests.get("/slow", headers={"request-timeout": "30"})
+        validate_error(r, RequestTimeoutError)
+
+    @pytest.mark.parametrize("value", ["soon", "0", "-1"])
+    def test_client_deadline_invalid(self, api: SpanAPI, value: str):
+        @api.route("/slow")
+        class Slow(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                resp.media = {"ok": True}
+
+        r = api.requests.get("/slow", headers={"request-timeout": value})
+        validate_error(r, errors_api.RequestValidationError)
+
+
+async def asgi_get(
+    api: SpanAPI, path: str, query: str = "", headers: Optional[Dict[str, str]] = None
+) -> Tuple[int, Dict[str, str], bytes]:
+    """Sends a GET straight to the ASGI app so requests can run concurrently."""
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [
+            (key.lower().encode(), value.encode())
+            for key, value in (headers or dict()).items()
+        ],
+        "server": ("testserver", 80),
+        "client": ("testclient", 50000),
+    }
+    messages: List[dict] = list()
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict) -> None:
+        messages.append(message)
+
+    await api(scope, receive, send)
+
+    start = messages[0]
+    resp_headers = {k.decode(): v.decode() for k, v in start["headers"]}
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return start["status"], resp_headers, body
+
+
+class TestSingleFlight:
+    def test_coalesced(self, api: SpanAPI):
+        calls: List[str] = list()
+
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            @api.single_flight
+            async def on_get(self, req: Request, resp: Response, *, item_id: str):
+                calls.append(item_id)
+                await asyncio.sleep(0.01)
+                resp.media = {"item_id": item_id, "call": len(calls)}
+
+        async def main():
+            return await asyncio.gather(
+                *(asgi_get(api, "/items/1", "b=2&a=1") for _ in range(5)),
+                asgi_get(api, "/items/1", "a=1&b=2"),
+            )
+
+        results = run(main())
+
+        assert calls == ["1"]
+        assert len({body for _, _, body in results}) == 1
+        assert all(status == 200 for status, _, _ in results)
+        assert Items.on_get.plan.stats.coalesced == 5
+        assert Items.on_get.plan.single_flight.in_flight == 0
+
+    def test_different_keys(self, api: SpanAPI):
+        calls: List[str] = list()
+
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            @api.single_flight
+            async def on_get(self, req: Request, resp: Response, *, item_id: str):
+                calls.append(item_id)
+                await asyncio.sleep(0.01)
+                resp.media = {"item_id": item_id, "call": len(calls)}
+
+        async def main():
+            return await asyncio.gather(
+                asgi_get(api, "/items/1"),
+                asgi_get(api, "/items/2"),
+                asgi_get(api, "/items/1", "project.item_id=1"),
+                asgi_get(api, "/items/1", headers={"Accept": "application/yaml"}),
+            )
+
+        run(main())
+
+        assert sorted(calls) == ["1", "1", "1", "2"]
+        assert Items.on_get.plan.stats.coalesced == 0
+
+    def test_sequential_not_coalesced(self, api: SpanAPI):
+        calls: List[str] = list()
+
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            @api.single_flight
+            async def on_get(self, req: Request, resp: Response, *, item_id: str):
+                calls.append(item_id)
+                await asyncio.sleep(0.01)
+                resp.media = {"item_id": item_id, "call": len(calls)}
+
+        validate_response(api.requests.get("/items/1"))
+        validate_response(api.requests.get("/items/1"))
+
+        assert calls == ["1", "1"]
+
+    def test_error_shared(self, api: SpanAPI):
+        calls: List[str] = list()
+
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            @api.single_flight
+            async def on_get(self, req: Request, resp: Response, *, item_id: str):
+                calls.append(item_id)
+                await asyncio.sleep(0.01)
+                raise errors_api.NothingToReturnError("nope")
+
+        async def main():
+            return await asyncio.gather(*(asgi_get(api, "/items/1") for _ in range(3)))
+
+        results = run(main())
+
+        assert calls == ["1"]
+        for status, headers, _ in results:
+            assert status == 400
+            assert headers["error-name"] == "NothingToReturnError"
+
+    def test_not_get(self, api: SpanAPI):
+        with pytest.raises(ValueError):
+
+            @api.route("/items")
+            class Items(SpanRoute):
+                @api.single_flight
+                async def on_post(self, req: Request, resp: Response):
+                    pass
+
+
+class ItemSchema(marshmallow.Schema):
+    name = marshmallow.fields.Str(required=True)
+
+
+class TestBatch:
+    def test_batch(self, api: SpanAPI):
+        @api.route("/items/{item_id}")
+        class Item(SpanRoute):
+            async def on_get(self, req: Request, resp: Response, *, item_id: int):
+                resp.media = {"item_id": item_id, "q": req.params.get("q")}
+
+        @api.route("/items")
+        class Items(SpanRoute):
+            @api.use_schema(req=ItemSchema(), resp=ItemSchema())
+            async def on_post(self, req: Request, resp: Response):
+                resp.media = await req.media_loaded()
+
+        api.add_batch_route()
+
+        batch = {
+            "requests": [
+                {"path": "/items/1", "params": {"q": "a"}},
+                {"method": "POST", "path": "/items", "body": {"name": "new"}},
+                {"method": "POST", "path": "/items", "body": {"wrong": "field"}},
+                {"path": "/items/not-an-int"},
+                {"method": "DELETE", "path": "/items/1"},
+            ]
+        }
+        r = api.requests.post("/batch", json=batch)
+        validate_response(r)
+        responses = r.json()["responses"]
+
+        assert [item["status"] for item in responses] == [200, 200, 400, 400, 405]
+        assert responses[0]["body"] == {"item_id": 1, "q": "a"}
+        assert responses[1]["body"] == {"name": "new"}
+        assert responses[2]["headers"]["error-name"] == "RequestValidationError"
+        assert responses[2]["body"] is None
+        assert responses[4]["headers"]["error-name"] == "InvalidMethodError"
+
+    def test_bson(self, api: SpanAPI):
+        @api.route("/items/{item_id}")
+        class Item(SpanRoute):
+            async def on_get(self, req: Request, resp: Response, *, item_id: int):
+                resp.media = {"item_id": item_id, "q": req.params.get("q")}
+
+        api.add_batch_route()
+
+        batch = {"requests": [{"path": "/items/2"}]}
+        r = api.requests.post(
+            "/batch",
+            data=encode_bson(batch),
+            headers={"Content-Type": "application/bson", "Accept": "application/bson"},
+        )
+        validate_response(r)
+
+        data = BSON(r.content).decode()
+        assert data["responses"][0]["body"]["item_id"] == 2
+
+    def test_concurrency(self, api: SpanAPI):
+        running: List[int] = [0, 0]
+
+        @api.route("/items/{item_id}")
+        class Item(SpanRoute):
+            async def on_get(self, req: Request, resp: Response, *, item_id: int):
+                running[0] += 1
+                running[1] = max(running)
+                await asyncio.sleep(0.01)
+                running[0] -= 1
+                resp.media = {"item_id": item_id}
+
+        api.add_batch_route(max_concurrency=2)
+
+        batch = {"requests": [{"path": f"/items/{i}"} for i in range(6)]}
+        validate_response(api.requests.post("/batch", json=batch))
+
+        assert running[1] == 2
+
+    def test_max_items(self, api: SpanAPI):
+        api.add_batch_route(max_items=2)
+
+        batch = {"requests": [{"path": f"/items/{i}"} for i in range(3)]}
+        r = api.requests.post("/batch", json=batch)
+        validate_error(r, errors_api.APILimitError)
+
+    def test_nested(self, api: SpanAPI):
+        api.add_batch_route()
+
+        batch = {"requests": [{"method": "POST", "path": "/batch"}]}
+        r = api.requests.post("/batch", json=batch)
+        validate_error(r, errors_api.RequestValidationError)
+
+    def test_invalid_batch(self, api: SpanAPI):
+        api.add_batch_route()
+
+        r = api.requests.post("/batch", json={"requests": [{"method": "GET"}]})
+        validate_error(r, errors_api.RequestValidationError)
+
+
+class TestMicroBatch:
+    def test_batched(self, api: SpanAPI):
+        batches: List[List[int]] = list()
+
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            @api.use_schema(resp=ItemSchema())
+            @api.micro_batch(window=0.01)
+            async def on_get(
+                self, calls: List[MicroBatchCall], *, item_id: List[int]
+            ) -> List[Any]:
+                batches.append(item_id)
+                return [
+                    {"name": f"item-{i}"}
+                    if i >= 0
+                    else errors_api.NothingToReturnError("missing")
+                    for i in item_id
+                ]
+
+        async def main():
+            return await asyncio.gather(
+                *(asgi_get(api, f"/items/{i}") for i in [3, 1, 2, -1])
+            )
+
+        results = run(main())
+
+        assert batches == [[3, 1, 2, -1]]
+        assert [status for status, _, _ in results] == [200, 200, 200, 400]
+        assert json.loads(results[0][2]) == {"name": "item-3"}
+        assert results[3][1]["error-name"] == "NothingToReturnError"
+
+        stats = Items.on_get.micro_batcher.stats
+        assert stats.batches == 1
+        assert stats.calls == 4
+        assert stats.largest == 4
+
+    def test_max_size(self, api: SpanAPI):
+        batches: List[List[int]] = list()
+
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            @api.use_schema(resp=ItemSchema())
+            @api.micro_batch(max_size=2, window=10)
+            async def on_get(
+                self, calls: List[MicroBatchCall], *, item_id: List[int]
+            ) -> List[Any]:
+                batches.append(item_id)
+                return [{"name": f"item-{i}"} for i in item_id]
+
+        async def main():
+            await asyncio.gather(*(asgi_get(api, f"/items/{i}") for i in range(4)))
+
+        run(main())
+
+        assert batches == [[0, 1], [2, 3]]
+
+    def test_path_param_loaded(self, api: SpanAPI):
+        batches: List[List[int]] = list()
+
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            @api.use_schema(resp=ItemSchema())
+            @api.micro_batch(window=0.01)
+            async def on_get(
+                self, calls: List[MicroBatchCall], *, item_id: List[int]
+            ) -> List[Any]:
+                batches.append(item_id)
+                return [{"name": f"item-{i}"} for i in item_id]
+
+        validate_error(
+            api.requests.get("/items/abc"), errors_api.RequestValidationError
+        )
+        validate_response(api.requests.get("/items/5"))
+
+        assert batches == [[5]]
+        assert [p.name for p in Items.Document.get.req_params] == ["item_id"]
+
+    def test_handler_error(self, api: SpanAPI):
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            @api.micro_batch()
+            async def on_get(
+                self, calls: List[MicroBatchCall], *, item_id: List[str]
+            ) -> None:
+                raise errors_api.APILimitError("too many")
+
+        async def main():
+            return await asyncio.gather(*(asgi_get(api, f"/items/{i}") for i in "ab"))
+
+        for _, headers, _ in run(main()):
+            assert headers["error-name"] == "APILimitError"
+
+    def test_sets_responses(self, api: SpanAPI):
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            @api.micro_batch()
+            async def on_get(
+                self, calls: List[MicroBatchCall], *, item_id: List[str]
+            ) -> None:
+                for call, value in zip(calls, item_id):
+                    call.resp.media = {"id": value}
+                    call.resp.status_code = 201
+
+        r = api.requests.get("/items/x")
+        assert r.status_code == 201
+        assert r.json() == {"id": "x"}
+
+
+class TestStageTiming:
+    def test_histograms(self, api: SpanAPI):
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            @api.use_schema(req=ItemSchema(), resp=ItemSchema())
+            async def on_post(self, req: Request, resp: Response, *, item_id: int):
+                if item_id < 0:
+                    raise errors_api.APILimitError("negative")
+                resp.media = await req.media_loaded()
+
+        validate_response(api.requests.post("/items/1", json={"name": "a"}))
+        validate_error(
+            api.requests.post("/items/-1", json={"name": "a"}),
+            errors_api.APILimitError,
+        )
+
+        stages = api.route_stats()[Items.on_post.plan.name].stages
+        for stage in ["admission", "params", "handler", "total"]:
+            assert stages[stage].count == 2, stage
+        # The second request failed in the handler, before decoding or dumping.
+        assert stages["decode"].count == 1
+        assert stages["dump"].count == 1
+        assert stages["total"].sum >= stages["handler"].sum
+        assert "Server-Timing" not in api.requests.post("/items/1", json={}).headers
+
+    def test_server_timing(self):
+        api = SpanAPI(openapi="3.0.0", server_timing=True)
+
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            @api.use_schema(req=ItemSchema(), resp=ItemSchema())
+            async def on_post(self, req: Request, resp: Response, *, item_id: int):
+                resp.media = await req.media_loaded()
+
+        r = api.requests.post("/items/1", json={"name": "a"})
+        validate_response(r)
+
+        stages = [part.split(";")[0] for part in r.headers["Server-Timing"].split(", ")]
+        assert stages == ["admission", "params", "decode", "handler", "dump", "total"]
+
+    def test_disabled(self):
+        api = SpanAPI(openapi="3.0.0", stage_timing=False)
+
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            @api.use_schema(req=ItemSchema(), resp=ItemSchema())
+            async def on_post(self, req: Request, resp: Response, *, item_id: int):
+                resp.media = await req.media_loaded()
+
+        validate_response(api.requests.post("/items/1", json={"name": "a"}))
+
+        stages = Items.on_post.plan.stats.stages
+        assert all(histogram.count == 0 for histogram in stages.values())
+
+    def test_histogram_quantile(self):
+        histogram = LatencyHistogram(bounds=(0.01, 0.1, 1.0))
+        assert histogram.quantile(0.5) is None
+
+        for value in [0.005, 0.05, 0.05, 0.5, 5]:
+            histogram.observe(value)
+
+        assert histogram.counts == [1, 2, 1, 1]
+        assert histogram.quantile(0.5) == 0.1
+        assert histogram.quantile(0.8) == 1.0
+        assert histogram.quantile(1) == float("inf")
+        assert histogram.mean == pytest.approx(5.605 / 5)
+
+
+class TestMetrics:
+    def test_metrics(self, api: SpanAPI):
+        api.add_metrics_route()
+        api.add_resource(Connection, Connection)
+
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            @api.limit_concurrency(4)
+            async def on_post(
+                self, req: Request, resp: Response, *, item_id: int, db: Connection
+            ):
+                if item_id < 0:
+                    raise errors_api.APILimitError("negative")
+                resp.media = {"item_id": item_id}
+
+        validate_response(api.requests.post("/items/1", json={"name": "a"}))
+        validate_response(api.requests.post("/items/2"))
+        api.requests.post("/items/-1")
+
+        r = api.requests.get("/metrics")
+        assert r.status_code == 200
+        assert r.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        lines = r.text.splitlines()
+
+        labels = 'route="/items/{item_id}",method="POST"'
+        assert (
+            f'spanserver_requests_total{{{labels},status="200",error_code=""}} 2'
+            in lines
+        )
+        assert (
+            f'spanserver_requests_total{{{labels},status="400",error_code="1004"}} 1'
+            in lines
+        )
+        assert f"spanserver_requests_in_flight{{{labels}}} 0" in lines
+        assert (
+            f'spanserver_request_duration_seconds_count{{{labels},stage="total"}} 3'
+            in lines
+        )
+        assert f'spanserver_request_size_bytes_bucket{{{labels},le="+Inf"}} 3' in lines
+        assert 'spanserver_resource_checkouts_total{resource="Connection"} 3' in lines
+        assert any(line.startswith("spanserver_admission_in_flight{") for line in lines)
+        assert any(
+            line.startswith("spanserver_projection_cache_hits_total ") for line in lines
+        )
+
+    def test_families_grouped(self, api: SpanAPI):
+        api.add_metrics_route()
+
+        for path in ["/a", "/b"]:
+
+            class Route(SpanRoute):
+                async def on_get(self, req: Request, resp: Response):
+                    resp.media = {"ok": True}
+
+            api.add_route(path, Route)
+            validate_response(api.requests.get(path))
+
+        families: List[str] = list()
+        for line in api.requests.get("/metrics").text.splitlines():
+            if line.startswith("# TYPE"):
+                families.append(line.split()[2])
+            elif not line.startswith("#"):
+                assert line.startswith(families[-1])
+
+        assert len(families) == len(set(families))
+
+
+def profiled_work() -> int:
+    return sum(range(100))
+
+
+def unprofiled_work() -> int:
+    return sum(range(100))
+
+
+class TestProfiling:
+    def test_header_report(self):
+        api = SpanAPI(
+            openapi="3.0.0",
+            profiling=ProfilingPolicy(token="secret", respond=True, report_lines=1000),
+        )
+
+        @api.route("/profiled")
+        class Profiled(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                profiled_work()
+                resp.media = {"ok": True}
+
+        r = api.requests.get("/profiled", headers={"x-spanserver-profile": "secret"})
+
+        assert r.status_code == 200
+        assert "profile-id" in r.headers
+        assert "profiled_work" in r.text
+
+    def test_wrong_token(self):
+        api = SpanAPI(
+            openapi="3.0.0",
+            profiling=ProfilingPolicy(token="secret", respond=True, report_lines=1000),
+        )
+
+        @api.route("/profiled")
+        class Profiled(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                profiled_work()
+                resp.media = {"ok": True}
+
+        r = api.requests.get("/profiled", headers={"x-spanserver-profile": "guess"})
+        validate_response(r)
+
+        assert "profile-id" not in r.headers
+        assert r.json() == {"ok": True}
+
+    def test_sampled_to_file(self, tmp_path: pathlib.Path):
+        api = SpanAPI(
+            openapi="3.0.0",
+            profiling=ProfilingPolicy(sample_rate=1.0, output_dir=str(tmp_path)),
+        )
+
+        @api.route("/profiled")
+        class Profiled(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                profiled_work()
+                resp.media = {"ok": True}
+
+        r = api.requests.get("/profiled")
+        validate_response(r)
+
+        path = tmp_path / f"{r.headers['profile-id']}.prof"
+        functions = {func[2] for func in pstats.Stats(str(path)).stats}
+        assert "profiled_work" in functions
+
+    def test_other_requests_not_captured(self):
+        api = SpanAPI(
+            openapi="3.0.0",
+            profiling=ProfilingPolicy(token="secret", respond=True, report_lines=1000),
+        )
+
+        @api.route("/profiled")
+        class Profiled(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                await asyncio.sleep(0.01)
+                profiled_work()
+                await asyncio.sleep(0.01)
+                resp.media = {"ok": True}
+
+        @api.route("/other")
+        class Other(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                for _ in range(3):
+                    unprofiled_work()
+                    await asyncio.sleep(0.005)
+                resp.media = {"ok": True}
+
+        async def main():
+            return await asyncio.gather(
+                asgi_get(api, "/profiled", headers={"x-spanserver-profile": "secret"}),
+                asgi_get(api, "/other"),
+            )
+
+        (_, _, profiled_body), (status, _, _) = run(main())
+
+        assert status == 200
+        assert b"profiled_work" in profiled_body
+        assert b"unprofiled_work" not in profiled_body
+
+    def test_header_report_with_deadline(self):
+        api = SpanAPI(
+            openapi="3.0.0",
+            profiling=ProfilingPolicy(token="secret", respond=True, report_lines=1000),
+        )
+
+        @api.route("/profiled")
+        class Profiled(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                await asyncio.sleep(0.01)
+                profiled_work()
+                await asyncio.sleep(0.01)
+                resp.media = {"ok": True}
+
+        r = api.requests.get(
+            "/profiled",
+            headers={"x-spanserver-profile": "secret", "request-timeout": "5"},
+        )
+
+        assert r.status_code == 200
+        assert "profiled_work" in r.text
+
+    def test_header_report_text_route(self):
+        api = SpanAPI(
+            openapi="3.0.0",
+            profiling=ProfilingPolicy(token="secret", respond=True, report_lines=1000),
+        )
+
+        @api.route("/text")
+        class Text(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                profiled_work()
+                resp.text = "done"
+
+        r = api.requests.get("/text", headers={"x-spanserver-profile": "secret"})
+
+        assert r.status_code == 200
+        assert r.headers["Content-Type"].startswith("text/plain")
+        assert "profiled_work" in r.text
+
+    def test_sample_needs_output_dir(self):
+        with pytest.raises(ValueError):
+            SpanAPI(profiling=ProfilingPolicy(sample_rate=0.5))
+
+
+class TestLoadGenerator:
+    def test_mix(self, api: SpanAPI):
+        in_flight = {"now": 0, "peak": 0}
+
+        @api.route("/items/{item_id}")
+        class Item(SpanRoute):
+            async def on_get(self, req: Request, resp: Response, *, item_id: int):
+                in_flight["now"] += 1
+                in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+                await asyncio.sleep(0.001)
+                in_flight["now"] -= 1
+                resp.media = {"name": str(item_id)}
+
+        @api.route("/items")
+        class Items(SpanRoute):
+            @api.use_schema(req=ItemSchema(), resp=ItemSchema())
+            async def on_post(self, req: Request, resp: Response):
+                resp.media = await req.media_loaded()
+
+        @api.route("/missing")
+        class Missing(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                raise errors_api.NothingToReturnError("missing")
+
+        mix = [
+            LoadRequest("/items/1", weight=3),
+            LoadRequest("/items/2", weight=3, name="GET /items/1"),
+            LoadRequest("/items", method="POST", body={"name": "new"}),
+            LoadRequest("/missing"),
+        ]
+        generator = LoadGenerator(api, mix, concurrency=5, requests=200, seed=1)
+
+        report = run(generator.run())
+
+        assert report.total.requests == 200
+        assert set(report.routes) == {"GET /items/1", "POST /items", "GET /missing"}
+        assert (
+            report.routes["GET /items/1"].requests
+            > report.routes["POST /items"].requests
+        )
+        assert report.routes["POST /items"].statuses == {
+            200: report.routes["POST /items"].requests
+        }
+        assert (
+            report.routes["GET /missing"].errors
+            == report.routes["GET /missing"].requests
+        )
+        assert report.total.errors == report.routes["GET /missing"].requests
+        assert in_flight["peak"] == 5
+
+        for route in report.routes.values():
+            assert route.p50 <= route.p95 <= route.p99 <= route.max
+            assert route.throughput > 0
+
+        table = report.format()
+        assert "GET /items/1" in table
+        assert "p99 ms" in table
+
+    def test_duration(self, api: SpanAPI):
+        @api.route("/items/{item_id}")
+        class Item(SpanRoute):
+            async def on_get(self, req: Request, resp: Response, *, item_id: int):
+                resp.media = {"name": str(item_id)}
+
+        generator = LoadGenerator(
+            api, [LoadRequest("/items/1")], concurrency=2, duration=0.05, warmup=5
+        )
+
+        report = run(generator.run())
+
+        assert report.total.requests > 0
+        assert 0.05 <= report.duration < 1
+
+    def test_lifespan(self, api: SpanAPI):
+        events: List[str] = list()
+
+        @api.on_event("startup")
+        async def start():
+            events.append("startup")
+
+        @api.on_event("shutdown")
+        async def stop():
+            events.append("shutdown")
+
+        @api.route("/events")
+        class Events(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                events.append("request")
+
+        generator = LoadGenerator(api, [LoadRequest("/events")], requests=2)
+        report = run(generator.run())
+
+        assert report.total.statuses == {200: 2}
+        assert events == ["startup", "request", "request", "shutdown"]
+
+        events.clear()
+        generator = LoadGenerator(
+            api, [LoadRequest("/events")], requests=1, lifespan=False
+        )
+        run(generator.run())
+
+        assert events == ["request"]
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        [dict(mix=[], requests=1), dict(concurrency=0, requests=1), dict()],
+        ids=["no-mix", "no-concurrency", "no-limit"],
+    )
+    def test_invalid(self, api: SpanAPI, kwargs: Dict[str, Any]):
+        kwargs.setdefault("mix", [LoadRequest("/items/1")])
+        with pytest.raises(ValueError):
+            LoadGenerator(api, **kwargs)
+
+
+RETAINED: List[bytearray] = list()
+
+
+def retain_block() -> None:
+    RETAINED.append(bytearray(100_000))
+
+
+class TestMemoryTracing:
+    @pytest.fixture
+    def traced_api(self):
+        api = SpanAPI(
+            openapi="3.0.0",
+            memory_tracing=MemoryTracingPolicy(site_sample_rate=1.0, top_sites=3),
+        )
+        yield api
+        tracemalloc.stop()
+        RETAINED.clear()
+
+    def test_attributes_allocations(self, traced_api: SpanAPI):
+        @traced_api.route("/leaky")
+        class Leaky(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                await asyncio.sleep(0.001)
+                retain_block()
+                resp.media = {"name": "leaky"}
+
+        @traced_api.route("/clean")
+        class Clean(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                # Yields to the leaky route while it allocates.
+                await asyncio.sleep(0.001)
+                await asyncio.sleep(0.001)
+                resp.media = {"name": "clean"}
+
+        async def send():
+            await asyncio.gather(
+                *(asgi_get(traced_api, path) for path in ["/leaky", "/clean"] * 5)
+            )
+
+        run(send())
+
+        leaky_stats = Leaky.on_get.plan.stats.memory
+        clean_stats = Clean.on_get.plan.stats.memory
+
+        assert leaky_stats.requests == 5
+        assert leaky_stats.retained >= 5 * 100_000
+        assert leaky_stats.allocated["handler"] >= 5 * 100_000
+        assert leaky_stats.peak >= 100_000
+
+        assert clean_stats.requests == 5
+        assert clean_stats.retained < 5 * 10_000
+        # Blocks retained by concurrent leaky requests are not listed as clean sites.
+        retain_site = f":{self.retain_line}"
+        assert not any(
+            site.location.endswith(retain_site) for site in clean_stats.top_sites(100)
+        )
+
+        assert leaky_stats.sampled == 5
+        top = leaky_stats.top_sites(1)[0]
+        assert top.location.endswith(f"{__file__.split('/')[-1]}:{self.retain_line}")
+        assert top.size >= 100_000
+
+    retain_line = retain_block.__code__.co_firstlineno + 1
+
+    def test_with_deadline(self, traced_api: SpanAPI):
+        @traced_api.route("/leaky")
+        class Leaky(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                await asyncio.sleep(0.001)
+                retain_block()
+                resp.media = {"name": "leaky"}
+
+        run(asgi_get(traced_api, "/leaky", headers={"request-timeout": "5"}))
+
+        stats = Leaky.on_get.plan.stats.memory
+        assert stats.requests == 1
+        assert stats.allocated["handler"] >= 100_000
+        assert stats.retained >= 100_000
+
+    def test_decode_and_dump(self, traced_api: SpanAPI):
+        @traced_api.route("/items")
+        class Items(SpanRoute):
+            @traced_api.use_schema(req=ItemSchema(), resp=ItemSchema(many=True))
+            async def on_post(self, req: Request, resp: Response):
+                item = await req.media_loaded()
+                resp.media = [item] * 1000
+
+        with traced_api.requests as client:
+            r = client.post("/items", json={"name": "x" * 10_000})
+            validate_response(r)
+
+        stats = Items.on_post.plan.stats.memory
+        assert stats.requests == 1
+        assert stats.allocated["decode"] >= 10_000
+        assert stats.allocated["dump"] > 0
+
+    def test_report(self, traced_api: SpanAPI):
+        @traced_api.route("/leaky")
+        class Leaky(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                await asyncio.sleep(0.001)
+                retain_block()
+                resp.media = {"name": "leaky"}
+
+        run(asgi_get(traced_api, "/leaky"))
+
+        report = traced_api.memory_report()
+        lines = report.splitlines()
+        assert lines[0].startswith(f"{Leaky.on_get.plan.name}: 1 requests")
+        assert "allocated by stage: admission" in lines[1]
+        assert f":{self.retain_line}" in lines[2]
+
+    def test_report_needs_tracing(self, api: SpanAPI):
+        with pytest.raises(ValueError):
+            api.memory_report()
+
+
+class TestSlowRequests:
+    def test_logs_slow(self):
+        collector = RecordCollector()
+        policy = SlowRequestPolicy(threshold=0.02, handlers=[collector])
+        api = SpanAPI(openapi="3.0.0", slow_requests=policy)
+
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            @api.use_schema(req=ItemSchema(), resp=ItemSchema(many=True))
+            @api.paged(limit=50)
+            async def on_post(self, req: Request, resp: Response, *, item_id: int):
+                item = await req.media_loaded()
+                if item_id > 1:
+                    await asyncio.sleep(0.03)
+                resp.media = [item]
+                resp.paging.total_items = 1
+
+        with api.requests as client:
+            r = client.post(
+                "/items/2",
+                params={
+                    "paging-offset": "10",
+                    "paging-limit": "5",
+                    "project.name": "1",
+                },
+                json={"name": "slow"},
+            )
+            validate_response(r)
+
+            r = client.post("/items/1", json={"name": "fast"})
+            validate_response(r)
+
+        api.slow_log.sink.stop()
+        assert len(collector.records) == 1
+
+        record = collector.records[0]
+        assert record.name == "spanserver.slow_requests"
+        assert record.levelno == logging.WARNING
+        assert record.getMessage().startswith("POST /items/2 took ")
+        assert record.getMessage().endswith(" - 200")
+        assert record.source.endswith("Items.on_post")
+        assert record.http_method == "post"
+        assert record.path_params == {"item_id": "2"}
+        assert record.status == 200
+        assert record.duration >= 0.03
+        assert record.stages["handler"] >= 0.03
+        assert set(record.stages) == {
+            "admission",
+            "params",
+            "decode",
+            "handler",
+            "dump",
+        }
+        assert record.query_bytes == len(
+            "paging-offset=10&paging-limit=5&project.name=1"
+        )
+        assert record.request_bytes == len(r.request.body)
+        assert record.response_bytes == len(r.content)
+        assert record.mimetype == "application/json"
+        assert record.projection == {"name": 1}
+        assert record.paging == {"offset": 10, "limit": 5}
+
+        stats = api.route_stats()
+        assert sum(method.slow for method in stats.values()) == 1
+
+    def test_without_stage_timing(self):
+        collector = RecordCollector()
+        policy = SlowRequestPolicy(threshold=0.02, handlers=[collector])
+        api = SpanAPI(openapi="3.0.0", slow_requests=policy, stage_timing=False)
+
+        @api.route("/items/{item_id}")
+        class Items(SpanRoute):
+            @api.use_schema(req=ItemSchema(), resp=ItemSchema())
+            async def on_post(self, req: Request, resp: Response, *, item_id: int):
+                await asyncio.sleep(0.03)
+                resp.media = await req.media_loaded()
+
+        with api.requests as client:
+            r = client.post("/items/2", json={"name": "slow"})
+            validate_response(r)
+
+        api.slow_log.sink.stop()
+        assert len(collector.records) == 1
+        assert collector.records[0].stages["handler"] >= 0.03
+
+        stats = next(iter(api.route_stats().values()))
+        assert stats.stages["total"].count == 0
+
+
+class TestLoopLag:
+    def test_measures_lag(self):
+        api = SpanAPI(openapi="3.0.0", loop_lag=LoopLagPolicy(interval=0.01))
+
+        async def main():
+            await api.loop_monitor.start()
+            await asyncio.sleep(0.05)
+            # Block the loop, like a CPU-heavy dump would.
+            time.sleep(0.1)
+            await asyncio.sleep(0.05)
+            await api.loop_monitor.stop()
+
+        run(main())
+
+        stats = api.loop_lag_stats()
+        assert stats.peak >= 0.08
+        assert stats.samples.count >= 5
+        assert stats.samples.quantile(1.0) >= 0.08
+        assert stats.lag < stats.peak
+
+    def test_lag_not_measured(self, api: SpanAPI):
+        with pytest.raises(ValueError):
+            api.loop_lag_stats()
+
+    def test_sheds_by_priority(self):
+        api = SpanAPI(
+            openapi="3.0.0", loop_lag=LoopLagPolicy(shed_threshold=0.1, retry_after=3),
+        )
+
+        @api.route("/reports")
+        class Reports(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                resp.media = {"ok": True}
+
+        @api.route("/exports")
+        class Exports(SpanRoute):
+            @api.priority(Priority.LOW)
+            async def on_get(self, req: Request, resp: Response):
+                resp.media = {"ok": True}
+
+        @api.route("/health")
+        class Health(SpanRoute):
+            @api.priority(Priority.HIGH)
+            async def on_get(self, req: Request, resp: Response):
+                resp.media = {"ok": True}
+
+        api.compile()
+
+        async def get_all():
+            return [
+                (await asgi_get(api, path))[:2]
+                for path in ("/reports", "/exports", "/health")
+            ]
+
+        def statuses(lag: float) -> List[int]:
+            api.loop_monitor.stats.lag = lag
+            return [status for status, _ in run(get_all())]
+
+        assert statuses(0.01) == [200, 200, 200]
+        assert statuses(0.07) == [200, 503, 200]
+        assert statuses(0.2) == [503, 503, 200]
+
+        api.loop_monitor.stats.lag = 0.2
+        status, headers = run(asgi_get(api, "/reports"))[:2]
+        assert status == 503
+        assert headers["retry-after"] == "3"
+        assert headers["error-code"] == "1006"
+
+        stats = api.route_stats()
+        assert stats[Reports.on_get.plan.name].lag_shed == 2
+        assert stats[Exports.on_get.plan.name].lag_shed == 2
+        assert stats[Health.on_get.plan.name].lag_shed == 0
+
+    def test_monitor_only(self):
+        api = SpanAPI(openapi="3.0.0", loop_lag=LoopLagPolicy())
+
+        @api.route("/exports")
+        class Exports(SpanRoute):
+            @api.priority(Priority.LOW)
+            async def on_get(self, req: Request, resp: Response):
+                resp.media = {"ok": True}
+
+        api.compile()
+        api.loop_monitor.stats.lag = 10.0
+
+        status, _, _ = run(asgi_get(api, "/exports"))
+        assert status == 200
+
+    def test_metrics(self):
+        api = SpanAPI(openapi="3.0.0", loop_lag=LoopLagPolicy(shed_threshold=0.1))
+
+        @api.route("/reports")
+        class Reports(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                resp.media = {"ok": True}
+
+        api.add_metrics_route()
+        api.compile()
+        api.loop_monitor.observe(0.3)
+
+        run(asgi_get(api, "/reports"))
+        text = run(asgi_get(api, "/metrics"))[2].decode()
+
+        assert "spanserver_event_loop_lag_seconds 0.15" in text
+        assert "spanserver_event_loop_lag_peak_seconds 0.3" in text
+        assert "spanserver_event_loop_lag_samples_seconds_count 1" in text
+        assert (
+            'spanserver_requests_lag_shed_total{route="/reports",method="GET"} 1'
+            in text
+        )
+
+    @pytest.mark.parametrize(
+        "policy", [LoopLagPolicy(interval=0), LoopLagPolicy(smoothing=1.5)]
+    )
+    def test_invalid_policy(self, policy: LoopLagPolicy):
+        with pytest.raises(ValueError):
+            SpanAPI(openapi="3.0.0", loop_lag=policy)
+
+
 class TestBasicDecoding:
     def test_mimetype_known(self, api: SpanAPI):
         @api.route("/test")
@@ -224,6 +1724,81 @@ class TestErrorHandling:
             r = client.post("/error")
             validate_error(r, errors_api.InvalidMethodError)
 
+        assert r.headers["Allow"] == "GET, HEAD, OPTIONS"
+
+    def test_invalid_method_error_inherited(self, api: SpanAPI):
+        class BaseRoute(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                resp.text = "got"
+
+        @api.route("/error")
+        class ErrorRoute(BaseRoute):
+            async def on_post(self, req: Request, resp: Response):
+                pass
+
+        with api.requests as client:
+            r = client.get("/error")
+            validate_response(r, text_value="got")
+
+            r = client.delete("/error")
+            validate_error(r, errors_api.InvalidMethodError)
+
+        assert r.headers["Allow"] == "GET, HEAD, OPTIONS, POST"
+
+    def test_invalid_method_error_ids_unique(self, api: SpanAPI):
+        @api.route("/error")
+        class ErrorRoute(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                pass
+
+        with api.requests as client:
+            error_1 = validate_error(
+                client.post("/error"), errors_api.InvalidMethodError
+            )
+            error_2 = validate_error(
+                client.post("/error"), errors_api.InvalidMethodError
+            )
+
+        assert error_1.id != error_2.id
+
+    def test_options_from_method_table(self, api: SpanAPI):
+        @api.route("/test")
+        class TestRoute(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                raise AssertionError("handler should not be called")
+
+            async def on_put(self, req: Request, resp: Response):
+                raise AssertionError("handler should not be called")
+
+        with api.requests as client:
+            r = client.options("/test")
+            validate_response(r, valid_status_codes=204)
+
+        assert r.headers["Allow"] == "GET, HEAD, OPTIONS, PUT"
+        assert "error-name" not in r.headers
+
+    def test_head_from_method_table(self, api: SpanAPI):
+        @api.route("/test")
+        class TestRoute(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                raise AssertionError("handler should not be called")
+
+        with api.requests as client:
+            r = client.head("/test")
+            validate_response(r)
+
+        assert r.headers["Allow"] == "GET, HEAD, OPTIONS"
+
+    def test_head_no_get(self, api: SpanAPI):
+        @api.route("/test")
+        class TestRoute(SpanRoute):
+            async def on_post(self, req: Request, resp: Response):
+                pass
+
+        with api.requests as client:
+            r = client.head("/test")
+            validate_error(r, errors_api.InvalidMethodError)
+
     def test_route_type_data_error(self, api: SpanAPI):
         @api.route("/error")
         class ErrorRoute(SpanRoute):
@@ -293,6 +1868,107 @@ class TestErrorHandling:
 
         assert not r.content
 
+    def test_error_log_client_error(self):
+        api, collector = api_with_error_log()
+
+        @api.route("/error")
+        class ErrorRoute(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                raise errors_api.RequestValidationError("Bad Data")
+
+        with api.requests as client:
+            r = client.get("/error")
+            error = validate_error(r, errors_api.RequestValidationError)
+
+        api.error_log.sink.stop()
+
+        assert len(collector.records) == 1
+        record = collector.records[0]
+
+        assert record.levelno == logging.WARNING
+        assert record.exc_info is None
+        assert record.error_id == error.id
+        assert record.error_name == "RequestValidationError"
+        assert record.error_code == errors_api.RequestValidationError.api_code
+        assert record.http_code == 400
+        assert record.http_method == "get"
+        assert record.source.endswith("ErrorRoute.on_get")
+
+    def test_error_log_server_error_traceback(self):
+        api, collector = api_with_error_log()
+
+        @api.route("/error")
+        class ErrorRoute(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                raise ValueError("Some Error")
+
+        with api.requests as client:
+            r = client.get("/error")
+            validate_error(r, errors_api.APIError)
+
+        api.error_log.sink.stop()
+
+        assert len(collector.records) == 1
+        record = collector.records[0]
+
+        assert record.levelno == logging.ERROR
+        assert record.exc_info[0] is ValueError
+
+    def test_error_log_rate_limit(self):
+        api, collector = api_with_error_log(rate_limit=2, rate_window=60)
+
+        @api.route("/error")
+        class ErrorRoute(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                raise errors_api.RequestValidationError("Bad Data")
+
+        with api.requests as client:
+            for _ in range(5):
+                r = client.get("/error")
+                validate_error(r, errors_api.RequestValidationError)
+
+        api.error_log.sink.stop()
+
+        assert len(collector.records) == 2
+
+    def test_error_log_rate_limit_reports_suppressed(self):
+        api, collector = api_with_error_log(rate_limit=1, rate_window=0)
+
+        @api.route("/error")
+        class ErrorRoute(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                raise errors_api.RequestValidationError("Bad Data")
+
+        api.error_log.policy.rate_window = 60
+        with api.requests as client:
+            for _ in range(3):
+                client.get("/error")
+
+        api.error_log.policy.rate_window = 0
+        with api.requests as client:
+            client.get("/error")
+
+        api.error_log.sink.stop()
+
+        assert len(collector.records) == 2
+        assert "(2 similar errors suppressed)" in collector.records[-1].getMessage()
+
+    def test_error_log_sample_client_errors(self):
+        api, collector = api_with_error_log(client_error_sample_rate=0)
+
+        @api.route("/error")
+        class ErrorRoute(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                raise errors_api.RequestValidationError("Bad Data")
+
+        with api.requests as client:
+            r = client.get("/error")
+            validate_error(r, errors_api.RequestValidationError)
+
+        api.error_log.sink.stop()
+
+        assert not collector.records
+
 
 class TestUseSchemaReq:
     @pytest.mark.parametrize(
@@ -0,0 +1,534 @@
+"""
+Performance guards for spanserver. Measurements are printed for the test logs, and
+assertions only catch order-of-magnitude regressions so they hold on slow CI boxes.
+
+The hot-path microbenchmarks also save their timings to
+``zdevelop/tests/_reports/benchmarks.json``. Point ``SPANSERVER_BENCH_BASELINE`` at the
+results file of an earlier run to fail any benchmark that got slower than its baseline
+by more than ``SPANSERVER_BENCH_TOLERANCE`` (a fraction, ``0.5`` by default).
+"""
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import pathlib
+import pytest
+import subprocess
+import sys
+import time
+import uuid
+from grahamcracker import schema_for, DataSchema
+from marshmallow import Schema
+from responder.formats import get_formats
+from typing import Any, Callable, Awaitable, Dict, List, Optional, Tuple
+
+from spantools import encode_content
+
+from spanserver import SpanAPI, SpanRoute, Request, Response, ErrorLogPolicy
+from spanserver import MimeType, ParamInfo, ParamTypes, errors_api
+from spanserver._method_wrapper import _handle_route_error
+from spanserver._paging import _set_up_paging_resp, _adjust_paging_totals
+
+
+@dataclasses.dataclass
+class Name:
+    id: uuid.UUID
+    first: str
+    last: str
+
+
+@schema_for(Name)
+class NameSchema(DataSchema[Name]):
+    pass
+
+
+HARRY = Name(uuid.uuid4(), "Harry", "Potter")
+
+
+def build_req_resp(
+    path: str,
+    query: bytes = b"",
+    method: str = "GET",
+    headers: Optional[Dict[str, str]] = None,
+    body: bytes = b"",
+):
+    raw_headers = [(b"host", b"testserver")]
+    if headers is not None:
+        raw_headers.extend(
+            (key.lower().encode(), value.encode()) for key, value in headers.items()
+        )
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "scheme": "http",
+        "server": ("testserver", 80),
+        "root_path": "",
+        "path": path,
+        "query_string": query,
+        "headers": raw_headers,
+        "session": dict(),
+    }
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    req = Request(scope, receive)
+    resp = Response(req=req, formats=get_formats())
+    return req, resp
+
+
+def time_per_call(call: Callable[[], Awaitable], iterations: int) -> float:
+    async def run() -> float:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            await call()
+        return time.perf_counter() - start
+
+    return asyncio.get_event_loop().run_until_complete(run()) / iterations
+
+
+def import_times(module: str) -> Dict[str, int]:
+    """
+    Imports ``module`` in a fresh interpreter with ``-X importtime`` and returns the
+    cumulative import time in microseconds of every module that was loaded.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+
+    times: Dict[str, int] = dict()
+    for line in result.stderr.decode().splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:") :].split("|")  # noqa: E203
+            times[name.strip()] = int(cumulative)
+        except ValueError:
+            # Header line.
+            continue
+
+    return times
+
+
+class TestImportTime:
+    def test_docs_not_imported(self):
+        times = import_times("spanserver")
+
+        print(f"\nspanserver import: {times['spanserver'] / 1000:.1f}ms")
+
+        assert "spanserver" in times
+        for module in ["spanserver._openapi", "inflect", "gemma"]:
+            assert module not in times, f"{module} imported eagerly"
+
+    def test_docs_imported_on_spec(self, api: SpanAPI):
+        @api.route("/names")
+        class Names(SpanRoute):
+            @api.use_schema(resp=NameSchema())
+            async def on_get(self, req: Request, resp: Response):
+                """Fetch a name."""
+                resp.media = HARRY
+
+        assert "---" not in (Names.__doc__ or "")
+        assert "Fetch a name." in api.openapi.openapi
+        assert "---" in Names.__doc__
+
+
+class TestFrameworkOverhead:
+    def test_per_request_overhead(self, api: SpanAPI):
+        @api.route("/names/{name_id}")
+        class NameRoute(SpanRoute):
+            @api.use_schema(resp=NameSchema(many=True))
+            @api.paged(limit=10)
+            async def on_get(self, req: Request, resp: Response, *, name_id: int):
+                resp.media = [HARRY]
+                resp.paging.total_items = 1
+
+        api.compile()
+        route = NameRoute()
+        endpoint = NameRoute.on_get.plan.endpoint
+        iterations = 2000
+
+        async def call_compiled():
+            req, resp = build_req_resp("/names/1", b"paging-limit=5")
+            await route.on_get(req, resp, name_id="1")
+            assert resp.status_code is None, resp.headers
+
+        async def call_raw():
+            req, resp = build_req_resp("/names/1", b"paging-limit=5")
+            resp._paging = type("Paging", (), {"total_items": None})()
+            await endpoint(route, req, resp, name_id=1)
+
+        compiled = time_per_call(call_compiled, iterations)
+        raw = time_per_call(call_raw, iterations)
+        overhead = compiled - raw
+
+        print(
+            f"compiled: {compiled * 1e6:.1f}us/request,"
+            f" raw handler: {raw * 1e6:.1f}us/request,"
+            f" framework overhead: {overhead * 1e6:.1f}us/request"
+        )
+
+        assert overhead < 0.001
+
+
+def register_routes(count: int) -> float:
+    """
+    Registers ``count`` routes, each with a schema-decorated method, on a new API and
+    compiles it. Returns the seconds taken.
+    """
+    api = SpanAPI(openapi="3.0.0")
+
+    start = time.perf_counter()
+    for i in range(count):
+
+        @api.use_schema(req=NameSchema(), resp=NameSchema())
+        async def on_get(self, req: Request, resp: Response) -> None:
+            resp.media = HARRY
+
+        route = type(f"Route{i}", (SpanRoute,), {"on_get": on_get})
+        api.add_route(f"/names/{i}", route)
+
+    api.compile()
+    return time.perf_counter() - start
+
+
+class TestRegistrationScaling:
+    def test_near_linear(self):
+        small_count = 1000
+        large_count = 5000
+
+        # Warm up imports and caches so they are not billed to the small run.
+        register_routes(100)
+
+        small = register_routes(small_count) / small_count
+        large = register_routes(large_count) / large_count
+
+        print(
+            f"\nper route: {small * 1e6:.1f}µs at {small_count}, "
+            f"{large * 1e6:.1f}µs at {large_count}"
+        )
+
+        # Quadratic registration would make each route ~5x slower at 5x the routes.
+        assert large < small * 2.5
+
+
+# HOT PATH MICROBENCHMARKS #####
+
+BASELINE_ENV = "SPANSERVER_BENCH_BASELINE"
+TOLERANCE_ENV = "SPANSERVER_BENCH_TOLERANCE"
+RESULTS_PATH = pathlib.Path("./zdevelop/tests/_reports/benchmarks.json")
+
+SMALL_ITEMS = 5
+LARGE_ITEMS = 1000
+
+
+def best_time_per_call(call: Callable[[], Any], iterations: int, repeats: int = 5):
+    """
+    Seconds per call of the fastest of ``repeats`` runs. The fastest run is the one
+    least disturbed by the rest of the machine, so it is the most comparable between
+    runs. ``call`` may be a plain function or a coroutine function.
+    """
+    if asyncio.iscoroutinefunction(call):
+        return min(time_per_call(call, iterations) for _ in range(repeats))
+
+    def run() -> float:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            call()
+        return (time.perf_counter() - start) / iterations
+
+    return min(run() for _ in range(repeats))
+
+
+class BenchmarkRecorder:
+    """
+    Records hot-path timings in microseconds per call, and checks them against the
+    baseline results file named by ``SPANSERVER_BENCH_BASELINE``, if set.
+    """
+
+    def __init__(self, baseline: Dict[str, float], tolerance: float) -> None:
+        self.baseline: Dict[str, float] = baseline
+        self.tolerance: float = tolerance
+        self.results: Dict[str, float] = dict()
+
+    @classmethod
+    def from_env(cls) -> "BenchmarkRecorder":
+        baseline: Dict[str, float] = dict()
+        baseline_path = os.environ.get(BASELINE_ENV)
+        if baseline_path:
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+
+        return cls(baseline, float(os.environ.get(TOLERANCE_ENV, "0.5")))
+
+    def measure(self, name: str, call: Callable[[], Any], iterations: int) -> float:
+        micros = best_time_per_call(call, iterations) * 1e6
+        self.results[name] = micros
+
+        baseline = self.baseline.get(name)
+        if baseline is None:
+            print(f"\n{name}: {micros:.1f}µs")
+            return micros
+
+        change = micros / baseline - 1
+        print(f"\n{name}: {micros:.1f}µs ({change:+.0%} vs {baseline:.1f}µs baseline)")
+        assert change <= self.tolerance, (
+            f"{name} regressed {change:.0%}, more than the"
+            f" {self.tolerance:.0%} tolerance"
+        )
+        return micros
+
+    def save(self, path: pathlib.Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.results, f, indent=2, sort_keys=True)
+
+
+@pytest.fixture(scope="module")
+def bench():
+    recorder = BenchmarkRecorder.from_env()
+    yield recorder
+    recorder.save(RESULTS_PATH)
+
+
+@dataclasses.dataclass
+class Record:
+    id: uuid.UUID
+    name: str
+    score: float
+    active: bool
+    tags: List[str]
+
+
+@schema_for(Record)
+class RecordSchema(DataSchema[Record]):
+    pass
+
+
+@dataclasses.dataclass
+class Tree:
+    id: uuid.UUID
+    name: str
+    children: List[Record]
+
+
+@schema_for(Tree)
+class TreeSchema(DataSchema[Tree]):
+    pass
+
+
+def make_record(index: int) -> Record:
+    return Record(
+        id=uuid.UUID(int=index),
+        name=f"record {index}",
+        score=index / 7,
+        active=index % 2 == 0,
+        tags=[f"tag-{index % 10}", f"group-{index % 3}"],
+    )
+
+
+@dataclasses.dataclass
+class Payload:
+    """Representative route media for a hot-path benchmark."""
+
+    name: str
+    media: Any
+    schema: Schema
+    mimetype: MimeType
+    projection: Dict[str, int]
+    iterations: int
+
+
+def make_payload(shape: str, size: str, mimetype: MimeType) -> Payload:
+    """
+    Flat payloads are records, and nested payloads are a record tree. Large flat
+    payloads are a list of records, which can only be sent as JSON.
+    """
+    count = SMALL_ITEMS if size == "small" else LARGE_ITEMS
+
+    if shape == "flat" and size == "small":
+        media: Any = make_record(0)
+        schema: Schema = RecordSchema()
+    elif shape == "flat":
+        media = [make_record(i) for i in range(count)]
+        schema = RecordSchema(many=True)
+    else:
+        media = Tree(uuid.UUID(int=0), "root", [make_record(i) for i in range(count)])
+        schema = TreeSchema()
+
+    return Payload(
+        name=f"{shape}-{size}-{mimetype.name.lower()}",
+        media=media,
+        schema=schema,
+        mimetype=mimetype,
+        projection={"tags": 0} if shape == "flat" else {"name": 0},
+        iterations=500 if size == "small" else 3,
+    )
+
+
+PAYLOADS = [
+    make_payload(shape, size, mimetype)
+    for shape in ("flat", "nested")
+    for size in ("small", "large")
+    for mimetype in (MimeType.JSON, MimeType.BSON)
+    if not (shape == "flat" and size == "large" and mimetype is MimeType.BSON)
+]
+
+
+def payload_id(payload: Payload) -> str:
+    return payload.name
+
+
+def compile_plan(payload: Payload):
+    """Compiles a route method that loads and dumps ``payload``, and returns its plan."""
+    api = SpanAPI(openapi="3.0.0")
+
+    @api.route("/records")
+    class Records(SpanRoute):
+        @api.use_schema(req=payload.schema, resp=payload.schema)
+        async def on_post(self, req: Request, resp: Response):
+            resp.media = await req.media_loaded()
+
+    api.compile()
+    return Records.on_post.plan
+
+
+class TestHotPaths:
+    @pytest.mark.parametrize("payload", PAYLOADS, ids=payload_id)
+    def test_request_media(self, bench: BenchmarkRecorder, payload: Payload):
+        plan = compile_plan(payload)
+        headers = {"Content-Type": payload.mimetype.value}
+        body = encode_content(
+            payload.media, payload.mimetype, headers, data_schema=payload.schema
+        )
+
+        async def load():
+            req, _ = build_req_resp(
+                "/records", method="POST", headers=headers, body=body
+            )
+            req._plan = plan
+            await req.media_loaded()
+
+        bench.measure(f"request_media[{payload.name}]", load, payload.iterations)
+
+    @pytest.mark.parametrize("projected", [False, True], ids=["full", "projected"])
+    @pytest.mark.parametrize("payload", PAYLOADS, ids=payload_id)
+    def test_dump_media(
+        self, bench: BenchmarkRecorder, payload: Payload, projected: bool
+    ):
+        plan = compile_plan(payload)
+        headers = {"Accept": payload.mimetype.value}
+        req, _ = build_req_resp("/records", headers=headers)
+
+        def dump():
+            resp = Response(req=req, formats=get_formats())
+            resp._plan = plan
+            if projected:
+                resp._projection = payload.projection
+            resp.media = payload.media
+            resp._dump_media()
+
+        name = f"dump_media[{payload.name}{'-projected' if projected else ''}]"
+        bench.measure(name, dump, payload.iterations)
+
+    def test_projection_builder(self, bench: BenchmarkRecorder):
+        plan = compile_plan(make_payload("nested", "small", MimeType.JSON))
+        builder = plan.projection_builder
+        keys = frozenset({"name": 0, "children": 1}.items())
+        uncached = type(builder)._build_projection_schema.__wrapped__
+
+        def build_cached():
+            builder.build_projection_schema(keys)
+
+        def build_uncached():
+            uncached(builder, keys, builder.hash)
+
+        bench.measure("projection_builder[cached]", build_cached, 5000)
+        bench.measure("projection_builder[uncached]", build_uncached, 200)
+
+    @pytest.mark.parametrize(
+        "query",
+        [b"", b"paging-offset=40&paging-limit=20&sort=name"],
+        ids=["default", "query"],
+    )
+    def test_paging(self, bench: BenchmarkRecorder, query: bytes):
+        req, resp = build_req_resp("/records", query)
+
+        def set_up():
+            paging = _set_up_paging_resp(req, app_limit=50)
+            paging.total_items = 1000
+            _adjust_paging_totals(paging)
+            paging.to_headers(resp.headers)
+
+        name = f"paging[{'query' if query else 'default'}]"
+        bench.measure(name, set_up, 2000)
+
+    @pytest.mark.parametrize(
+        "decode_type, value",
+        [(int, "12345"), (uuid.UUID, str(uuid.UUID(int=1))), (bool, "true")],
+        ids=["int", "uuid", "bool"],
+    )
+    def test_load_param(self, bench: BenchmarkRecorder, decode_type: type, value: str):
+        info = ParamInfo(
+            param_type=ParamTypes.PATH, name="value", decode_types=[decode_type]
+        )
+
+        def load():
+            info.load_param(value)
+
+        bench.measure(f"load_param[{decode_type.__name__}]", load, 20000)
+
+    @pytest.mark.parametrize(
+        "error",
+        [
+            errors_api.NothingToReturnError,
+            errors_api.RequestValidationError,
+            ValueError,
+        ],
+        ids=lambda error: error.__name__,
+    )
+    def test_handle_route_error(self, bench: BenchmarkRecorder, error: type):
+        api = SpanAPI(
+            openapi="3.0.0",
+            # Without a rate limit every error is logged, instead of most being dropped.
+            error_log_policy=ErrorLogPolicy(
+                rate_limit=None, handlers=[logging.NullHandler()]
+            ),
+        )
+        plan = compile_plan(make_payload("flat", "small", MimeType.JSON))
+        req, _ = build_req_resp("/records", method="POST")
+
+        def handle():
+            resp = Response(req=req, formats=get_formats())
+            resp._plan = plan
+            try:
+                raise error("benchmark error")
+            except BaseException as exc:
+                _handle_route_error(exc, req, resp, api.error_log, "benchmark")
+
+        try:
+            bench.measure(f"handle_route_error[{error.__name__}]", handle, 2000)
+        finally:
+            api.error_log.sink.stop()
+
+
+class TestBenchmarkRecorder:
+    def test_regression_fails(self):
+        recorder = BenchmarkRecorder({"sleep": 1.0}, tolerance=0.5)
+
+        with pytest.raises(AssertionError, match="sleep regressed"):
+            recorder.measure("sleep", lambda: time.sleep(0.001), 1)
+
+    def test_within_tolerance(self, tmp_path: pathlib.Path):
+        recorder = BenchmarkRecorder({"noop": 1e6}, tolerance=0.5)
+        recorder.measure("noop", lambda: None, 10)
+
+        results_path = tmp_path / "benchmarks.json"
+        recorder.save(results_path)
+
+        with open(results_path) as f:
+            assert list(json.load(f)) == ["noop"]
@@ -0,0 +1,150 @@
+import json
+import subprocess
+import sys
+import textwrap
+import pytest
+import yaml
+
+from spanserver import SpanAPI, SpanRoute, Request, Response
+from spanserver._cli import main, load_api
+
+
+API_MODULE = textwrap.dedent(
+    '''
+    from spanserver import SpanAPI, SpanRoute, Request, Response
+
+    api = SpanAPI(title="CLI API", version="1.0.0", openapi="3.0.0")
+    not_api = object()
+
+
+    @api.route("/names")
+    class Names(SpanRoute):
+        async def on_get(self, req: Request, resp: Response):
+            """Fetch some names."""
+            resp.media = "name"
+    '''
+)
+
+
+@pytest.fixture
+def api_module(tmp_path, monkeypatch):
+    module_path = tmp_path / "cli_api_module.py"
+    module_path.write_text(API_MODULE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+
+    yield "cli_api_module"
+
+    sys.modules.pop("cli_api_module", None)
+
+
+class TestOpenAPIBuild:
+    def test_build_yaml(self, api_module, tmp_path):
+        output = tmp_path / "spec.yaml"
+        assert main(["openapi", "build", f"{api_module}:api", "-o", str(output)]) == 0
+
+        spec = yaml.safe_load(output.read_text())
+        assert spec["info"]["title"] == "CLI API"
+        assert spec["paths"]["/names"]["get"]["summary"] == "Fetch some names."
+
+    def test_build_json(self, api_module, tmp_path):
+        output = tmp_path / "spec.json"
+        assert main(["openapi", "build", f"{api_module}:api", "-o", str(output)]) == 0
+
+        spec = json.loads(output.read_text())
+        assert spec["paths"]["/names"]["get"]["summary"] == "Fetch some names."
+
+    @pytest.mark.parametrize(
+        "target", ["no_colon", "cli_api_module:not_api", "cli_api_module:missing"]
+    )
+    def test_bad_target(self, api_module, target, capsys):
+        assert main(["openapi", "build", target]) == 1
+        assert "error:" in capsys.readouterr().err
+
+    def test_load_api(self, api_module):
+        assert isinstance(load_api(f"{api_module}:api"), SpanAPI)
+
+    def test_module_entry_point(self, api_module, tmp_path):
+        output = tmp_path / "spec.yaml"
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "spanserver",
+                "openapi",
+                "build",
+                f"{api_module}:api",
+                "-o",
+                str(output),
+            ],
+            check=True,
+            cwd=str(tmp_path),
+        )
+        assert "/names" in yaml.safe_load(output.read_text())["paths"]
+
+
+class TestLoad:
+    def test_requests(self, api_module, capsys):
+        args = ["load", f"{api_module}:api", "-r", "GET /names", "-r", "/missing"]
+        assert main(args + ["-c", "4", "-n", "50"]) == 0
+
+        out = capsys.readouterr().out
+        assert "50 requests" in out
+        assert "GET /names" in out
+        assert "GET /missing" in out
+
+    def test_mix_file(self, api_module, tmp_path, capsys):
+        mix_path = tmp_path / "mix.yaml"
+        mix_path.write_text(
+            yaml.safe_dump([{"path": "/names", "weight": 2, "name": "names"}])
+        )
+
+        args = ["load", f"{api_module}:api", "-m", str(mix_path), "-n", "20", "--json"]
+        assert main(args) == 0
+
+        report = json.loads(capsys.readouterr().out)
+        assert report["total"]["requests"] == 20
+        assert report["routes"]["names"]["statuses"] == {"200": 20}
+
+    def test_bad_mix(self, api_module, tmp_path, capsys):
+        mix_path = tmp_path / "mix.yaml"
+        mix_path.write_text(yaml.safe_dump([{"route": "/names"}]))
+
+        assert main(["load", f"{api_module}:api", "-m", str(mix_path)]) == 1
+        assert "could not load mix" in capsys.readouterr().err
+
+
+class TestPrebuiltSpec:
+    def test_serves_prebuilt(self, api_module, tmp_path):
+        output = tmp_path / "spec.yaml"
+        main(["openapi", "build", f"{api_module}:api", "-o", str(output)])
+
+        api = SpanAPI(openapi="3.0.0", openapi_prebuilt=output)
+
+        @api.route("/names")
+        class Names(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                """Fetch some names."""
+                resp.media = "name"
+
+        r = api.requests.get("/schema.yml")
+        assert r.status_code == 200
+        assert r.content == output.read_bytes()
+
+        r = api.requests.get("/schema.yml", headers={"Accept": "application/json"})
+        assert r.json()["info"]["title"] == "CLI API"
+
+        # Docstrings are never converted in production mode.
+        assert Names.__doc__ is None
+        assert not api._undocumented_routes
+
+    def test_prebuilt_json(self, api_module, tmp_path):
+        output = tmp_path / "spec.json"
+        main(["openapi", "build", f"{api_module}:api", "-o", str(output)])
+
+        api = SpanAPI(openapi="3.0.0", openapi_prebuilt=output)
+        assert yaml.safe_load(api.openapi.openapi)["info"]["title"] == "CLI API"
+
+    def test_prebuilt_requires_openapi(self, tmp_path):
+        with pytest.raises(ValueError):
+            SpanAPI(openapi_prebuilt=tmp_path / "spec.yaml")
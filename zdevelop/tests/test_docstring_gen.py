@@ -434,11 +434,12 @@ class TestDocSchemas:
         api_route_2 = load_route(spec, route="/route/second")
         schema_2 = get_route_req_schema(api_route_2)
 
+        # Identical schemas share one component.
         assert "NameGetReq1" in schema_1["$ref"]
-        assert "NameGetReq2" in schema_2["$ref"]
+        assert "NameGetReq1" in schema_2["$ref"]
 
         assert "NameGetReq1" in spec["components"]["schemas"]
-        assert "NameGetReq2" in spec["components"]["schemas"]
+        assert "NameGetReq2" not in spec["components"]["schemas"]
 
         assert "Names" in api_route_1["get"]["tags"]
         assert "Names" in api_route_2["get"]["tags"]
@@ -447,6 +448,83 @@ class TestDocSchemas:
         assert len(tag_defs) == 1
         assert tag_defs[0]["description"] == Name.__doc__
 
+    def test_req_schema_different_options(self, api: SpanAPI):
+        @api.route("/route")
+        class Route(SpanRoute):
+            @api.use_schema(req=NameSchema(only=["first"]))
+            def on_get(self, req: Request, resp: Response):
+                pass
+
+        @api.route("/route/second")
+        class Route(SpanRoute):
+            @api.use_schema(req=NameSchema(partial=True))
+            def on_get(self, req: Request, resp: Response):
+                pass
+
+        @api.route("/route/third")
+        class Route(SpanRoute):
+            @api.use_schema(req=NameSchema(only=["first"]))
+            def on_get(self, req: Request, resp: Response):
+                pass
+
+        spec = yaml.safe_load(get_spec(api))
+
+        schema_1 = get_route_req_schema(load_route(spec))
+        schema_2 = get_route_req_schema(load_route(spec, route="/route/second"))
+        schema_3 = get_route_req_schema(load_route(spec, route="/route/third"))
+
+        assert "NameGetReq1" in schema_1["$ref"]
+        assert "NameGetReq2" in schema_2["$ref"]
+        assert "NameGetReq1" in schema_3["$ref"]
+
+        components = spec["components"]["schemas"]
+        assert list(components["NameGetReq1"]["properties"]) == ["first"]
+        assert "NameGetReq3" not in components
+
+    def test_req_schema_explicit_name_reused(self, api: SpanAPI):
+        @api.route("/route")
+        class Route(SpanRoute):
+            @api.use_schema(req=NameSchema())
+            def on_get(self, req: Request, resp: Response):
+                pass
+
+        @api.route("/route/second")
+        class Route(SpanRoute):
+            @api.use_schema(req=NameSchema(), req_name="HumanName")
+            def on_get(self, req: Request, resp: Response):
+                pass
+
+        @api.route("/route/third")
+        class Route(SpanRoute):
+            @api.use_schema(req=NameSchema(), req_name="HumanName")
+            def on_get(self, req: Request, resp: Response):
+                pass
+
+        spec = yaml.safe_load(get_spec(api))
+
+        schema_1 = get_route_req_schema(load_route(spec))
+        schema_2 = get_route_req_schema(load_route(spec, route="/route/second"))
+        schema_3 = get_route_req_schema(load_route(spec, route="/route/third"))
+
+        assert "NameGetReq1" in schema_1["$ref"]
+        assert "HumanName" in schema_2["$ref"]
+        assert "HumanName" in schema_3["$ref"]
+
+    def test_explicit_name_conflict(self, api: SpanAPI):
+        @api.route("/route")
+        class Route(SpanRoute):
+            @api.use_schema(req=NameSchema(), req_name="HumanName")
+            def on_get(self, req: Request, resp: Response):
+                pass
+
+        with pytest.raises(AssertionError):
+
+            @api.route("/route/second")
+            class Route(SpanRoute):
+                @api.use_schema(req=NameSchema(many=True), req_name="HumanName")
+                def on_get(self, req: Request, resp: Response):
+                    pass
+
     def test_resp_schema(self, api: SpanAPI):
         @api.route("/route")
         class Route(SpanRoute):
@@ -858,3 +936,105 @@ class TestSaveFiles:
 
         assert openapi_save_path.exists()
         assert redoc_save_path.exists()
+
+
+class TestSpecCache:
+    def test_spec_rendered_once(self, api: SpanAPI):
+        @api.route("/route")
+        class Route(SpanRoute):
+            @api.use_schema(resp=NameSchema())
+            async def on_get(self, req: Request, resp: Response):
+                """Fetch a name."""
+                resp.media = Name()
+
+        first = api.openapi.rendered
+        assert api.openapi.rendered is first
+        assert api.openapi.openapi == first.yaml_text
+
+    def test_invalidated_on_route(self, api: SpanAPI):
+        @api.route("/route")
+        class Route(SpanRoute):
+            @api.use_schema(resp=NameSchema())
+            async def on_get(self, req: Request, resp: Response):
+                """Fetch a name."""
+                resp.media = Name()
+
+        first = api.openapi.rendered
+
+        @api.route("/second")
+        class Second(SpanRoute):
+            @api.use_schema(resp=NameSchema())
+            async def on_get(self, req: Request, resp: Response):
+                """Fetch a name."""
+                resp.media = Name()
+
+        second = api.openapi.rendered
+
+        assert second is not first
+        assert "/second" in second.yaml_text
+        assert second.yaml.etag != first.yaml.etag
+
+    def test_invalidated_on_schema_and_tag(self, api: SpanAPI):
+        first = api.openapi.rendered
+
+        api.openapi.add_schema("Other", NameSchema())
+        second = api.openapi.rendered
+        assert second is not first
+        assert "Other" in second.yaml_text
+
+        api.openapi.add_tag({"name": "Extra", "description": "Extra tag."})
+        third = api.openapi.rendered
+        assert third is not second
+        assert "Extra tag." in third.yaml_text
+
+    def test_serve_yaml_etag(self, api: SpanAPI):
+        @api.route("/route")
+        class Route(SpanRoute):
+            @api.use_schema(resp=NameSchema())
+            async def on_get(self, req: Request, resp: Response):
+                """Fetch a name."""
+                resp.media = Name()
+
+        r = api.requests.get("/schema.yml")
+        assert r.status_code == 200
+        assert r.headers["Content-Type"] == "application/x-yaml"
+        assert yaml.safe_load(r.content)["paths"]["/route"]
+
+        etag = r.headers["ETag"]
+        r = api.requests.get("/schema.yml", headers={"If-None-Match": etag})
+        assert r.status_code == 304
+        assert r.content == b""
+
+    def test_serve_json(self, api: SpanAPI):
+        @api.route("/route")
+        class Route(SpanRoute):
+            @api.use_schema(resp=NameSchema())
+            async def on_get(self, req: Request, resp: Response):
+                """Fetch a name."""
+                resp.media = Name()
+
+        r = api.requests.get("/schema.yml", headers={"Accept": "application/json"})
+        assert r.status_code == 200
+        assert r.headers["Content-Type"] == "application/json"
+        assert r.json()["paths"]["/route"]["get"]["summary"] == "Fetch a name."
+
+        yaml_r = api.requests.get("/schema.yml")
+        assert r.headers["ETag"] != yaml_r.headers["ETag"]
+
+    def test_serve_gzip(self):
+        api = SpanAPI(openapi="3.0.0", openapi_gzip=True)
+
+        @api.route("/route")
+        class Route(SpanRoute):
+            @api.use_schema(resp=NameSchema())
+            async def on_get(self, req: Request, resp: Response):
+                """Fetch a name."""
+                resp.media = Name()
+
+        r = api.requests.get("/schema.yml", headers={"Accept-Encoding": "gzip"})
+        assert r.status_code == 200
+        assert r.headers["Content-Encoding"] == "gzip"
+        assert r.headers["ETag"].endswith('-gzip"')
+        # requests decompresses transparently, so this also checks that the body is
+        # not compressed a second time by the gzip middleware.
+        assert yaml.safe_load(r.content)["paths"]["/route"]
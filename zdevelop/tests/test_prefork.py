@@ -0,0 +1,122 @@
+import gc
+import json
+import logging
+import os
+import sys
+import time
+import urllib.request
+import pytest
+from pathlib import Path
+
+from spanserver import (
+    SpanAPI,
+    SpanRoute,
+    Request,
+    Response,
+    PreforkServer,
+    SlowRequestPolicy,
+)
+
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, "fork") or sys.platform == "darwin",
+    reason="prefork server requires os.fork and /proc",
+)
+
+
+def get_pid(server: PreforkServer) -> int:
+    url = f"http://127.0.0.1:{server.bound_port}/pid"
+    with urllib.request.urlopen(url, timeout=5) as r:
+        return json.loads(r.read())["pid"]
+
+
+@pytest.fixture
+def server():
+    api = SpanAPI(openapi="3.0.0")
+
+    @api.route("/pid")
+    class Pid(SpanRoute):
+        async def on_get(self, req: Request, resp: Response):
+            resp.media = {"pid": os.getpid()}
+
+    server = PreforkServer(
+        api, workers=2, port=0, loop="asyncio", http="h11", log_level="warning"
+    )
+    server.start()
+    try:
+        yield server
+    finally:
+        server.stop()
+
+
+class TestPreforkServer:
+    def test_serves_from_workers(self, server: PreforkServer):
+        assert len(server.pids) == 2
+        assert get_pid(server) in server.pids
+
+    def test_warmed_up_in_parent(self, server: PreforkServer):
+        assert server.api.frozen
+        assert server.api.openapi._rendered is not None
+        if hasattr(gc, "get_freeze_count"):
+            assert gc.get_freeze_count() > 0
+        assert server.startup_time is not None
+
+    def test_stats(self, server: PreforkServer):
+        stats = server.stats()
+        assert [s.pid for s in stats] == server.pids
+        for worker in stats:
+            assert worker.rss is not None and worker.rss > 0
+
+    def test_restart(self, server: PreforkServer):
+        old_pids = server.pids
+        server.restart()
+
+        assert len(server.pids) == 2
+        assert not set(old_pids) & set(server.pids)
+        assert get_pid(server) in server.pids
+
+    def test_replace_dead_worker(self, server: PreforkServer):
+        dead = server.pids[0]
+        os.kill(dead, 9)
+        os.waitpid(dead, 0)
+
+        server._replace_dead_workers()
+
+        assert dead not in server.pids
+        assert len(server.pids) == 2
+        assert get_pid(server) in server.pids
+
+    def test_log_sinks_reset_in_workers(self, tmp_path: Path):
+        log_path = tmp_path / "slow.log"
+        handler = logging.FileHandler(str(log_path))
+        api = SpanAPI(slow_requests=SlowRequestPolicy(threshold=0, handlers=[handler]))
+
+        @api.route("/pid")
+        class Pid(SpanRoute):
+            async def on_get(self, req: Request, resp: Response):
+                resp.media = {"pid": os.getpid()}
+
+        # Workers inherit running listeners, whose threads do not survive the fork.
+        assert api.slow_log is not None
+        api.error_log.sink.start()
+        api.slow_log.sink.start()
+
+        server = PreforkServer(
+            api, workers=1, port=0, loop="asyncio", http="h11", log_level="warning"
+        )
+        server.start()
+        try:
+            get_pid(server)
+
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                if log_path.exists() and log_path.read_text():
+                    break
+                time.sleep(0.05)
+        finally:
+            server.stop()
+            api.slow_log.sink.stop()
+            api.error_log.sink.stop()
+            handler.close()
+
+        assert "/pid" in log_path.read_text()
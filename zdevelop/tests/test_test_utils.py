@@ -1,4 +1,5 @@
 import pytest
+import asyncio
 import json
 import dataclasses
 import uuid
@@ -6,7 +7,8 @@ import grahamcracker
 from typing import List
 
 from requests import Response
-from spanserver import test_utils, MimeType
+from spanserver import test_utils, MimeType, SpanAPI, SpanRoute, Request, Lifespan
+from spanserver import Response as SpanResponse
 
 from spantools import errors_api, PagingResp, DEFAULT_ENCODERS
 
@@ -372,3 +374,220 @@ class TestPrintedInfo:
 
         assert "CONTENT:" in captured.out
         assert str(bytes(10)) in captured.out
+
+
+@pytest.fixture
+def large_response() -> Response:
+    r = Response()
+    r.status_code = 200
+    r._content = json.dumps({"items": list(range(1000))}).encode()
+    return r
+
+
+class TestResponseOutput:
+    def test_quiet_pass(self, large_response: Response, capsys):
+        output = test_utils.ResponseOutput(quiet=True)
+        test_utils.validate_response(large_response, output=output)
+
+        assert capsys.readouterr().out == ""
+
+    def test_quiet_fail(self, large_response: Response, capsys):
+        output = test_utils.ResponseOutput(quiet=True)
+        with pytest.raises(test_utils.StatusMismatchError):
+            test_utils.validate_response(
+                large_response, valid_status_codes=201, output=output
+            )
+
+        captured = capsys.readouterr()
+        assert captured.out.startswith("RESPONSE: <Response [200]>\n")
+        assert "JSON:" in captured.out
+
+    def test_quiet_validate_error(self, capsys):
+        output = test_utils.ResponseOutput(quiet=True)
+        r = Response()
+        r.status_code = 400
+        r.headers["error-name"] = "InvalidMethodError"
+
+        with pytest.raises(test_utils.NoErrorReturnedError):
+            test_utils.validate_error(r, errors_api.InvalidMethodError, output=output)
+
+        assert "RESPONSE: <Response [400]>" in capsys.readouterr().out
+
+    def test_max_chars(self, large_response: Response, capsys):
+        output = test_utils.ResponseOutput(max_chars=100)
+        test_utils.validate_response(large_response, output=output)
+
+        body = json.dumps(large_response.json(), indent=4)
+        captured = capsys.readouterr()
+        assert body[:100] in captured.out
+        assert body[:101] not in captured.out
+        assert f"... {len(body) - 100} more characters" in captured.out
+
+    def test_max_chars_content(self, capsys):
+        output = test_utils.ResponseOutput(max_chars=20)
+        r = Response()
+        r.status_code = 200
+        r._content = bytes(1000)
+        test_utils.validate_response(r, output=output)
+
+        content = str(bytes(1000))
+        captured = capsys.readouterr()
+        assert "CONTENT:" in captured.out
+        assert f"{content[:20]}\n... {len(content) - 20} more characters" in (
+            captured.out
+        )
+
+    def test_default(self, large_response: Response, capsys):
+        previous = test_utils.set_response_output(test_utils.ResponseOutput(quiet=True))
+        try:
+            test_utils.validate_response(large_response)
+        finally:
+            test_utils.set_response_output(previous)
+
+        assert capsys.readouterr().out == ""
+
+        test_utils.validate_response(large_response)
+        assert capsys.readouterr().out.startswith("RESPONSE:")
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+@pytest.fixture
+def client_api() -> SpanAPI:
+    api = SpanAPI(openapi="3.0.0")
+
+    @api.route("/names/{name_id}")
+    class Names(SpanRoute):
+        @api.use_schema(req=NameSchema(), resp=NameSchema())
+        async def on_post(self, req: Request, resp: SpanResponse, *, name_id: int):
+            name = await req.media_loaded()
+            if name_id == 0:
+                raise errors_api.NothingToReturnError("no name 0")
+            resp.media = Name(first=name.first, last=f"{name.last}-{name_id}")
+
+    @api.route("/echo")
+    def echo(req: Request, resp: SpanResponse):
+        resp.media = {
+            "a": req.params.get("a"),
+            "header": req.headers.get("x-test"),
+            "host": req.headers.get("host"),
+        }
+
+    @api.route("/crash")
+    def crash(req: Request, resp: SpanResponse):
+        raise ValueError("crash")
+
+    return api
+
+
+class TestAsyncClient:
+    def test_validate(self, client_api: SpanAPI):
+        async def main():
+            async with test_utils.AsyncClient(client_api) as client:
+                ok = await client.post(
+                    "/names/2", json={"first": "Obi-Wan", "last": "Kenobi"}
+                )
+                missing = await client.post(
+                    "/names/0", json={"first": "Obi-Wan", "last": "Kenobi"}
+                )
+            return ok, missing
+
+        ok, missing = run(main())
+
+        name = test_utils.validate_response(ok, data_schema=NameSchema())
+        assert name == Name(first="Obi-Wan", last="Kenobi-2")
+        test_utils.validate_error(missing, errors_api.NothingToReturnError)
+
+    def test_request_parts(self, client_api: SpanAPI):
+
+        r = run(
+            test_utils.AsyncClient(client_api).get(
+                "/echo", params={"a": "1"}, headers={"x-test": "value"}
+            )
+        )
+
+        test_utils.validate_response(r)
+        assert r.json() == {"a": "1", "header": "value", "host": "testserver"}
+
+    def test_concurrent(self):
+        api = SpanAPI(openapi="3.0.0")
+        count = 20
+        waiting: List[int] = list()
+        all_waiting = asyncio.Event()
+
+        @api.route("/wait/{index}")
+        class Wait(SpanRoute):
+            async def on_get(self, req: Request, resp: SpanResponse, *, index: int):
+                waiting.append(index)
+                if len(waiting) == count:
+                    all_waiting.set()
+                # Only finishes if every request is in flight at once.
+                await asyncio.wait_for(all_waiting.wait(), 1.0)
+                resp.media = {"index": index}
+
+        async def main():
+            client = test_utils.AsyncClient(api)
+            return await asyncio.gather(
+                *(client.get(f"/wait/{index}") for index in range(count))
+            )
+
+        responses = run(main())
+
+        for index, r in enumerate(responses):
+            test_utils.validate_response(r)
+            assert r.json() == {"index": index}
+
+    def test_lifespan(self, client_api: SpanAPI):
+        events: List[str] = list()
+        client_api.add_event_handler("startup", lambda: events.append("startup"))
+        client_api.add_event_handler("shutdown", lambda: events.append("shutdown"))
+
+        async def main():
+            async with test_utils.AsyncClient(client_api):
+                assert events == ["startup"]
+
+        run(main())
+        assert events == ["startup", "shutdown"]
+
+    def test_lifespan_without_client(self, client_api: SpanAPI):
+        events: List[str] = list()
+        client_api.add_event_handler("startup", lambda: events.append("startup"))
+        client_api.add_event_handler("shutdown", lambda: events.append("shutdown"))
+
+        async def main():
+            lifespan = Lifespan(client_api)
+            await lifespan.shutdown()
+            async with lifespan:
+                assert events == ["startup"]
+
+        run(main())
+        assert events == ["startup", "shutdown"]
+
+    def test_startup_failed(self, client_api: SpanAPI):
+        def fail():
+            raise ValueError("no database")
+
+        client_api.add_event_handler("startup", fail)
+
+        with pytest.raises(RuntimeError, match="no database"):
+            run(test_utils.AsyncClient(client_api).startup())
+
+    def test_server_exceptions(self, client_api: SpanAPI):
+
+        with pytest.raises(ValueError):
+            run(test_utils.AsyncClient(client_api).get("/crash"))
+
+        client = test_utils.AsyncClient(client_api, raise_server_exceptions=False)
+        r = run(client.get("/crash"))
+        with pytest.raises(test_utils.StatusMismatchError):
+            test_utils.validate_response(r)
+        assert r.status_code == 500
+
+    def test_head(self, client_api: SpanAPI):
+
+        r = run(test_utils.AsyncClient(client_api).head("/echo"))
+
+        assert r.status_code == 200
+        assert r.content == b""